@@ -0,0 +1,98 @@
+"""Benchmark length-bucketed, token-budget batching against fixed-size batches.
+
+Runs a realistic chat length distribution through ``plan_batches`` and
+reports padded tokens and estimated encoder FLOPs for the production model
+sizes, then times ``SequenceClassifier.predict`` on a stub model under both
+strategies.
+
+    python -m benchmarks.bench_bucketing [--messages 2000] [--output results.json]
+"""
+import argparse
+import json
+import time
+
+from benchmarks.stub_models import build_emotion_model, build_tokenizer, chat_messages
+from src.inference import SequenceClassifier, plan_batches
+
+# (layers, hidden size) of the production models
+MODEL_SHAPES = {
+    "distilroberta-base (emotion)": (6, 768),
+    "bert-base (toxicity)": (12, 768),
+}
+
+def encoder_flops(batches, lengths, layers: int, hidden: int) -> float:
+    """Approximate forward FLOPs: dense layers scale with tokens, attention with length squared"""
+    total = 0.0
+    for batch in batches:
+        padded = max(lengths[i] for i in batch)
+        tokens = padded * len(batch)
+        total += layers * (24 * hidden * hidden * tokens + 4 * hidden * padded * tokens)
+    return total
+
+def padded_tokens(batches, lengths) -> int:
+    return sum(max(lengths[i] for i in batch) * len(batch) for batch in batches)
+
+def time_predict(classifier: SequenceClassifier, texts, repeats: int) -> float:
+    classifier.predict(texts[:32])  # Warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        classifier.predict(texts)
+    return (time.perf_counter() - start) / repeats * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--fixed-batch-size", type=int, default=8, help="Items per batch for the baseline")
+    parser.add_argument("--max-batch-tokens", type=int, default=4096)
+    parser.add_argument("--max-batch-items", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    tokenizer = build_tokenizer()
+    texts = chat_messages(args.messages)
+    lengths = [len(ids) for ids in tokenizer(texts, truncation=True, max_length=512)["input_ids"]]
+
+    strategies = {
+        "fixed": plan_batches(lengths, max_tokens=10**9, max_items=args.fixed_batch_size, sort=False),
+        "bucketed": plan_batches(lengths, max_tokens=args.max_batch_tokens, max_items=args.max_batch_items),
+    }
+
+    results = {"messages": len(texts), "real_tokens": sum(lengths), "strategies": {}}
+    for name, batches in strategies.items():
+        results["strategies"][name] = {
+            "batches": len(batches),
+            "padded_tokens": padded_tokens(batches, lengths),
+            "gflops": {
+                model: round(encoder_flops(batches, lengths, *shape) / 1e9, 1)
+                for model, shape in MODEL_SHAPES.items()
+            },
+        }
+
+    # Wall-clock on a small stub model (hidden 256, 4 layers)
+    model = build_emotion_model(hidden_size=256, layers=4)
+    fixed = SequenceClassifier(model, tokenizer, batch_size=args.fixed_batch_size, max_batch_tokens=10**9)
+    fixed.length_bucketing = False
+    bucketed = SequenceClassifier(
+        model, tokenizer, batch_size=args.max_batch_items, max_batch_tokens=args.max_batch_tokens
+    )
+    results["strategies"]["fixed"]["stub_latency_ms"] = round(time_predict(fixed, texts, args.repeats), 1)
+    results["strategies"]["bucketed"]["stub_latency_ms"] = round(time_predict(bucketed, texts, args.repeats), 1)
+
+    fixed_stats, bucketed_stats = results["strategies"]["fixed"], results["strategies"]["bucketed"]
+    results["padded_token_reduction"] = round(1 - bucketed_stats["padded_tokens"] / fixed_stats["padded_tokens"], 3)
+    results["latency_speedup"] = round(fixed_stats["stub_latency_ms"] / bucketed_stats["stub_latency_ms"], 2)
+
+    print(f"{len(texts)} messages, {results['real_tokens']} real tokens")
+    for name, stats in results["strategies"].items():
+        flops = ", ".join(f"{model}: {gflops} GFLOP" for model, gflops in stats["gflops"].items())
+        print(f"  {name:9s} {stats['batches']:5d} batches  {stats['padded_tokens']:8d} padded tokens  "
+              f"{stats['stub_latency_ms']:8.1f} ms  ({flops})")
+    print(f"Padded tokens -{results['padded_token_reduction']:.0%}, stub latency x{results['latency_speedup']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
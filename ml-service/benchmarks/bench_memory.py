@@ -0,0 +1,59 @@
+"""Benchmark memory and throughput of the fp32, int8 and half-precision backends.
+
+Builds the stub emotion model once per backend and reports the bytes held
+by its weights, the peak activation memory of one forward batch filling
+``--max-batch-tokens`` (what ``/models/info`` reports after warmup) and
+the messages per second on a fixed set of chat messages.
+
+    python -m benchmarks.bench_memory [--messages 2000] [--output results.json]
+"""
+import argparse
+import json
+import time
+
+from benchmarks.stub_models import build_emotion_model, build_tokenizer, chat_messages
+from src.inference import SequenceClassifier
+
+BACKENDS = ("torch", "torch-int8", "torch-bf16", "torch-fp16")
+
+def measure(backend: str, texts, hidden_size: int, layers: int, max_batch_tokens: int) -> dict:
+    classifier = SequenceClassifier(
+        build_emotion_model(hidden_size, layers), build_tokenizer(),
+        max_batch_tokens=max_batch_tokens, backend=backend, name=f"bench-{backend}"
+    )
+    classifier.measure_activation_memory()
+    classifier.predict(texts[:32])  # Warm up
+
+    started = time.perf_counter()
+    classifier.predict(texts)
+    elapsed = time.perf_counter() - started
+
+    return {**classifier.memory_stats(), "messages_per_second": round(len(texts) / elapsed, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--max-batch-tokens", type=int, default=4096)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    texts = chat_messages(args.messages)
+    results = {"messages": len(texts), "max_batch_tokens": args.max_batch_tokens, "backends": {}}
+    for backend in BACKENDS:
+        results["backends"][backend] = measure(backend, texts, args.hidden_size, args.layers, args.max_batch_tokens)
+
+    print(f"{len(texts)} messages, MAX_BATCH_TOKENS={args.max_batch_tokens}")
+    for backend, stats in results["backends"].items():
+        served = f" (served as {stats['backend']})" if stats["backend"] != backend else ""
+        print(f"  {backend:11s} weights {stats['parameter_bytes'] / 2**20:7.1f} MiB  "
+              f"activations {stats['peak_activation_bytes'] / 2**20:7.1f} MiB  "
+              f"{stats['messages_per_second']:8.1f} msg/s{served}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
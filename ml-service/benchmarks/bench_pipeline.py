@@ -0,0 +1,112 @@
+"""Benchmark sustained throughput with and without the staged inference pipeline.
+
+Builds both analyzers on stub models and keeps them saturated with
+``--clients`` concurrent callers, each sending ``--batch`` chat messages
+at a time through ``analyze_texts`` (the path ``/batch-analyze`` uses),
+once with ``INFERENCE_PIPELINE=False`` (tokenize, forward and
+post-process run back to back on the model thread) and once with it on.
+Caching and near-duplicate reuse are off so every message reaches the
+models. The mean batch size handed to the models is reported too: the
+pipeline should overlap stages, not change how batches form under load.
+
+    python -m benchmarks.bench_pipeline [--messages 4000] [--output results.json]
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import time
+
+from benchmarks.stub_models import build_abuse_model, build_emotion_model, build_tokenizer, chat_messages
+
+async def run_load(pipelined: bool, texts, clients: int, batch: int, hidden_size: int, layers: int) -> dict:
+    """Messages per second with every client keeping a batch in flight"""
+    os.environ["INFERENCE_PIPELINE"] = str(pipelined)
+
+    from src.admission import BULK, request_class
+    from src.analyzer import AbuseDetector, EmotionAnalyzer, analyze_texts
+    from src.inference import SequenceClassifier
+    from src.rollout import LoadedModel
+
+    emotion, abuse = EmotionAnalyzer(), AbuseDetector()
+    for analyzer, model, key in (
+        (emotion, build_emotion_model(hidden_size, layers), "EMOTION"),
+        (abuse, build_abuse_model(hidden_size, layers), "ABUSE"),
+    ):
+        tokenizer = build_tokenizer()
+        classifier = SequenceClassifier(model, tokenizer, name=f"bench-{key.lower()}")
+        analyzer.install_model(LoadedModel("stub", model, tokenizer, "bench", classifier, copy.deepcopy(tokenizer)))
+        analyzer.cascade = None
+
+    chunks = [texts[i:i + batch] for i in range(0, len(texts), batch)]
+    pending = iter(chunks)
+
+    async def client():
+        with request_class(BULK):
+            for chunk in pending:
+                await analyze_texts(emotion, abuse, chunk)
+
+    await analyze_texts(emotion, abuse, chunks[0])  # Warm up
+    batched_before = call_batches()
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    items, calls = (after - before for after, before in zip(call_batches(), batched_before))
+
+    return {
+        "seconds": round(elapsed, 2),
+        "messages_per_second": round(len(texts) / elapsed, 1),
+        "mean_batch_size": round(items / calls, 1) if calls else None
+    }
+
+def call_batches():
+    """Items and batches handed to the models so far, over both analyzers"""
+    from src.metrics import BATCH_SIZE
+
+    totals = {"_sum": 0.0, "_count": 0.0}
+    for metric in BATCH_SIZE.collect():
+        for sample in metric.samples:
+            suffix = sample.name[len(metric.name):]
+            if sample.labels.get("stage") == "call" and suffix in totals:
+                totals[suffix] += sample.value
+    return totals["_sum"], totals["_count"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=4000)
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent callers")
+    parser.add_argument("--batch", type=int, default=32, help="Messages per call")
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    # Every message has to reach the models
+    os.environ["RESULT_CACHE_ENABLED"] = "False"
+    os.environ["NEAR_DUP_ENABLED"] = "False"
+    os.environ["CASCADE_MODEL_PATH"] = ""
+    os.environ.setdefault("MAX_QUEUE_DEPTH", str(args.clients * args.batch * 4))
+
+    texts = chat_messages(args.messages)
+    results = {"messages": len(texts), "clients": args.clients, "batch": args.batch, "modes": {}}
+    for name, pipelined in (("sequential", False), ("pipelined", True)):
+        results["modes"][name] = asyncio.run(
+            run_load(pipelined, texts, args.clients, args.batch, args.hidden_size, args.layers)
+        )
+
+    sequential, pipelined = results["modes"]["sequential"], results["modes"]["pipelined"]
+    results["speedup"] = round(pipelined["messages_per_second"] / sequential["messages_per_second"], 2)
+
+    print(f"{len(texts)} messages, {args.clients} clients x {args.batch} messages per call")
+    for name, stats in results["modes"].items():
+        print(f"  {name:10s} {stats['messages_per_second']:8.1f} msg/s  ({stats['seconds']} s)  "
+              f"mean batch {stats['mean_batch_size']}")
+    print(f"Pipelined throughput x{results['speedup']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark batch response encodings against validating through the pydantic model.
+
+Builds a batch of realistic analysis results and times the old path
+(``BatchAnalysisResponse(...).model_dump_json()``) against every encoding
+``/batch-analyze`` can negotiate, reporting time per response and size.
+
+    python -m benchmarks.bench_serialization [--results 100] [--output results.json]
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+
+from src.models import BatchAnalysisResponse
+from src.serialization import available_media_types, encode
+
+EMOTIONS = ["anger", "disgust", "fear", "joy", "neutral", "sadness", "surprise"]
+
+def build_results(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    results = []
+    for _ in range(count):
+        emotions = rng.sample(EMOTIONS, 4)
+        results.append({
+            "abuse_detected": rng.random() < 0.1,
+            "abuse_type": rng.choice(["none", "harassment", "spam"]),
+            "confidence_score": round(rng.uniform(0, 100), 2),
+            "emotion": emotions[0],
+            "emotion_intensity": round(rng.uniform(30, 100), 2),
+            "secondary_emotions": [
+                {"emotion": emotion, "intensity": round(rng.uniform(10, 30), 2)}
+                for emotion in emotions[1:rng.randint(1, 4)]
+            ]
+        })
+    return results
+
+def time_call(call, repeats: int) -> float:
+    call()  # Warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        call()
+    return (time.perf_counter() - start) / repeats * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--results", type=int, default=100, help="Results per batch response")
+    parser.add_argument("--repeats", type=int, default=2000)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    document = {
+        "results": build_results(args.results),
+        "total_processed": args.results,
+        "processing_time_ms": 12.34,
+        "timestamp": datetime.utcnow()
+    }
+
+    encoders = {"pydantic (validate + model_dump_json)": lambda: BatchAnalysisResponse(**document).model_dump_json()}
+    for media_type in available_media_types():
+        encoders[media_type] = lambda media_type=media_type: encode(document, media_type)
+
+    results = {"results_per_response": args.results, "encodings": {}}
+    for name, call in encoders.items():
+        results["encodings"][name] = {
+            "ms": round(time_call(call, args.repeats), 4),
+            "bytes": len(call())
+        }
+
+    baseline = results["encodings"]["pydantic (validate + model_dump_json)"]
+    print(f"{args.results} results per response")
+    for name, stats in results["encodings"].items():
+        print(f"  {name:42s} {stats['ms']:8.4f} ms  x{baseline['ms'] / stats['ms']:5.1f}  "
+              f"{stats['bytes']:7d} bytes ({stats['bytes'] / baseline['bytes']:.0%})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""End-to-end latency, throughput and memory benchmark of the HTTP service.
+
+Saves the stub models to a temporary directory, points
+``EMOTION_MODEL_NAME``/``ABUSE_MODEL_NAME`` at them and starts the real app
+under uvicorn, so no network access is needed. Then measures:
+
+- single-request ``/analyze`` latency percentiles
+- ``/batch-analyze`` throughput
+- ``/analyze`` throughput and latency as client concurrency grows
+- peak RSS of the server process, and with ``--workers`` the memory of
+  the whole gunicorn process tree (PSS counts shared pages once)
+
+The result cache is disabled and every request uses a distinct message,
+so the numbers reflect the hot path rather than cache hits.
+
+    python -m benchmarks.bench_service [--output results.json] [--baseline old.json]
+
+With ``--baseline``, throughput or latency regressions beyond
+``--tolerance`` are listed and the command exits non-zero.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmarks.stub_models import chat_messages, save_stub_models
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentiles(latencies_ms: List[float]) -> Dict[str, float]:
+    """Summary statistics of a latency sample, in milliseconds"""
+    values = np.array(latencies_ms)
+    return {
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p90": round(float(np.percentile(values, 90)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """Peak resident set size of a process (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+def process_tree(pid: int) -> List[int]:
+    """A process and all its descendants (Linux only)"""
+    pids = [pid]
+    for child_pid in pids:
+        try:
+            for task in os.listdir(f"/proc/{child_pid}/task"):
+                with open(f"/proc/{child_pid}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+def tree_memory_mb(pid: int) -> Optional[Dict[str, float]]:
+    """Total RSS, PSS and private (USS) memory of a process tree"""
+    totals = {"rss": 0, "pss": 0, "private": 0}
+    try:
+        for tree_pid in process_tree(pid):
+            with open(f"/proc/{tree_pid}/smaps_rollup") as f:
+                for line in f:
+                    field, value = line.split(":", 1)
+                    kb = int(value.split()[0]) if value.split() and value.split()[0].isdigit() else 0
+                    if field == "Rss":
+                        totals["rss"] += kb
+                    elif field == "Pss":
+                        totals["pss"] += kb
+                    elif field in ("Private_Clean", "Private_Dirty"):
+                        totals["private"] += kb
+    except OSError:
+        return None
+    return {name: round(kb / 1024, 1) for name, kb in totals.items()}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(
+    model_dir: str, port: int, env_overrides: Dict[str, str], hidden_size: int, layers: int, workers: int
+) -> subprocess.Popen:
+    """Run the service with the stub models: uvicorn, or gunicorn with several workers"""
+    emotion_path, abuse_path = save_stub_models(model_dir, hidden_size, layers)
+    env = dict(
+        os.environ,
+        EMOTION_MODEL_NAME=emotion_path,
+        ABUSE_MODEL_NAME=abuse_path,
+        RESULT_CACHE_ENABLED="False",
+        LOG_LEVEL="WARNING",
+        **env_overrides,
+    )
+    if workers > 1:
+        env.update(NUM_WORKERS=str(workers), HOST="127.0.0.1", PORT=str(port))
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "src.main:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=SERVICE_DIR, env=env)
+
+async def wait_until_up(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 120):
+    """Wait until /ready reports the models loaded and warmed up"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            response = await client.get("/ready")
+            if response.status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("Server did not become ready in time")
+
+async def measure_latency(client: httpx.AsyncClient, texts: List[str]) -> Dict:
+    """One request at a time"""
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        response = await client.post("/analyze", json={"text": text})
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return {"requests": len(texts), "latency_ms": percentiles(latencies)}
+
+async def measure_batch_throughput(client: httpx.AsyncClient, texts: List[str], batch_size: int) -> Dict:
+    """Sequential /batch-analyze calls of ``batch_size`` texts"""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    latencies = []
+    start = time.perf_counter()
+    for batch in batches:
+        request_start = time.perf_counter()
+        response = await client.post("/batch-analyze", json={"texts": batch})
+        latencies.append((time.perf_counter() - request_start) * 1000)
+        response.raise_for_status()
+    elapsed = time.perf_counter() - start
+    return {
+        "batch_size": batch_size,
+        "requests": len(batches),
+        "texts_per_second": round(len(texts) / elapsed, 1),
+        "latency_ms": percentiles(latencies),
+    }
+
+async def measure_concurrency(client: httpx.AsyncClient, texts: List[str], concurrency: int) -> Dict:
+    """``concurrency`` clients sending /analyze requests back to back"""
+    queue = iter(texts)
+    latencies = []
+
+    async def worker():
+        for text in queue:
+            start = time.perf_counter()
+            response = await client.post("/analyze", json={"text": text})
+            latencies.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": len(texts),
+        "requests_per_second": round(len(texts) / elapsed, 1),
+        "latency_ms": percentiles(latencies),
+    }
+
+async def run_benchmarks(args, port: int, server: subprocess.Popen) -> Dict:
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 4)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=120) as client:
+        await wait_until_up(client, server)
+
+        # Distinct messages throughout so nothing is served from a cache
+        texts = iter(chat_messages(args.requests * (len(args.concurrency) + 1) + args.batch_texts, seed=args.seed))
+        numbers = itertools.count()
+        take = lambda n: [f"{next(numbers)} {next(texts)}" for _ in range(n)]
+
+        results = {"single_request": await measure_latency(client, take(args.requests))}
+        results["batch"] = await measure_batch_throughput(client, take(args.batch_texts), args.batch_size)
+        results["concurrency"] = [
+            await measure_concurrency(client, take(args.requests), concurrency) for concurrency in args.concurrency
+        ]
+        return results
+
+def environment() -> Dict:
+    """Where and on what the numbers were measured"""
+    import torch
+    import transformers
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+    }
+
+def find_regressions(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Metrics that got worse than the baseline by more than ``tolerance``"""
+    checks = [
+        ("single_request p50 latency", results["single_request"]["latency_ms"]["p50"],
+         baseline["single_request"]["latency_ms"]["p50"], False),
+        ("single_request p99 latency", results["single_request"]["latency_ms"]["p99"],
+         baseline["single_request"]["latency_ms"]["p99"], False),
+        ("batch throughput", results["batch"]["texts_per_second"], baseline["batch"]["texts_per_second"], True),
+    ]
+    baseline_concurrency = {run["concurrency"]: run for run in baseline.get("concurrency", [])}
+    for run in results["concurrency"]:
+        old = baseline_concurrency.get(run["concurrency"])
+        if old:
+            checks.append((f"throughput at concurrency {run['concurrency']}",
+                           run["requests_per_second"], old["requests_per_second"], True))
+    if results.get("peak_rss_mb") and baseline.get("peak_rss_mb"):
+        checks.append(("peak RSS", results["peak_rss_mb"], baseline["peak_rss_mb"], False))
+    if results.get("process_tree_mb") and baseline.get("process_tree_mb"):
+        checks.append(("process tree PSS", results["process_tree_mb"]["pss"], baseline["process_tree_mb"]["pss"], False))
+
+    regressions = []
+    for name, value, old, higher_is_better in checks:
+        change = (value - old) / old if old else 0.0
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{name}: {old} -> {value} ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per latency/concurrency run")
+    parser.add_argument("--batch-texts", type=int, default=1000, help="Texts sent through /batch-analyze")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--hidden-size", type=int, default=64, help="Stub model width")
+    parser.add_argument("--layers", type=int, default=2, help="Stub model depth")
+    parser.add_argument("--workers", type=int, default=1, help="Server processes; more than one runs gunicorn.conf.py")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra environment for the server, e.g. --env INFERENCE_BACKEND=onnx")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default: 0.2)")
+    args = parser.parse_args()
+
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+    port = free_port()
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        server = start_server(model_dir, port, env_overrides, args.hidden_size, args.layers, args.workers)
+        try:
+            results = asyncio.run(run_benchmarks(args, port, server))
+            results["peak_rss_mb"] = peak_rss_mb(server.pid)
+            if args.workers > 1:
+                results["process_tree_mb"] = tree_memory_mb(server.pid)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    results = {
+        "environment": environment(),
+        "server_env": env_overrides,
+        "stub_model": {"hidden_size": args.hidden_size, "layers": args.layers},
+        "workers": args.workers,
+        **results,
+    }
+
+    single = results["single_request"]["latency_ms"]
+    print(f"/analyze latency: p50 {single['p50']} ms, p90 {single['p90']} ms, p99 {single['p99']} ms")
+    print(f"/batch-analyze: {results['batch']['texts_per_second']} texts/s (batches of {args.batch_size})")
+    for run in results["concurrency"]:
+        print(f"  concurrency {run['concurrency']:3d}: {run['requests_per_second']:8.1f} req/s, "
+              f"p50 {run['latency_ms']['p50']} ms, p99 {run['latency_ms']['p99']} ms")
+    print(f"Peak server RSS: {results['peak_rss_mb']} MB")
+    if results.get("process_tree_mb"):
+        memory = results["process_tree_mb"]
+        print(f"{args.workers} workers: RSS {memory['rss']} MB, PSS {memory['pss']} MB, private {memory['private']} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
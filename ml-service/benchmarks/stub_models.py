@@ -0,0 +1,116 @@
+"""Tiny, randomly initialized stand-ins for the service's models.
+
+The stubs use the same architectures and label sets as the production
+models but with small dimensions and a word-level tokenizer, so they
+build in a second without network access.
+"""
+import os
+import random
+from typing import List, Tuple
+
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, processors
+from transformers import (
+    BertConfig,
+    BertForSequenceClassification,
+    PreTrainedTokenizerFast,
+    RobertaConfig,
+    RobertaForSequenceClassification,
+)
+
+EMOTION_LABELS = ["anger", "disgust", "fear", "joy", "neutral", "sadness", "surprise"]
+TOXICITY_LABELS = ["toxic", "severe_toxic", "obscene", "threat", "insult", "identity_hate"]
+
+WORDS = list(dict.fromkeys((
+    "i you we they he she it the a an is are was be have do go get make know think see come want "
+    "look use find give tell work call try ask need feel become leave put mean keep let begin seem "
+    "help talk turn start show hear play run move like live believe hold bring happen write sit "
+    "stand lose pay meet include continue set learn change lead understand watch follow stop create "
+    "speak read spend grow open walk win offer remember love consider appear buy wait serve die send "
+    "expect build stay fall cut reach kill remain lol ok yes no thanks please sorry great good bad "
+    "stupid idiot hate happy sad angry scared wow nice cool game chat message today tomorrow now "
+    "here there click free money winner everyone nobody hurt destroy watch out"
+).split()))
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]"]
+
+def build_tokenizer(max_length: int = 512) -> PreTrainedTokenizerFast:
+    """Word-level tokenizer over the stub vocabulary"""
+    vocab = {token: i for i, token in enumerate(SPECIAL_TOKENS + WORDS)}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", vocab["[CLS]"]), ("[SEP]", vocab["[SEP]"])]
+    )
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        pad_token="[PAD]",
+        unk_token="[UNK]",
+        cls_token="[CLS]",
+        sep_token="[SEP]",
+        model_max_length=max_length
+    )
+
+def build_emotion_model(hidden_size: int = 64, layers: int = 2, seed: int = 0):
+    """RoBERTa classifier with the emotion model's labels (softmax head)"""
+    torch.manual_seed(seed)
+    config = RobertaConfig(
+        vocab_size=len(SPECIAL_TOKENS) + len(WORDS),
+        hidden_size=hidden_size,
+        num_hidden_layers=layers,
+        num_attention_heads=max(1, hidden_size // 64),
+        intermediate_size=hidden_size * 4,
+        max_position_embeddings=514,
+        pad_token_id=0,
+        num_labels=len(EMOTION_LABELS),
+        id2label=dict(enumerate(EMOTION_LABELS)),
+        label2id={label: i for i, label in enumerate(EMOTION_LABELS)}
+    )
+    return RobertaForSequenceClassification(config).eval()
+
+def build_abuse_model(hidden_size: int = 64, layers: int = 2, seed: int = 0):
+    """BERT classifier with toxic-bert's labels (multi-label sigmoid head)"""
+    torch.manual_seed(seed)
+    config = BertConfig(
+        vocab_size=len(SPECIAL_TOKENS) + len(WORDS),
+        hidden_size=hidden_size,
+        num_hidden_layers=layers,
+        num_attention_heads=max(1, hidden_size // 64),
+        intermediate_size=hidden_size * 4,
+        max_position_embeddings=512,
+        pad_token_id=0,
+        problem_type="multi_label_classification",
+        num_labels=len(TOXICITY_LABELS),
+        id2label=dict(enumerate(TOXICITY_LABELS)),
+        label2id={label: i for i, label in enumerate(TOXICITY_LABELS)}
+    )
+    return BertForSequenceClassification(config).eval()
+
+def save_stub_models(directory: str, hidden_size: int = 64, layers: int = 2) -> Tuple[str, str]:
+    """Save both stub models with their tokenizer, returning the emotion and abuse model directories.
+
+    The directories can be used as ``EMOTION_MODEL_NAME`` and ``ABUSE_MODEL_NAME``.
+    """
+    tokenizer = build_tokenizer()
+    paths = []
+    for name, model in (
+        ("emotion", build_emotion_model(hidden_size, layers)),
+        ("abuse", build_abuse_model(hidden_size, layers)),
+    ):
+        path = os.path.join(directory, name)
+        model.save_pretrained(path)
+        tokenizer.save_pretrained(path)
+        paths.append(path)
+    return paths[0], paths[1]
+
+def chat_messages(count: int, seed: int = 0, long_fraction: float = 0.02, max_chars: int = 2000) -> List[str]:
+    """Synthetic chat traffic: mostly short messages with occasional long pastes"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        if rng.random() < long_fraction:
+            words = rng.randint(150, 350)
+        else:
+            words = max(1, min(60, int(rng.lognormvariate(2.0, 0.8))))
+        messages.append(" ".join(rng.choice(WORDS) for _ in range(words))[:max_chars])
+    return messages
@@ -0,0 +1,62 @@
+"""Multi-worker serving: gunicorn -c gunicorn.conf.py src.main:app
+
+The master loads both models once before forking (``PRELOAD_MODELS``), so
+every uvicorn worker maps the same read-only weight pages instead of
+holding a private copy; adding a worker costs its activations and Python
+heap, not another set of weights. Backends that transform the weights at
+load time (``torch-int8``, ``onnx``) still build that per worker; the
+half-precision backends load their weights in that precision, so those
+stay shared.
+"""
+import gc
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 8000)}"
+workers = int(os.getenv("NUM_WORKERS", 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("WORKER_TIMEOUT", 120))
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+preload_models = os.getenv("PRELOAD_MODELS", "True").lower() == "true"
+preload_app = preload_models
+
+# Workers' metrics are aggregated through files in a shared directory
+if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="ml-service-metrics-")
+
+# Model swaps and shadow runs made through one worker are followed by all of them
+if workers > 1 and not os.getenv("ROLLOUT_STATE_PATH"):
+    os.environ["ROLLOUT_STATE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="ml-service-rollout-"), "rollout.json")
+
+def on_starting(server):
+    """Load the weights in the master, before any worker forks"""
+    if not preload_models:
+        return
+
+    import torch
+    from src.bundle import preload_models as preload
+
+    # Keep the master single-threaded so no OpenMP pool exists at fork time;
+    # workers size their own pools
+    torch.set_num_threads(1)
+    preload()
+
+def when_ready(server):
+    """Freeze everything allocated so far out of the garbage collector.
+
+    Collections in the workers would otherwise write to the headers of
+    every preloaded object and un-share those pages.
+    """
+    gc.collect()
+    gc.freeze()
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges from the aggregated metrics"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
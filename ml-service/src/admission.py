@@ -0,0 +1,79 @@
+"""Admission control: request priority classes, deadlines and overload errors.
+
+Endpoints declare what kind of work a request is with ``request_class``;
+the models' micro-batchers read it when work is queued, so the priority
+and deadline follow the request through the analyzers without being
+passed explicitly. Tasks started from a request inherit its class.
+"""
+import math
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+# (priority, absolute deadline on the time.perf_counter() clock or None)
+_current: ContextVar[Tuple[str, Optional[float]]] = ContextVar("request_class", default=(INTERACTIVE, None))
+
+class QueueFull(Exception):
+    """The inference queue has no room; retry after ``retry_after`` seconds"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Whole seconds for a Retry-After header"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+class DeadlineExceeded(Exception):
+    """The caller's deadline passed before its work reached the model"""
+
+    def __init__(self):
+        super().__init__("Deadline exceeded")
+
+def deadline_after(ms: Optional[float]) -> Optional[float]:
+    """Absolute deadline ``ms`` milliseconds from now, or None for no deadline"""
+    if ms is None or ms <= 0:
+        return None
+    return time.perf_counter() + ms / 1000
+
+def set_request_class(priority: str, deadline_ms: Optional[float] = None):
+    """Mark the current request (and tasks it starts) as ``priority`` work.
+
+    Without an explicit deadline the lane's default
+    (``INTERACTIVE_DEADLINE_MS`` / ``BULK_DEADLINE_MS``, 0 = none) applies.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}'")
+    if deadline_ms is None:
+        deadline_ms = float(os.getenv(f"{priority.upper()}_DEADLINE_MS", 0))
+    _current.set((priority, deadline_after(deadline_ms)))
+
+@contextmanager
+def request_class(priority: str, deadline_ms: Optional[float] = None):
+    """Run a block as ``priority`` work, restoring the previous class afterwards"""
+    token = _current.set(_current.get())
+    try:
+        set_request_class(priority, deadline_ms)
+        yield
+    finally:
+        _current.reset(token)
+
+def current_request_class() -> Tuple[str, Optional[float]]:
+    """Priority and absolute deadline of the current request"""
+    return _current.get()
+
+def parse_deadline_ms(value: Optional[str]) -> Optional[float]:
+    """Parse an ``X-Deadline-Ms`` header, ignoring malformed values"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
@@ -1,10 +1,25 @@
 import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
 import numpy as np
 import logging
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional
 import asyncio
+import copy
+import time
+
+from src.admission import DeadlineExceeded, QueueFull
+from src.batcher import MicroBatcher
+from src.bundle import load_pretrained
+from src.cache import ResultCache
+from src.cascade import CascadeScores, audit_sample, load_cascade, score_cascade
+from src.lexicon import KeywordMatcher
+from src.metrics import CASCADE_DECISIONS, FALLBACKS, KEYWORDS
+from src.near_duplicates import NearDuplicateIndex, full_analysis_forced
+from src.inference import SequenceClassifier, create_model_executor, model_thread_settings
+from src.pipeline import StagedBatch, create_pipeline, forward_stage, tokenize_stage
+from src.profiling import profile_request_done
+from src.rollout import LoadedModel, ModelRollout
+from src.windows import TextWindow, WindowSettings, needs_windows, window_texts
 
 logger = logging.getLogger(__name__)
 
@@ -16,30 +31,35 @@ class EmotionAnalyzer:
         self.classifier = None
         self.emotion_labels = ["anger", "disgust", "fear", "joy", "neutral", "sadness", "surprise"]
         
+        # Forward passes run on this model's own thread pool; concurrent
+        # analyze() calls share one forward pass, and tokenizing and
+        # post-processing of neighbouring batches overlap with it
+        self.executor = create_model_executor("EMOTION")
+        self.pipeline = create_pipeline(
+            "emotion", self.executor, self._tokenize_stage, forward_stage, self._postprocess_stage
+        )
+        self.batcher = MicroBatcher(
+            self._classify_batch, executor=self.executor, name="emotion", pipeline=self.pipeline
+        )
+        
+        # Repeated texts reuse earlier results for the same model version
+        self.model_version = "unknown"
+        self.cache = ResultCache(name="emotion")
+        self.near_duplicates = NearDuplicateIndex(name="emotion")
+        
+        # Optional cheap first stage that answers confident texts itself
+        self.cascade = load_cascade()
+        
+        # Admin hot swaps and shadow scoring of candidate models
+        self.rollout = ModelRollout(self, "EMOTION", field="emotion")
+        
     async def load_model(self):
-        """Load the emotion analysis model"""
+        """Load the emotion analysis model on its own executor, so both models can load at once"""
         try:
             logger.info(f"Loading emotion model: {self.model_name}")
             
-            # Load model and tokenizer
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                self.model_name,
-                cache_dir=os.getenv("MODEL_CACHE_DIR", "./models/cache")
-            )
-            
-            self.model = AutoModelForSequenceClassification.from_pretrained(
-                self.model_name,
-                cache_dir=os.getenv("MODEL_CACHE_DIR", "./models/cache")
-            )
-            
-            # Create pipeline
-            self.classifier = pipeline(
-                "text-classification",
-                model=self.model,
-                tokenizer=self.tokenizer,
-                return_all_scores=True,
-                device=0 if torch.cuda.is_available() and os.getenv("USE_GPU", "False").lower() == "true" else -1
-            )
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(self.executor, self._load)
             
             logger.info("Emotion model loaded successfully")
             
@@ -47,61 +67,223 @@ class EmotionAnalyzer:
             logger.error(f"Failed to load emotion model: {e}")
             raise e
     
-    async def analyze(self, text: str) -> Dict:
+    def _load(self):
+        """Load the configured model and start serving it"""
+        self.install_model(self.build_model(self.model_name))
+    
+    def build_model(self, model_name: str) -> LoadedModel:
+        """Load model and tokenizer (local bundle if configured) and build the classifier"""
+        model, tokenizer, version = load_pretrained("emotion", model_name)
+        
+        # Create batched classifier
+        classifier = SequenceClassifier(
+            model,
+            tokenizer,
+            device=0 if torch.cuda.is_available() and os.getenv("USE_GPU", "False").lower() == "true" else -1,
+            num_threads=model_thread_settings("EMOTION")[1],
+            name="emotion"
+        )
+        return LoadedModel(model_name, model, tokenizer, version, classifier)
+    
+    def install_model(self, loaded: LoadedModel) -> LoadedModel:
+        """Serve ``loaded`` from now on, returning the model it replaces.
+        
+        Batches read ``self.classifier`` once, so each runs entirely on one
+        model; results of the new one are cached under a new namespace.
+        """
+        previous = LoadedModel(self.model_name, self.model, self.tokenizer, self.model_version, self.classifier)
+        self.model_name, self.model, self.tokenizer, self.model_version = (
+            loaded.model_name, loaded.model, loaded.tokenizer, loaded.version
+        )
+        self.classifier = loaded.classifier
+        return previous
+    
+    async def warmup(self):
+        """Run representative batches so the first real requests don't pay for lazy initialization"""
+        loop = asyncio.get_event_loop()
+        elapsed = await loop.run_in_executor(self.executor, self._warmup)
+        logger.info(f"Emotion model warmed up in {elapsed:.2f}s")
+    
+    def _warmup(self) -> float:
+        """Warm up the serving classifier, returning the seconds taken"""
+        return self.warm_model(self.classifier)
+    
+    def warm_model(self, classifier) -> float:
+        """Warm up a classifier and result post-processing, returning the seconds taken"""
+        started = time.perf_counter()
+        classifier.warmup()
+        self.classify_with(classifier, ["warming up the model"])
+        return time.perf_counter() - started
+    
+    async def analyze(self, text: str, cascade_scores: Optional[CascadeScores] = None) -> Dict:
         """Analyze emotion in text"""
         try:
             if not self.classifier:
                 raise Exception("Model not loaded")
             
-            # Run inference in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            results = await loop.run_in_executor(None, self.classifier, text)
-            
-            # Process results
-            emotion_scores = {}
-            for result in results[0]:  # results is a list with one element
-                emotion = result['label'].lower()
-                score = result['score'] * 100  # Convert to percentage
-                emotion_scores[emotion] = score
-            
-            # Find primary emotion
-            primary_emotion = max(emotion_scores, key=emotion_scores.get)
-            primary_intensity = emotion_scores[primary_emotion]
-            
-            # Get secondary emotions (scores > 10%)
-            secondary_emotions = []
-            for emotion, score in emotion_scores.items():
-                if emotion != primary_emotion and score > 10:
-                    secondary_emotions.append({
-                        "emotion": emotion,
-                        "intensity": round(score, 2)
-                    })
-            
-            # Sort secondary emotions by intensity
-            secondary_emotions.sort(key=lambda x: x['intensity'], reverse=True)
-            
-            return {
-                "emotion": primary_emotion,
-                "intensity": round(primary_intensity, 2),
-                "secondary_emotions": secondary_emotions[:3],  # Top 3 secondary emotions
-                "all_scores": {k: round(v, 2) for k, v in emotion_scores.items()}
-            }
+            # Texts the cascade is confident about skip the transformer
+            result = (await self._cascade_results([text], cascade_scores))[0]
+            if result is not None:
+                return result
             
+            # Serve repeats from cache, otherwise queue for the next batched
+            # forward pass (runs in thread pool)
+            key = self.cache.make_key(self.cache_namespace, text)
+            return await self.cache.get_or_compute(key, text, self._run_one)
+            
+        except (QueueFull, DeadlineExceeded):
+            # Overload is the caller's to handle, not a per-text failure
+            raise
         except Exception as e:
             logger.error(f"Error analyzing emotion: {e}")
-            return {
-                "emotion": "neutral",
-                "intensity": 0,
-                "secondary_emotions": [],
-                "all_scores": {},
-                "error": str(e)
-            }
+            return self._error_result(e)
+    
+    async def analyze_batch(self, texts: List[str], cascade_scores: Optional[CascadeScores] = None) -> List[Dict]:
+        """Analyze emotion in many texts using padded tensor batches"""
+        try:
+            if not self.classifier:
+                raise Exception("Model not loaded")
+            
+            # The cascade answers what it can; the rest goes to the transformer
+            results = await self._cascade_results(texts, cascade_scores)
+            escalated = [i for i, result in enumerate(results) if result is None]
+            
+            if escalated:
+                escalated_texts = [texts[i] for i in escalated]
+                keys = [self.cache.make_key(self.cache_namespace, text) for text in escalated_texts]
+                computed = await self.cache.get_or_compute_many(keys, escalated_texts, self._run_batch)
+                for i, result in zip(escalated, computed):
+                    results[i] = result
+            
+            return results
+        
+        except (QueueFull, DeadlineExceeded):
+            # Overload is the caller's to handle, not a per-text failure
+            raise
+        except Exception as e:
+            logger.error(f"Error analyzing emotion batch: {e}")
+            
+            # Retry one text at a time so a single bad input doesn't fail the rest
+            return [await self.analyze(text) for text in texts]
+    
+    async def _cascade_results(self, texts: List[str], scores: Optional[CascadeScores] = None) -> List[Optional[Dict]]:
+        """Results for the texts the cascade is confident about, None for the rest.
+        
+        ``scores`` are reused when the caller already scored the texts for both models.
+        """
+        results = [None] * len(texts)
+        if self.cascade is None or full_analysis_forced():
+            return results
+        
+        if scores is None:
+            scores = await score_cascade(self.cascade, texts)
+        probs = scores.emotion
+        confident = np.flatnonzero(probs.max(axis=1) >= self.cascade.emotion_gate)
+        
+        if len(confident):
+            for i, result in zip(confident, self._build_results(probs[confident], self.cascade.emotion_labels)):
+                results[i] = result
+            audit_sample(
+                "emotion", [texts[i] for i in confident], [results[i] for i in confident],
+                self.batcher.submit_many, "emotion", self.cascade.audit_rate
+            )
+        
+        CASCADE_DECISIONS.labels("emotion", "resolved").inc(len(confident))
+        CASCADE_DECISIONS.labels("emotion", "escalated").inc(len(texts) - len(confident))
+        return results
+    
+    @property
+    def cache_namespace(self) -> str:
+        """Cache key prefix tying results to this model and version"""
+        return f"emotion:{self.model_name}@{self.model_version}"
+    
+    async def _run_batch(self, texts: List[str]) -> List[Dict]:
+        """Reuse near-duplicates' results, classifying the rest through the inference queue"""
+        results = await self.near_duplicates.get_or_compute_many(self.cache_namespace, texts, self.batcher.submit_many)
+        self.rollout.shadow_sample(texts, results)
+        return results
+    
+    async def _run_one(self, text: str) -> Dict:
+        """``_run_batch`` for a single text"""
+        return (await self._run_batch([text]))[0]
+    
+    def _classify_batch(self, texts: List[str]) -> List[Dict]:
+        """Run the serving classifier over a batch of texts"""
+        return self.classify_with(self.classifier, texts)
+    
+    def classify_with(self, classifier, texts: List[str]) -> List[Dict]:
+        """Run a classifier over a batch of texts"""
+        probs = classifier.predict(texts)
+        labels = [label.lower() for label in classifier.labels]
+        return self._build_results(probs, labels)
+    
+    def _tokenize_stage(self, texts: List[str]) -> StagedBatch:
+        """Pipeline stage: tokenize for the serving classifier"""
+        return tokenize_stage(self.classifier, texts)
+    
+    def _postprocess_stage(self, batch: StagedBatch) -> List[Dict]:
+        """Pipeline stage: probabilities to result dicts"""
+        return self._build_results(batch.data, [label.lower() for label in batch.classifier.labels])
+    
+    def _build_results(self, probs: np.ndarray, labels: List[str]) -> List[Dict]:
+        """Turn an (n_texts, n_labels) probability array into result dicts"""
+        raw_scores = probs.astype(np.float64) * 100  # Convert to percentage
+        scores = np.round(raw_scores, 2)
+        
+        # Primary emotion is the top score of each row
+        primary = raw_scores.argmax(axis=1)
+        rows = np.arange(len(scores))
+        
+        # Secondary emotions: other labels scoring > 10%, strongest first, top 3
+        secondary_mask = raw_scores > 10
+        secondary_mask[rows, primary] = False
+        order = np.argsort(-scores, axis=1, kind="stable")
+        
+        results = []
+        for row, label_order in enumerate(order):
+            secondary_emotions = [
+                {"emotion": labels[idx], "intensity": scores[row, idx].item()}
+                for idx in label_order if secondary_mask[row, idx]
+            ]
+            results.append({
+                "emotion": labels[primary[row]],
+                "intensity": scores[row, primary[row]].item(),
+                "secondary_emotions": secondary_emotions[:3],  # Top 3 secondary emotions
+                "all_scores": dict(zip(labels, scores[row].tolist()))
+            })
+        
+        return results
+    
+    def combine_windows(self, results: List[Dict]) -> Dict:
+        """One result for a text scored in windows (``EMOTION_WINDOW_AGGREGATION``).
+        
+        ``mean`` averages the label scores over the windows; ``max`` takes
+        the window with the strongest primary emotion.
+        """
+        if os.getenv("EMOTION_WINDOW_AGGREGATION", "mean").lower() == "max":
+            return max(results, key=lambda result: result["intensity"])
+        
+        labels = list(results[0]["all_scores"])
+        scores = np.array([[result["all_scores"].get(label, 0.0) for label in labels] for result in results])
+        return self._build_results(scores.mean(axis=0, keepdims=True) / 100, labels)[0]
+    
+    def _error_result(self, error: Exception) -> Dict:
+        """Neutral fallback result for a failed analysis"""
+        FALLBACKS.labels("emotion").inc()
+        return {
+            "emotion": "neutral",
+            "intensity": 0,
+            "secondary_emotions": [],
+            "all_scores": {},
+            "error": str(error)
+        }
 
 class AbuseDetector:
     def __init__(self):
         self.model_name = os.getenv("ABUSE_MODEL_NAME", "unitary/toxic-bert")
         self.model = None
         self.tokenizer = None
+        self.window_tokenizer = None
         self.classifier = None
         self.abuse_types = ["harassment", "bullying", "hate_speech", "threats", "spam", "sexual_content"]
         
@@ -115,30 +297,41 @@ class AbuseDetector:
             "spam": 0.6
         }
         
+        # Keyword lexicons per abuse type, compiled once; on ties the earlier
+        # category wins
+        self.keywords = KeywordMatcher.from_directory(
+            categories=["hate_speech", "threats", "sexual_content", "harassment", "bullying", "spam"]
+        )
+        
+        # Forward passes run on this model's own thread pool; concurrent
+        # analyze() calls share one forward pass, and tokenizing and
+        # post-processing of neighbouring batches overlap with it
+        self.executor = create_model_executor("ABUSE")
+        self.pipeline = create_pipeline(
+            "abuse", self.executor, self._tokenize_stage, forward_stage, self._postprocess_stage
+        )
+        self.batcher = MicroBatcher(
+            self._classify_batch, executor=self.executor, name="abuse", pipeline=self.pipeline
+        )
+        
+        # Repeated texts reuse earlier results for the same model version. No
+        # near-duplicate reuse: a one-word edit can make a near-duplicate abusive
+        self.model_version = "unknown"
+        self.cache = ResultCache(name="abuse")
+        
+        # Optional cheap first stage that answers confidently benign texts itself
+        self.cascade = load_cascade()
+        
+        # Admin hot swaps and shadow scoring of candidate models
+        self.rollout = ModelRollout(self, "ABUSE", field="abuse_detected", score_field="toxicity_score")
+        
     async def load_model(self):
-        """Load the abuse detection model"""
+        """Load the abuse detection model on its own executor, so both models can load at once"""
         try:
             logger.info(f"Loading abuse detection model: {self.model_name}")
             
-            # Load model and tokenizer
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                self.model_name,
-                cache_dir=os.getenv("MODEL_CACHE_DIR", "./models/cache")
-            )
-            
-            self.model = AutoModelForSequenceClassification.from_pretrained(
-                self.model_name,
-                cache_dir=os.getenv("MODEL_CACHE_DIR", "./models/cache")
-            )
-            
-            # Create pipeline for toxicity detection
-            self.classifier = pipeline(
-                "text-classification",
-                model=self.model,
-                tokenizer=self.tokenizer,
-                return_all_scores=True,
-                device=0 if torch.cuda.is_available() and os.getenv("USE_GPU", "False").lower() == "true" else -1
-            )
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(self.executor, self._load)
             
             logger.info("Abuse detection model loaded successfully")
             
@@ -146,71 +339,234 @@ class AbuseDetector:
             logger.error(f"Failed to load abuse detection model: {e}")
             raise e
     
-    async def analyze(self, text: str) -> Dict:
+    def _load(self):
+        """Load the configured model and start serving it"""
+        self.install_model(self.build_model(self.model_name))
+    
+    def build_model(self, model_name: str) -> LoadedModel:
+        """Load model and tokenizer (local bundle if configured) and build the classifier"""
+        model, tokenizer, version = load_pretrained("abuse", model_name)
+        
+        # Create batched classifier for toxicity detection
+        classifier = SequenceClassifier(
+            model,
+            tokenizer,
+            device=0 if torch.cuda.is_available() and os.getenv("USE_GPU", "False").lower() == "true" else -1,
+            num_threads=model_thread_settings("ABUSE")[1],
+            name="abuse"
+        )
+        # Long texts are split by this model's tokens on another thread, which
+        # needs its own tokenizer instance
+        return LoadedModel(model_name, model, tokenizer, version, classifier, copy.deepcopy(tokenizer))
+    
+    def install_model(self, loaded: LoadedModel) -> LoadedModel:
+        """Serve ``loaded`` from now on, returning the model it replaces.
+        
+        Batches read ``self.classifier`` once, so each runs entirely on one
+        model; results of the new one are cached under a new namespace.
+        """
+        previous = LoadedModel(
+            self.model_name, self.model, self.tokenizer, self.model_version, self.classifier, self.window_tokenizer
+        )
+        self.model_name, self.model, self.tokenizer, self.model_version = (
+            loaded.model_name, loaded.model, loaded.tokenizer, loaded.version
+        )
+        self.window_tokenizer = loaded.window_tokenizer
+        self.classifier = loaded.classifier
+        return previous
+    
+    async def warmup(self):
+        """Run representative batches so the first real requests don't pay for lazy initialization"""
+        loop = asyncio.get_event_loop()
+        elapsed = await loop.run_in_executor(self.executor, self._warmup)
+        logger.info(f"Abuse model warmed up in {elapsed:.2f}s")
+    
+    def _warmup(self) -> float:
+        """Warm up the serving classifier, returning the seconds taken"""
+        return self.warm_model(self.classifier)
+    
+    def warm_model(self, classifier) -> float:
+        """Warm up a classifier and result post-processing, returning the seconds taken"""
+        started = time.perf_counter()
+        classifier.warmup()
+        self.classify_with(classifier, ["warming up the model"])
+        return time.perf_counter() - started
+    
+    async def analyze(self, text: str, cascade_scores: Optional[CascadeScores] = None) -> Dict:
         """Analyze text for abuse"""
         try:
             if not self.classifier:
                 raise Exception("Model not loaded")
             
-            # Run inference in thread pool
-            loop = asyncio.get_event_loop()
-            results = await loop.run_in_executor(None, self.classifier, text)
-            
-            # Extract toxicity score
-            toxicity_score = 0
-            for result in results[0]:
-                if result['label'] == 'TOXIC':
-                    toxicity_score = result['score']
-                    break
-            
-            # Determine abuse type based on keywords and patterns
-            abuse_type = await self._classify_abuse_type(text, toxicity_score)
-            
-            # Check if abuse is detected
-            confidence_score = toxicity_score * 100
-            threshold = self.thresholds.get(abuse_type, 0.7)
-            abuse_detected = toxicity_score > threshold
-            
-            return {
-                "abuse_detected": abuse_detected,
-                "abuse_type": abuse_type if abuse_detected else "none",
-                "confidence_score": round(confidence_score, 2),
-                "toxicity_score": round(toxicity_score, 4),
-                "threshold_used": threshold
-            }
+            # Texts the cascade is confident about skip the transformer
+            result = (await self._cascade_results([text], cascade_scores))[0]
+            if result is not None:
+                return result
             
+            # Serve repeats from cache, otherwise queue for the next batched
+            # forward pass (runs in thread pool)
+            key = self.cache.make_key(self.cache_namespace, text)
+            return await self.cache.get_or_compute(key, text, self._run_one)
+            
+        except (QueueFull, DeadlineExceeded):
+            # Overload is the caller's to handle, not a per-text failure
+            raise
         except Exception as e:
             logger.error(f"Error detecting abuse: {e}")
-            return {
-                "abuse_detected": False,
-                "abuse_type": "none",
-                "confidence_score": 0,
-                "toxicity_score": 0,
-                "threshold_used": 0.7,
-                "error": str(e)
+            return self._error_result(e)
+    
+    async def analyze_batch(self, texts: List[str], cascade_scores: Optional[CascadeScores] = None) -> List[Dict]:
+        """Analyze many texts for abuse using padded tensor batches"""
+        try:
+            if not self.classifier:
+                raise Exception("Model not loaded")
+            
+            # The cascade answers what it can; the rest goes to the transformer
+            results = await self._cascade_results(texts, cascade_scores)
+            escalated = [i for i, result in enumerate(results) if result is None]
+            
+            if escalated:
+                escalated_texts = [texts[i] for i in escalated]
+                keys = [self.cache.make_key(self.cache_namespace, text) for text in escalated_texts]
+                computed = await self.cache.get_or_compute_many(keys, escalated_texts, self._run_batch)
+                for i, result in zip(escalated, computed):
+                    results[i] = result
+            
+            return results
+        
+        except (QueueFull, DeadlineExceeded):
+            # Overload is the caller's to handle, not a per-text failure
+            raise
+        except Exception as e:
+            logger.error(f"Error detecting abuse in batch: {e}")
+            
+            # Retry one text at a time so a single bad input doesn't fail the rest
+            return [await self.analyze(text) for text in texts]
+    
+    async def _cascade_results(self, texts: List[str], scores: Optional[CascadeScores] = None) -> List[Optional[Dict]]:
+        """Results for the texts the cascade is confident are benign, None for the rest.
+        
+        ``scores`` are reused when the caller already scored the texts for both models.
+        """
+        results = [None] * len(texts)
+        if self.cascade is None or full_analysis_forced():
+            return results
+        
+        if scores is None:
+            scores = await score_cascade(self.cascade, texts)
+        abusive = scores.abusive
+        confident = np.flatnonzero(abusive <= 1 - self.cascade.abuse_gate)
+        
+        if len(confident):
+            confident_texts = [texts[i] for i in confident]
+            # The cascade's abuse probability stands in for the toxicity score
+            for i, result in zip(confident, self._build_results(confident_texts, abusive[confident, None], ["toxic"])):
+                results[i] = result
+            audit_sample(
+                "abuse", confident_texts, [results[i] for i in confident],
+                self.batcher.submit_many, "abuse_detected", self.cascade.audit_rate
+            )
+        
+        CASCADE_DECISIONS.labels("abuse", "resolved").inc(len(confident))
+        CASCADE_DECISIONS.labels("abuse", "escalated").inc(len(texts) - len(confident))
+        return results
+    
+    @property
+    def cache_namespace(self) -> str:
+        """Cache key prefix tying results to this model and version"""
+        return f"abuse:{self.model_name}@{self.model_version}:{self.keywords.digest}"
+    
+    async def _run_batch(self, texts: List[str]) -> List[Dict]:
+        """Classify texts through the inference queue"""
+        results = await self.batcher.submit_many(texts)
+        self.rollout.shadow_sample(texts, results)
+        return results
+    
+    async def _run_one(self, text: str) -> Dict:
+        """``_run_batch`` for a single text"""
+        return (await self._run_batch([text]))[0]
+    
+    def _classify_batch(self, texts: List[str]) -> List[Dict]:
+        """Run the serving classifier over a batch of texts"""
+        return self.classify_with(self.classifier, texts)
+    
+    def classify_with(self, classifier, texts: List[str]) -> List[Dict]:
+        """Run a classifier over a batch of texts"""
+        probs = classifier.predict(texts)
+        return self._build_results(texts, probs, classifier.labels)
+    
+    def _tokenize_stage(self, texts: List[str]) -> StagedBatch:
+        """Pipeline stage: tokenize for the serving classifier"""
+        return tokenize_stage(self.classifier, texts)
+    
+    def _postprocess_stage(self, batch: StagedBatch) -> List[Dict]:
+        """Pipeline stage: probabilities to result dicts, including keyword matching"""
+        return self._build_results(batch.texts, batch.data, batch.classifier.labels)
+    
+    def _build_results(self, texts: List[str], probs: np.ndarray, labels: List[str]) -> List[Dict]:
+        """Turn an (n_texts, n_labels) probability array into result dicts"""
+        # Extract toxicity score
+        toxic_columns = [i for i, label in enumerate(labels) if label.lower() == "toxic"]
+        if toxic_columns:
+            toxicity_scores = probs[:, toxic_columns[0]].astype(np.float64)
+        else:
+            toxicity_scores = np.zeros(len(texts))
+        
+        # Determine abuse type based on keywords and patterns
+        started = time.perf_counter()
+        abuse_types = [
+            self._classify_abuse_type(text, score) for text, score in zip(texts, toxicity_scores)
+        ]
+        KEYWORDS.observe(time.perf_counter() - started)
+        
+        # Check if abuse is detected
+        thresholds = np.array([self.thresholds.get(abuse_type, 0.7) for abuse_type in abuse_types])
+        abuse_detected = toxicity_scores > thresholds
+        confidence_scores = np.round(toxicity_scores * 100, 2)
+        rounded_toxicity = np.round(toxicity_scores, 4)
+        
+        return [
+            {
+                "abuse_detected": bool(abuse_detected[i]),
+                "abuse_type": abuse_types[i] if abuse_detected[i] else "none",
+                "confidence_score": confidence_scores[i].item(),
+                "toxicity_score": rounded_toxicity[i].item(),
+                "threshold_used": thresholds[i].item()
             }
+            for i in range(len(texts))
+        ]
     
-    async def _classify_abuse_type(self, text: str, toxicity_score: float) -> str:
-        """Classify the type of abuse based on text content"""
-        text_lower = text.lower()
-        
-        # Keywords for different abuse types
-        hate_speech_keywords = ["hate", "kill", "die", "nazi", "terrorist", racial_slurs_pattern()]
-        threat_keywords = ["kill you", "hurt you", "destroy you", "going to get you", "watch out"]
-        sexual_keywords = ["sex", "sexual", "nude", "naked", explicit_terms_pattern()]
-        harassment_keywords = ["stupid", "idiot", "loser", "pathetic", "worthless"]
-        bullying_keywords = ["everyone hates you", "nobody likes you", "you should", "embarrassing"]
-        spam_keywords = ["click here", "buy now", "free money", "winner", "congratulations"]
-        
-        # Count matches for each category
-        scores = {
-            "hate_speech": sum(1 for keyword in hate_speech_keywords if keyword in text_lower),
-            "threats": sum(1 for keyword in threat_keywords if keyword in text_lower),
-            "sexual_content": sum(1 for keyword in sexual_keywords if keyword in text_lower),
-            "harassment": sum(1 for keyword in harassment_keywords if keyword in text_lower),
-            "bullying": sum(1 for keyword in bullying_keywords if keyword in text_lower),
-            "spam": sum(1 for keyword in spam_keywords if keyword in text_lower)
+    def combine_windows(self, text: str, results: List[Dict]):
+        """One result for a text scored in windows, plus the most toxic window's index.
+        
+        The toxicity is the windows' ``max`` or ``mean`` (``ABUSE_WINDOW_AGGREGATION``);
+        abuse type and threshold come from the whole text.
+        """
+        toxicity = np.array([result["toxicity_score"] for result in results], dtype=np.float64)
+        triggered = int(toxicity.argmax())
+        if os.getenv("ABUSE_WINDOW_AGGREGATION", "max").lower() == "mean":
+            score = toxicity.mean()
+        else:
+            score = toxicity[triggered]
+        
+        return self._build_results([text], np.array([[score]]), ["toxic"])[0], triggered
+    
+    def _error_result(self, error: Exception) -> Dict:
+        """Non-abusive fallback result for a failed analysis"""
+        FALLBACKS.labels("abuse").inc()
+        return {
+            "abuse_detected": False,
+            "abuse_type": "none",
+            "confidence_score": 0,
+            "toxicity_score": 0,
+            "threshold_used": 0.7,
+            "error": str(error)
         }
+    
+    def _classify_abuse_type(self, text: str, toxicity_score: float) -> str:
+        """Classify the type of abuse based on text content"""
+        # Count lexicon matches for each category in one pass
+        scores = self.keywords.count_matches(text)
         
         # Return the category with highest score, or harassment as default
         if max(scores.values()) > 0:
@@ -218,14 +574,131 @@ class AbuseDetector:
         else:
             return "harassment"  # Default category for toxic content
 
-def racial_slurs_pattern():
-    """Returns pattern for racial slurs - placeholder for actual implementation"""
-    # In production, this would contain actual patterns/keywords
-    # This is a placeholder to avoid including offensive content
-    return "offensive_racial_terms"
+async def analyze_texts(emotion_analyzer: EmotionAnalyzer, abuse_detector: AbuseDetector, texts: List[str]) -> List[Dict]:
+    """Analyze texts with one batched pass per model, one combined result per text"""
+    max_length = int(os.getenv("MAX_TEXT_LENGTH", 20000))
+    results = [None] * len(texts)
+    
+    # Validate individual text length
+    valid_indices = []
+    for i, text in enumerate(texts):
+        if len(text) > max_length:
+            results[i] = failed_result("Text too long")
+        else:
+            valid_indices.append(i)
+    
+    if valid_indices:
+        valid_texts = [texts[i] for i in valid_indices]
+        
+        # Texts longer than the models' input become overlapping windows,
+        # scored in the same batched pass as everything else
+        settings = WindowSettings.from_env()
+        windows = await window_texts(valid_texts, abuse_detector.window_tokenizer, settings)
+        inputs = []
+        for text, text_windows in zip(valid_texts, windows):
+            inputs.extend([window.text for window in text_windows] if text_windows else [text])
+        
+        scores = await shared_cascade_scores(emotion_analyzer, abuse_detector, inputs)
+        
+        # Analyze emotions and detect abuse concurrently, one batched pass per model
+        emotion_results, abuse_results = await asyncio.gather(
+            emotion_analyzer.analyze_batch(inputs, scores),
+            abuse_detector.analyze_batch(inputs, scores)
+        )
+        
+        offset = 0
+        for i, text, text_windows in zip(valid_indices, valid_texts, windows):
+            if text_windows is None:
+                results[i] = combined_result(emotion_results[offset], abuse_results[offset])
+                offset += 1
+                continue
+            
+            end = offset + len(text_windows)
+            results[i] = combined_window_result(
+                emotion_analyzer, abuse_detector, text, text_windows,
+                emotion_results[offset:end], abuse_results[offset:end]
+            )
+            offset = end
+    
+    profile_request_done()
+    return results
+
+async def analyze_message(emotion_analyzer: EmotionAnalyzer, abuse_detector: AbuseDetector, text: str) -> Dict:
+    """Analyze one text through each model's micro-batcher, so concurrent callers share forward passes"""
+    if len(text) > int(os.getenv("MAX_TEXT_LENGTH", 20000)):
+        return failed_result("Text too long")
+    
+    if needs_windows(text, WindowSettings.from_env()):
+        # Possibly longer than the models' input; tokenized and windowed like a batch
+        return (await analyze_texts(emotion_analyzer, abuse_detector, [text]))[0]
+    
+    scores = await shared_cascade_scores(emotion_analyzer, abuse_detector, [text])
+    
+    emotion_result, abuse_result = await asyncio.gather(
+        emotion_analyzer.analyze(text, scores),
+        abuse_detector.analyze(text, scores)
+    )
+    profile_request_done()
+    return combined_result(emotion_result, abuse_result)
+
+async def shared_cascade_scores(emotion_analyzer: EmotionAnalyzer, abuse_detector: AbuseDetector, texts: List[str]) -> Optional[CascadeScores]:
+    """Featurize once for both analyzers when they share a cascade, else let each score its own"""
+    cascade = emotion_analyzer.cascade
+    if cascade is None or cascade is not abuse_detector.cascade or not emotion_analyzer.classifier or full_analysis_forced():
+        return None
+    return await score_cascade(cascade, texts)
+
+def combined_result(emotion_result: Dict, abuse_result: Dict) -> Dict:
+    """Merge one text's emotion and abuse results into the API's result shape"""
+    error = emotion_result.get("error") or abuse_result.get("error")
+    if error:
+        logger.error(f"Error analyzing individual text: {error}")
+        return failed_result(error)
+    
+    return {
+        "abuse_detected": abuse_result["abuse_detected"],
+        "abuse_type": abuse_result["abuse_type"],
+        "confidence_score": abuse_result["confidence_score"],
+        "emotion": emotion_result["emotion"],
+        "emotion_intensity": emotion_result["intensity"],
+        "secondary_emotions": emotion_result["secondary_emotions"]
+    }
+
+def combined_window_result(
+    emotion_analyzer: EmotionAnalyzer,
+    abuse_detector: AbuseDetector,
+    text: str,
+    windows: List[TextWindow],
+    emotion_results: List[Dict],
+    abuse_results: List[Dict]
+) -> Dict:
+    """Combine a long text's per-window results into one result.
+    
+    ``window`` names the window with the highest toxicity, i.e. the one
+    that triggers (or comes closest to triggering) abuse detection.
+    """
+    for emotion_result, abuse_result in zip(emotion_results, abuse_results):
+        if emotion_result.get("error") or abuse_result.get("error"):
+            return combined_result(emotion_result, abuse_result)
+    
+    abuse_result, triggered = abuse_detector.combine_windows(text, abuse_results)
+    result = combined_result(emotion_analyzer.combine_windows(emotion_results), abuse_result)
+    result["window"] = {
+        "index": triggered,
+        "start": windows[triggered].start,
+        "end": windows[triggered].end,
+        "count": len(windows)
+    }
+    return result
 
-def explicit_terms_pattern():
-    """Returns pattern for explicit sexual terms - placeholder"""
-    # In production, this would contain actual patterns/keywords
-    # This is a placeholder to avoid including explicit content
-    return "explicit_sexual_terms"
\ No newline at end of file
+def failed_result(error: str) -> Dict:
+    """Placeholder combined result for a text that could not be analyzed"""
+    return {
+        "error": error,
+        "abuse_detected": False,
+        "abuse_type": "none",
+        "confidence_score": 0,
+        "emotion": "neutral",
+        "emotion_intensity": 0,
+        "secondary_emotions": []
+    }
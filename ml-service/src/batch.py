@@ -0,0 +1,309 @@
+"""Offline bulk scoring: ``python -m src.batch INPUT OUTPUT``.
+
+Reads a JSONL or CSV corpus as a stream, scores it on a pool of worker
+processes that each load the models once, and writes one result per input
+record as JSONL or Parquet. Progress is checkpointed next to the output so
+re-running the same command after a crash resumes where it stopped.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from src.admission import BULK, request_class
+
+logger = logging.getLogger(__name__)
+
+# Per-process state, set up once by _init_worker
+_worker = {}
+
+def read_records(path: str, input_format: str, chunk_size: int, skip: int = 0) -> Iterator[List[Dict]]:
+    """Yield chunks of raw input records, skipping the first ``skip``"""
+    if input_format == "csv":
+        import pandas as pd
+
+        # Every column as a string, so ids like "007" survive and empty cells stay ""
+        reader = pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False, skiprows=range(1, skip + 1))
+        for frame in reader:
+            yield frame.to_dict("records")
+        return
+
+    chunk = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            if skip:
+                skip -= 1
+                continue
+
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = {"__error__": f"Invalid JSON on line {line_number}"}
+            if not isinstance(record, dict):
+                record = {"__error__": f"Expected a JSON object on line {line_number}"}
+
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+    if chunk:
+        yield chunk
+
+def score_records(records: List[Dict], text_field: str, id_field: str, first_index: int) -> List[Dict]:
+    """Score one chunk of records in this worker, one output row per record"""
+    from src.analyzer import analyze_texts, failed_result
+
+    rows = []
+    texts = []
+    for offset, record in enumerate(records):
+        record_id = record.get(id_field)
+        # Records without an id are identified by their 1-based position in the input
+        if record_id is None or record_id == "":
+            record_id = first_index + offset + 1
+
+        text = record.get(text_field)
+        if "__error__" in record:
+            rows.append({"id": record_id, **failed_result(record["__error__"])})
+        elif not isinstance(text, str) or not text.strip():
+            rows.append({"id": record_id, **failed_result("Missing text")})
+        else:
+            rows.append({"id": record_id})
+            texts.append((len(rows) - 1, text))
+
+    if texts:
+        with request_class(BULK):
+            results = _worker["loop"].run_until_complete(
+                analyze_texts(_worker["emotion"], _worker["abuse"], [text for _, text in texts])
+            )
+        for (row, _), result in zip(texts, results):
+            rows[row].update(result)
+
+    for row in rows:
+        row.setdefault("error", None)
+
+    return rows
+
+def _init_worker(num_processes: int):
+    """Load both models once per worker process"""
+    from src.analyzer import EmotionAnalyzer, AbuseDetector
+
+    load_dotenv()
+    logging.basicConfig(level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper()))
+
+    # Torch thread defaults split the cores across these processes
+    os.environ["NUM_WORKERS"] = str(num_processes)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    emotion_analyzer = EmotionAnalyzer()
+    abuse_detector = AbuseDetector()
+    loop.run_until_complete(asyncio.gather(emotion_analyzer.load_model(), abuse_detector.load_model()))
+
+    _worker.update(loop=loop, emotion=emotion_analyzer, abuse=abuse_detector)
+
+class OutputWriter:
+    """Appends scored rows to JSONL or to a directory of Parquet part files"""
+
+    def __init__(self, path: str, output_format: str, checkpoint: Optional[Dict]):
+        self.path = path
+        self.format = output_format
+
+        if output_format == "parquet":
+            # Parquet files can't be appended to, so each chunk is its own part
+            if checkpoint is None and os.path.exists(path):
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+            os.makedirs(path, exist_ok=True)
+
+            self.parts = checkpoint["parts"] if checkpoint else 0
+            # Parts written after the last checkpoint are incomplete or will be rewritten
+            for name in os.listdir(path):
+                if name.startswith("part-") and int(name[5:10]) >= self.parts:
+                    os.remove(os.path.join(path, name))
+        else:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+
+            self._file = open(path, "r+b" if checkpoint and os.path.exists(path) else "wb")
+            # Drop anything written after the last checkpoint
+            self._file.truncate(checkpoint["output_bytes"] if checkpoint else 0)
+            self._file.seek(0, os.SEEK_END)
+
+    def write(self, rows: List[Dict]):
+        """Durably append one chunk of rows"""
+        if self.format == "parquet":
+            import pandas as pd
+
+            # Pin column types so every part shares one schema
+            frame = pd.DataFrame(rows)
+            frame["id"] = frame["id"].astype(str)
+            frame["error"] = frame["error"].astype("string")
+            frame["secondary_emotions"] = frame["secondary_emotions"].map(json.dumps)
+
+            part_path = os.path.join(self.path, f"part-{self.parts:05d}.parquet")
+            frame.to_parquet(part_path + ".tmp", index=False)
+            os.replace(part_path + ".tmp", part_path)
+            self.parts += 1
+        else:
+            self._file.write("".join(json.dumps(row) + "\n" for row in rows).encode("utf-8"))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def position(self) -> Dict:
+        """How far the output has got, for the checkpoint"""
+        if self.format == "parquet":
+            return {"parts": self.parts}
+        return {"output_bytes": self._file.tell()}
+
+    def close(self):
+        """Close the output file"""
+        if self.format != "parquet":
+            self._file.close()
+
+def load_checkpoint(path: str, settings: Dict) -> Optional[Dict]:
+    """Read a checkpoint left by an earlier run of the same job, if any"""
+    if not os.path.exists(path):
+        return None
+
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+
+    if checkpoint.get("run") != settings:
+        raise ValueError(f"Checkpoint {path} belongs to a different job; rerun with --restart")
+
+    return checkpoint
+
+def save_checkpoint(path: str, settings: Dict, records_done: int, position: Dict):
+    """Atomically record progress"""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"run": settings, "records_done": records_done, **position}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+def run(args: argparse.Namespace) -> int:
+    """Score the whole input, returning the number of records written"""
+    input_format = args.input_format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    output_format = args.output_format or ("parquet" if args.output.lower().endswith(".parquet") else "jsonl")
+    checkpoint_path = args.output.rstrip("/") + ".checkpoint"
+
+    # Settings that must match for a checkpoint to be resumed
+    run_settings = {
+        "input": os.path.abspath(args.input),
+        "input_format": input_format,
+        "output_format": output_format,
+        "text_field": args.text_field,
+        "id_field": args.id_field,
+    }
+
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = load_checkpoint(checkpoint_path, run_settings)
+
+    records_done = checkpoint["records_done"] if checkpoint else 0
+    if records_done:
+        logger.info(f"Resuming after {records_done} records")
+
+    writer = OutputWriter(args.output, output_format, checkpoint)
+    chunks = read_records(args.input, input_format, args.chunk_size, skip=records_done)
+    started = time.perf_counter()
+    scored = 0
+
+    def commit(rows: List[Dict]):
+        nonlocal records_done, scored
+        writer.write(rows)
+        records_done += len(rows)
+        scored += len(rows)
+        save_checkpoint(checkpoint_path, run_settings, records_done, writer.position())
+        if scored % (args.chunk_size * 100) < len(rows):
+            logger.info(f"Scored {records_done} records")
+
+    try:
+        if args.workers == 0:
+            # Score in this process (debugging, tiny inputs)
+            _init_worker(1)
+            for records in chunks:
+                commit(score_records(records, args.text_field, args.id_field, records_done))
+        else:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(
+                max_workers=args.workers, mp_context=context, initializer=_init_worker, initargs=(args.workers,)
+            ) as pool:
+                # Keep a bounded window of chunks in flight and write them
+                # back in input order, so the checkpoint is always a prefix
+                in_flight = deque()
+                submitted = records_done
+                for records in chunks:
+                    in_flight.append(pool.submit(score_records, records, args.text_field, args.id_field, submitted))
+                    submitted += len(records)
+                    if len(in_flight) >= args.workers * 2:
+                        commit(in_flight.popleft().result())
+
+                while in_flight:
+                    commit(in_flight.popleft().result())
+    finally:
+        writer.close()
+
+    # Finished - the next run of this command starts over
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Scored {scored} records in {elapsed:.1f}s ({scored / elapsed if elapsed else 0:.1f}/s), {records_done} total in {args.output}")
+    return records_done
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Command line options"""
+    parser = argparse.ArgumentParser(
+        prog="python -m src.batch",
+        description="Score a JSONL or CSV corpus for abuse and emotion without going through HTTP."
+    )
+    parser.add_argument("input", help="JSONL or CSV file to score")
+    parser.add_argument("output", help="JSONL file, or a directory of Parquet parts (ids as strings, secondary_emotions as JSON)")
+    parser.add_argument("--input-format", choices=["jsonl", "csv"], help="Defaults to the input file extension")
+    parser.add_argument("--output-format", choices=["jsonl", "parquet"], help="Defaults to the output file extension")
+    parser.add_argument("--text-field", default="text", help="Field/column holding the text (default: text)")
+    parser.add_argument("--id-field", default="id", help="Field/column copied to each result as its id (default: id)")
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("BULK_WORKERS", 2)),
+        help="Worker processes, each with its own copy of the models; 0 scores in this process (default: 2)"
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=int(os.getenv("BULK_CHUNK_SIZE", 256)),
+        help="Records per task, and per checkpoint (default: 256)"
+    )
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start over")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    """Entry point"""
+    load_dotenv()
+    logging.basicConfig(
+        level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper()),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    args = parse_args(argv)
+    if args.chunk_size < 1 or args.workers < 0:
+        sys.exit("--chunk-size must be at least 1 and --workers at least 0")
+
+    try:
+        run(args)
+    except ValueError as e:
+        sys.exit(str(e))
+
+if __name__ == "__main__":
+    main()
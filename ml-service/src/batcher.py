@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from src.admission import BULK, INTERACTIVE, PRIORITIES, DeadlineExceeded, QueueFull, current_request_class
+from src.metrics import BATCH_SIZE, QUEUE_DEPTH, QUEUE_WAIT, SHED
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """Coalesces concurrent single-item calls into batched calls.
+
+    Callers ``submit`` one item (or ``submit_many``) and await the results.
+    A background task gathers whatever is queued, waiting at most
+    ``max_wait_ms`` for more items once the first one arrives, and hands up
+    to ``max_batch_size`` items to ``process_batch`` in a single executor
+    call. ``process_batch`` must return one result per item, in order.
+    With a ``pipeline`` (``src.pipeline``) batches go through its stages
+    instead, several batches in flight at once.
+
+    Work is queued in priority lanes taken from the caller's request class
+    (``src.admission``): interactive items are always batched before bulk
+    ones, which go in larger ``bulk_batch_size`` batches. The queue holds at
+    most ``max_queue`` items, bulk work only ``bulk_queue_share`` of that;
+    past the limit ``QueueFull`` is raised. Items whose deadline passes
+    while queued are dropped with ``DeadlineExceeded`` before they reach the
+    model.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        executor=None,
+        max_concurrency: Optional[int] = None,
+        name: str = "model",
+        max_queue: Optional[int] = None,
+        bulk_batch_size: Optional[int] = None,
+        pipeline=None
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size or int(os.getenv("BATCH_SIZE", 8)))
+        self.bulk_batch_size = max(1, bulk_batch_size or int(os.getenv("BULK_BATCH_SIZE", 64)))
+        self.max_queue = max(1, max_queue or int(os.getenv("MAX_QUEUE_DEPTH", 1024)))
+        self.queue_limits = {
+            INTERACTIVE: self.max_queue,
+            BULK: max(1, int(self.max_queue * float(os.getenv("BULK_QUEUE_SHARE", 0.5)))),
+        }
+        if max_wait_ms is None:
+            max_wait_ms = float(os.getenv("BATCH_MAX_WAIT_MS", 5))
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.executor = executor
+        self.pipeline = pipeline
+        self.name = name
+        self._queue_wait = QUEUE_WAIT.labels(name)
+        self._batch_size = BATCH_SIZE.labels(name, "call")
+        self._depth_gauges = {priority: QUEUE_DEPTH.labels(name, priority) for priority in PRIORITIES}
+        self._shed = {
+            (priority, reason): SHED.labels(name, priority, reason)
+            for priority in PRIORITIES for reason in ("queue_full", "deadline")
+        }
+        self.shed_counts = {key: 0 for key in self._shed}
+
+        # Moving average of model time per item, for Retry-After estimates
+        self._seconds_per_item = None
+
+        # Batches collected but not yet through the model; defaults to the
+        # executor's thread count, or with a pipeline to what its forward stage
+        # runs plus the ones queued in front of it
+        default_concurrency = pipeline.model_capacity if pipeline is not None else getattr(executor, "_max_workers", 1)
+        self.max_concurrency = max(1, max_concurrency or default_concurrency)
+
+        self._loop = None
+        self._pending: Dict[str, deque] = {priority: deque() for priority in PRIORITIES}
+        self._wakeup = None
+        self._slots = None
+        self._worker = None
+        self._dispatching = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result"""
+        return (await self.submit_many([item]))[0]
+
+    async def submit_many(self, items: List[Any]) -> List[Any]:
+        """Queue items under the current request class and wait for their results.
+
+        All items are admitted or none are; an empty lane always admits,
+        so a single oversized submission can't be rejected forever.
+        """
+        if not items:
+            return []
+        self._ensure_started()
+
+        priority, deadline = current_request_class()
+        now = time.perf_counter()
+        if deadline is not None and deadline <= now:
+            self._count_shed(priority, "deadline", len(items))
+            raise DeadlineExceeded()
+
+        lane = self._pending[priority]
+        if lane and len(lane) + len(items) > self.queue_limits[priority]:
+            self._count_shed(priority, "queue_full", len(items))
+            raise QueueFull(self.retry_after())
+
+        futures = []
+        for item in items:
+            future = self._loop.create_future()
+            lane.append((item, future, now, deadline))
+            futures.append(future)
+        self._depth_gauges[priority].inc(len(items))
+        self._wakeup.set()
+
+        return list(await asyncio.gather(*futures))
+
+    def retry_after(self) -> float:
+        """Estimated seconds until the queued work has been processed"""
+        depth = sum(len(lane) for lane in self._pending.values())
+        seconds_per_item = self._seconds_per_item if self._seconds_per_item is not None else 0.05
+        return depth * seconds_per_item / self.max_concurrency
+
+    def stats(self) -> Dict:
+        """Queue depth per lane and items shed so far"""
+        return {
+            "depth": {priority: len(lane) for priority, lane in self._pending.items()},
+            "limits": self.queue_limits,
+            "shed": {f"{priority}_{reason}": count for (priority, reason), count in self.shed_counts.items()}
+        }
+
+    async def drain(self, timeout: Optional[float] = None) -> int:
+        """Wait for the batches running now to finish; returns how many are still running after ``timeout``"""
+        running = [task for task in self._dispatching if task.get_loop() is asyncio.get_running_loop()]
+        if not running:
+            return 0
+        _, still_running = await asyncio.wait(running, timeout=timeout)
+        return len(still_running)
+
+    def _count_shed(self, priority: str, reason: str, count: int = 1):
+        """Record items rejected or dropped"""
+        self._shed[(priority, reason)].inc(count)
+        self.shed_counts[(priority, reason)] += count
+
+    def _ensure_started(self):
+        """Start the batching task on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker and not self._worker.done():
+            return
+
+        # Event loop changed (or first use) - anything queued on the old loop is gone
+        for priority, lane in self._pending.items():
+            self._depth_gauges[priority].dec(len(lane))
+        self._loop = loop
+        self._pending = {priority: deque() for priority in PRIORITIES}
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        """Collect and dispatch batches until cancelled"""
+        while True:
+            # Only start collecting once the model has room for another batch,
+            # so items keep accumulating into the next batch while it is busy
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = self._loop.create_task(self._dispatch_and_release(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch_and_release(self, batch: List):
+        """Dispatch one batch, freeing its concurrency slot once it is through the model"""
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._slots.release()
+
+        try:
+            await self._dispatch(batch, release)
+        except Exception as e:
+            logger.error(f"Unexpected error in {self.name} batcher: {e}")
+        finally:
+            release()
+
+    async def _collect(self) -> List:
+        """Wait for the next batch of queued items, interactive ones first"""
+        interactive, bulk = self._pending[INTERACTIVE], self._pending[BULK]
+        while True:
+            while not interactive and not bulk:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # Give concurrent interactive callers a short window to join the
+            # batch; bulk work arrives in whole submissions and doesn't wait
+            if interactive and len(interactive) < self.max_batch_size and self.max_wait > 0:
+                window_end = self._loop.time() + self.max_wait
+                while len(interactive) < self.max_batch_size:
+                    remaining = window_end - self._loop.time()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+
+            if interactive:
+                batch = self._take(INTERACTIVE, self.max_batch_size)
+            else:
+                batch = self._take(BULK, self.bulk_batch_size)
+            if batch:
+                return batch
+
+    def _take(self, priority: str, size: int) -> List:
+        """Pop up to ``size`` live items from a lane, dropping expired and abandoned ones"""
+        lane = self._pending[priority]
+        batch = []
+        now = time.perf_counter()
+        while lane and len(batch) < size:
+            entry = lane.popleft()
+            self._depth_gauges[priority].dec()
+            future, deadline = entry[1], entry[3]
+            if future.done():
+                continue
+            if deadline is not None and deadline <= now:
+                self._count_shed(priority, "deadline")
+                future.set_exception(DeadlineExceeded())
+                continue
+            batch.append(entry)
+        return batch
+
+    async def _dispatch(self, batch: List, on_model_done: Optional[Callable[[], None]] = None):
+        """Run one batch in the executor and resolve the callers' futures"""
+        # Callers that went away (e.g. client disconnect) don't need a result
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+
+        items = [item for item, _, _, _ in batch]
+        queued_at = [queued for _, _, queued, _ in batch]
+        started = time.perf_counter()
+        try:
+            if self.pipeline is not None:
+                results = await self.pipeline.run(
+                    items, on_start=lambda: self._record_start(items, queued_at), on_model_done=on_model_done
+                )
+            else:
+                results = await self._loop.run_in_executor(self.executor, self._process, items, queued_at)
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"{self.name} batcher returned {len(results)} results for {len(items)} items"
+                )
+        except Exception as e:
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        seconds_per_item = (time.perf_counter() - started) / len(items)
+        if self._seconds_per_item is None:
+            self._seconds_per_item = seconds_per_item
+        else:
+            self._seconds_per_item = 0.8 * self._seconds_per_item + 0.2 * seconds_per_item
+
+        for (_, future, _, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _process(self, items: List, queued_at: List[float]) -> List:
+        """Executor-side entry point: record queue wait, then process the batch"""
+        self._record_start(items, queued_at)
+        return self.process_batch(items)
+
+    def _record_start(self, items: List, queued_at: List[float]):
+        """Record queue wait and batch size as a batch starts on a model thread"""
+        started = time.perf_counter()
+        for queued in queued_at:
+            self._queue_wait.observe(started - queued)
+        self._batch_size.observe(len(items))
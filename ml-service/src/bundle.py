@@ -0,0 +1,160 @@
+"""Model loading: local model bundles and pre-fork preloading.
+
+``python -m src.bundle OUTPUT_DIR`` downloads the configured models once
+and saves them, with their tokenizers, as safetensors in
+``OUTPUT_DIR/<model>/`` plus a ``manifest.json`` recording each model's
+name and hub revision. Point ``MODEL_BUNDLE_DIR`` at the directory (e.g.
+baked into the image) and startup loads from it with memory-mapped
+weights and no hub lookups.
+
+Under gunicorn with ``preload_app`` (see ``gunicorn.conf.py``) the master
+calls ``preload_models`` so that every forked worker shares one copy of
+the weights.
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from src.inference import weight_dtype
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+# (model key, model name) -> (model, tokenizer, version), filled by preload_models
+_preloaded: Dict[Tuple[str, str], Tuple] = {}
+
+_model_init_lock = threading.Lock()
+
+DEFAULT_MODELS = {
+    "emotion": ("EMOTION_MODEL_NAME", "j-hartmann/emotion-english-distilroberta-base"),
+    "abuse": ("ABUSE_MODEL_NAME", "unitary/toxic-bert"),
+}
+
+def bundle_entry(model_key: str, model_name: str, bundle_dir: Optional[str] = None) -> Optional[Dict]:
+    """The bundle's entry for a model, if the bundle has this exact model"""
+    bundle_dir = bundle_dir if bundle_dir is not None else os.getenv("MODEL_BUNDLE_DIR", "")
+    if not bundle_dir:
+        return None
+
+    manifest_path = os.path.join(bundle_dir, MANIFEST)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            entry = json.load(f).get(model_key)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring model bundle at {bundle_dir}: {e}")
+        return None
+
+    if not entry or entry.get("name") != model_name:
+        logger.warning(f"Model bundle at {bundle_dir} has no '{model_name}', loading from the hub")
+        return None
+
+    return {**entry, "path": os.path.join(bundle_dir, entry["path"])}
+
+def preload_models():
+    """Load both configured models into this process before workers fork.
+
+    Forked workers then find them in ``load_pretrained`` and share the
+    weight pages copy-on-write instead of each loading a private copy.
+    Weights are never written after loading, so the pages stay shared.
+    """
+    for model_key, (env, default) in DEFAULT_MODELS.items():
+        model_name = os.getenv(env, default)
+        model, tokenizer, version = load_pretrained(model_key, model_name)
+
+        model.eval()
+        model.requires_grad_(False)
+        _preloaded[(model_key, model_name)] = (model, tokenizer, version)
+        logger.info(f"Preloaded {model_key} model {model_name}")
+
+def release_preloaded(model_key: str, model_name: str):
+    """Forget a preloaded model once it is no longer served, so its memory can be freed"""
+    if _preloaded.pop((model_key, model_name), None) is not None:
+        logger.info(f"Released preloaded {model_key} model {model_name}")
+
+def load_pretrained(model_key: str, model_name: str) -> Tuple[object, object, str]:
+    """Load a model and tokenizer, preferring preloaded weights, then the local bundle.
+
+    Returns ``(model, tokenizer, version)`` where ``version`` is the hub
+    revision the weights came from (``"local"`` if unknown). Weights are
+    loaded straight from memory-mapped safetensors when available instead
+    of being copied into a freshly initialized model, and in half precision
+    for the ``torch-bf16`` / ``torch-fp16`` backends, so an fp32 copy never
+    exists and preloaded half-precision weights stay shared across workers.
+    """
+    if (model_key, model_name) in _preloaded:
+        return _preloaded[(model_key, model_name)]
+
+    entry = bundle_entry(model_key, model_name)
+    if entry:
+        source = entry["path"]
+        options = {"local_files_only": True, "use_safetensors": True}
+        logger.info(f"Loading {model_key} model from bundle {source}")
+    else:
+        source = model_name
+        options = {"cache_dir": os.getenv("MODEL_CACHE_DIR", "./models/cache")}
+
+    tokenizer = AutoTokenizer.from_pretrained(source, **options)
+    dtype = weight_dtype()
+    model_options = {"torch_dtype": dtype} if dtype is not None else {}
+
+    # low_cpu_mem_usage builds the model under accelerate's init_empty_weights,
+    # which patches torch.nn.Module globally; overlapping loads in two threads
+    # would leak the patch, so only this step is serialized
+    with _model_init_lock:
+        model = AutoModelForSequenceClassification.from_pretrained(source, low_cpu_mem_usage=True, **model_options, **options)
+
+    if entry:
+        version = entry.get("revision") or "local"
+    else:
+        version = getattr(model.config, "_commit_hash", None) or "local"
+
+    return model, tokenizer, version
+
+def build_bundle(output_dir: str, models: Dict[str, str]) -> Dict:
+    """Download ``{model_key: model_name}`` and save them as a bundle"""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {}
+
+    for model_key, model_name in models.items():
+        logger.info(f"Bundling {model_key} model {model_name}")
+        cache_dir = os.getenv("MODEL_CACHE_DIR", "./models/cache")
+        tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_dir)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name, cache_dir=cache_dir)
+
+        path = os.path.join(output_dir, model_key)
+        model.save_pretrained(path, safe_serialization=True)
+        tokenizer.save_pretrained(path)
+
+        manifest[model_key] = {
+            "name": model_name,
+            "revision": getattr(model.config, "_commit_hash", None),
+            "path": model_key,
+        }
+
+    with open(os.path.join(output_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+def main():
+    """Entry point"""
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(prog="python -m src.bundle", description="Save the service's models as a local bundle.")
+    parser.add_argument("output", help="Directory to write the bundle to (use as MODEL_BUNDLE_DIR)")
+    args = parser.parse_args()
+
+    models = {key: os.getenv(env, default) for key, (env, default) in DEFAULT_MODELS.items()}
+    manifest = build_bundle(args.output, models)
+    logger.info(f"Bundled {', '.join(entry['name'] for entry in manifest.values())} into {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.metrics import CACHE_LOOKUPS
+from src.utils import preprocess_text
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """Content-addressed cache of analysis results.
+
+    Keys are the ``preprocess_text`` normalization of the input plus a
+    namespace naming the model and its version, so results are never reused
+    across models. Entries live in an in-memory LRU bounded by entry count,
+    estimated bytes and a TTL; an optional SQLite file keeps them across
+    restarts, read on a background thread so lookups never block the event
+    loop. Identical texts being computed concurrently share one computation.
+    """
+
+    def __init__(
+        self,
+        name: str = "results",
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        disk_path: Optional[str] = None
+    ):
+        self.name = name
+        self.enabled = os.getenv("RESULT_CACHE_ENABLED", "True").lower() == "true"
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 50000))
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("RESULT_CACHE_MAX_MB", 64)) * 1024 * 1024)
+        self.ttl = ttl_seconds if ttl_seconds is not None else float(os.getenv("RESULT_CACHE_TTL_SECONDS", 3600))
+        if self.max_entries <= 0 or self.max_bytes <= 0:
+            self.enabled = False
+
+        # key -> (expires_at, size, value), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.inflight_hits = 0
+        self.evictions = 0
+        self._hit_counter = CACHE_LOOKUPS.labels(name, "hit")
+        self._disk_hit_counter = CACHE_LOOKUPS.labels(name, "disk_hit")
+        self._inflight_counter = CACHE_LOOKUPS.labels(name, "inflight")
+        self._miss_counter = CACHE_LOOKUPS.labels(name, "miss")
+
+        self._disk = None
+        disk_path = disk_path if disk_path is not None else os.getenv("RESULT_CACHE_DISK_PATH", "")
+        if self.enabled and disk_path:
+            self._open_disk(disk_path)
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        """Content address for a text under a model namespace"""
+        normalized = preprocess_text(text)
+        return hashlib.sha256(f"{namespace}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Look up a cached result, checking memory then disk.
+
+        The disk read blocks; on the event loop use ``get_or_compute_many``.
+        """
+        if not self.enabled:
+            return None
+
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+
+        if self._disk is not None:
+            value = self._disk_get_many([key]).get(key)
+            if value is not None:
+                self._disk_hit(key, value)
+                return value
+
+        self.misses += 1
+        self._miss_counter.inc()
+        return None
+
+    def set(self, key: str, value: Dict):
+        """Cache a result in memory and, if enabled, on disk"""
+        if not self.enabled:
+            return
+
+        self._store(key, value)
+        if self._disk is not None:
+            self._disk_writer.submit(self._disk_set, key, value)
+
+    async def get_or_compute(self, key: str, item: Any, compute: Callable[[Any], Awaitable[Dict]]) -> Dict:
+        """Return the cached result for ``key`` or compute it once for all concurrent callers"""
+        results = await self.get_or_compute_many(
+            [key], [item], lambda items: self._compute_one(compute, items[0])
+        )
+        return results[0]
+
+    async def get_or_compute_many(
+        self,
+        keys: List[str],
+        items: List[Any],
+        compute_batch: Callable[[List[Any]], Awaitable[List[Dict]]]
+    ) -> List[Dict]:
+        """Resolve many keys, computing only the ones nobody has cached or is computing"""
+        if not self.enabled:
+            return await compute_batch(items)
+
+        loop = asyncio.get_running_loop()
+        results: List[Optional[Dict]] = [None] * len(keys)
+        waiting = []
+        owned: Dict[str, tuple] = {}
+
+        for i, (key, item) in enumerate(zip(keys, items)):
+            if key in owned:
+                # Duplicate within this call
+                waiting.append((i, owned[key][0]))
+                continue
+
+            if key in self._inflight:
+                self.inflight_hits += 1
+                self._inflight_counter.inc()
+                waiting.append((i, self._inflight[key]))
+                continue
+
+            cached = self._memory_get(key)
+            if cached is not None:
+                results[i] = cached
+                continue
+
+            future = loop.create_future()
+            self._inflight[key] = future
+            owned[key] = (future, item)
+            waiting.append((i, future))
+
+        if owned:
+            try:
+                # Keys are registered in flight before the disk read so that
+                # concurrent callers wait on it rather than reading again
+                if self._disk is not None:
+                    found = await loop.run_in_executor(self._disk_reader, self._disk_get_many, list(owned))
+                    for key, value in found.items():
+                        future, _ = owned.pop(key)
+                        self._inflight.pop(key, None)
+                        self._disk_hit(key, value)
+                        future.set_result(value)
+
+                self.misses += len(owned)
+                self._miss_counter.inc(len(owned))
+                computed = await compute_batch([item for _, item in owned.values()]) if owned else []
+            except BaseException as e:
+                for key, (future, _) in owned.items():
+                    self._inflight.pop(key, None)
+                    future.set_exception(e if isinstance(e, Exception) else RuntimeError("Computation cancelled"))
+                    future.exception()  # Mark retrieved; waiters still see it
+                raise
+
+            for (key, (future, _)), result in zip(owned.items(), computed):
+                self._inflight.pop(key, None)
+                # Failed analyses are returned but never cached
+                if "error" not in result:
+                    self.set(key, result)
+                future.set_result(result)
+
+        for i, future in waiting:
+            results[i] = await asyncio.shield(future)
+
+        return results
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "disk_hits": self.disk_hits,
+            "inflight_hits": self.inflight_hits,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "disk_enabled": self._disk is not None
+        }
+
+    async def _compute_one(self, compute: Callable[[Any], Awaitable[Dict]], item: Any) -> List[Dict]:
+        """Adapt a single-item compute function to the batch interface"""
+        return [await compute(item)]
+
+    def _memory_get(self, key: str) -> Optional[Dict]:
+        """Look up an unexpired entry in the memory tier, counting hits"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self._hit_counter.inc()
+        return value
+
+    def _disk_hit(self, key: str, value: Dict):
+        """Count a disk tier hit and promote it to memory"""
+        self.hits += 1
+        self.disk_hits += 1
+        self._disk_hit_counter.inc()
+        self._store(key, value)
+
+    def _store(self, key: str, value: Dict):
+        """Insert into the memory tier, evicting least recently used entries"""
+        if key in self._entries:
+            self._remove(key)
+
+        size = _estimate_size(key) + _estimate_size(value)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self._bytes += size
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        """Drop an entry from the memory tier"""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _open_disk(self, path: str):
+        """Open (or create) the SQLite tier"""
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            self._disk = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute("PRAGMA synchronous=NORMAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._disk.execute("DELETE FROM results WHERE expires_at < ?", (time.time(),))
+            self._disk_lock = threading.Lock()
+
+            # Reads and writes happen off the request path; with WAL the reader's
+            # own connection never waits for a write in progress
+            self._disk_read_conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._disk_read_lock = threading.Lock()
+            self._disk_reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.name}-cache-reader")
+            self._disk_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.name}-cache-writer")
+            logger.info(f"Result cache '{self.name}' persisting to {path}")
+
+        except Exception as e:
+            logger.error(f"Failed to open result cache at {path}, continuing in memory only: {e}")
+            self._disk = None
+
+    def _disk_get_many(self, keys: List[str]) -> Dict[str, Dict]:
+        """Read the unexpired entries for ``keys`` from the SQLite tier"""
+        found = {}
+        try:
+            now = time.time()
+            with self._disk_read_lock:
+                # Stay under SQLite's bound-parameter limit
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    rows = self._disk_read_conn.execute(
+                        f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(chunk))}) AND expires_at >= ?",
+                        (*chunk, now)
+                    ).fetchall()
+                    found.update((key, json.loads(value)) for key, value in rows)
+
+        except Exception as e:
+            logger.error(f"Error reading result cache: {e}")
+        return found
+
+    def _disk_set(self, key: str, value: Dict):
+        """Write an entry to the SQLite tier"""
+        try:
+            payload = json.dumps(value)
+            with self._disk_lock:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, payload, time.time() + self.ttl)
+                )
+
+        except Exception as e:
+            logger.error(f"Error writing result cache: {e}")
+
+def _estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a cached result, in bytes"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_estimate_size(v) for v in value)
+    return size
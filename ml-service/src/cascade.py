@@ -0,0 +1,272 @@
+"""Cheap first-stage classifier that answers easy messages without the transformers.
+
+A hashed word and character n-gram linear model per analyzer, trained on
+transformer labels. At serving time (``CASCADE_MODEL_PATH``) a text whose
+cascade confidence clears the model's gate is answered directly; everything
+else is escalated to the transformer. For abuse only confidently *benign*
+texts are answered, so anything that might be abusive always gets the
+transformer's verdict.
+
+Train it on a corpus and the output of a bulk scoring run over it:
+
+    python -m src.batch corpus.jsonl labels.jsonl
+    python -m src.cascade train corpus.jsonl labels.jsonl --output cascade.joblib
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import FeatureUnion
+
+from src.admission import BULK, request_class
+from src.metrics import CASCADE_AUDITS
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+REPORT_GATES = (0.8, 0.9, 0.95, 0.98, 0.99)
+
+class CascadeScores(NamedTuple):
+    """Both heads' probabilities for a list of texts"""
+    emotion: np.ndarray  # (n_texts, n_emotions), columns in emotion_labels order
+    abusive: np.ndarray  # (n_texts,) probability that each text is abusive
+
+def build_vectorizer(n_features: int = 2 ** 17) -> FeatureUnion:
+    """Stateless hashed word 1-2 grams plus character 2-4 grams"""
+    return FeatureUnion([
+        ("words", HashingVectorizer(ngram_range=(1, 2), n_features=n_features, alternate_sign=False)),
+        ("chars", HashingVectorizer(analyzer="char_wb", ngram_range=(2, 4), n_features=n_features, alternate_sign=False)),
+    ])
+
+class CascadeClassifier:
+    """Emotion and abuse heads over one shared hashed n-gram featurization"""
+
+    def __init__(self, vectorizer, emotion_model, abuse_model, metadata: Optional[Dict] = None):
+        self.vectorizer = vectorizer
+        self.emotion_model = emotion_model
+        self.abuse_model = abuse_model
+        self.emotion_labels = [str(label) for label in emotion_model.classes_]
+        self.metadata = metadata or {}
+
+        self.emotion_gate = float(os.getenv("CASCADE_EMOTION_GATE", 0.9))
+        self.abuse_gate = float(os.getenv("CASCADE_ABUSE_GATE", 0.95))
+        self.audit_rate = float(os.getenv("CASCADE_AUDIT_RATE", 0.01))
+
+        # Column of the "abusive" class in predict_proba
+        self._abusive_column = list(abuse_model.classes_).index(True) if True in abuse_model.classes_ else None
+
+    def predict(self, texts: List[str]) -> CascadeScores:
+        """Score both heads from a single featurization of the texts"""
+        features = self.vectorizer.transform(texts)
+        emotion = self.emotion_model.predict_proba(features)
+
+        if self._abusive_column is None:
+            abusive = np.zeros(len(texts))
+        else:
+            abusive = self.abuse_model.predict_proba(features)[:, self._abusive_column]
+
+        return CascadeScores(emotion, abusive)
+
+    def save(self, path: str):
+        """Write the model with joblib"""
+        joblib.dump({
+            "format_version": FORMAT_VERSION,
+            "vectorizer": self.vectorizer,
+            "emotion_model": self.emotion_model,
+            "abuse_model": self.abuse_model,
+            "metadata": self.metadata,
+        }, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CascadeClassifier":
+        """Read a model written by ``save``"""
+        state = joblib.load(path)
+        if state.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported cascade model format in {path}")
+        return cls(state["vectorizer"], state["emotion_model"], state["abuse_model"], state["metadata"])
+
+@lru_cache(maxsize=None)
+def _load_cached(path: str) -> CascadeClassifier:
+    return CascadeClassifier.load(path)
+
+def load_cascade() -> Optional[CascadeClassifier]:
+    """The configured cascade (shared by both analyzers), or None if disabled"""
+    path = os.getenv("CASCADE_MODEL_PATH", "")
+    if not path:
+        return None
+
+    try:
+        cascade = _load_cached(path)
+        logger.info(f"Cascade classifier loaded from {path}")
+        return cascade
+    except Exception as e:
+        logger.error(f"Failed to load cascade classifier from {path}, every text will use the transformers: {e}")
+        return None
+
+# Featurization is CPU work, kept off the event loop
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cascade")
+
+async def score_cascade(cascade: CascadeClassifier, texts: List[str]) -> CascadeScores:
+    """Score texts with the cascade on its executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, cascade.predict, texts)
+
+# Background audit tasks, referenced so they aren't garbage collected mid-flight
+_audit_tasks = set()
+
+def audit_sample(
+    model: str,
+    texts: List[str],
+    results: List[Dict],
+    run_transformer: Callable[[List[str]], Awaitable[List[Dict]]],
+    field: str,
+    rate: float
+):
+    """Re-check a random sample of cascade answers against the transformer in the background.
+
+    Agreement on ``field`` is counted in ``ml_cascade_audits_total``.
+    """
+    sample = [(text, result) for text, result in zip(texts, results) if random.random() < rate]
+    if not sample:
+        return
+
+    task = asyncio.get_running_loop().create_task(_compare_with_transformer(model, sample, run_transformer, field))
+    _audit_tasks.add(task)
+    task.add_done_callback(_audit_tasks.discard)
+
+async def _compare_with_transformer(model: str, sample: List[Tuple[str, Dict]], run_transformer, field: str):
+    """Score the sampled texts with the transformer and count agreements"""
+    try:
+        # Audits are never more urgent than real traffic
+        with request_class(BULK):
+            checked = await run_transformer([text for text, _ in sample])
+    except Exception as e:
+        logger.error(f"Cascade audit for {model} failed: {e}")
+        return
+
+    for (_, answer), result in zip(sample, checked):
+        if "error" not in result:
+            CASCADE_AUDITS.labels(model, "agree" if answer[field] == result[field] else "disagree").inc()
+
+def train_cascade(
+    texts: List[str],
+    emotions: List[str],
+    abusive: List[bool],
+    holdout: float = 0.1,
+    seed: int = 0
+) -> Tuple[CascadeClassifier, Dict]:
+    """Fit both heads on transformer labels and report gate coverage and agreement on a holdout"""
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(texts))
+    split = int(len(texts) * (1 - holdout)) if holdout > 0 else len(texts)
+    train, test = order[:split], order[split:]
+
+    vectorizer = build_vectorizer()
+    features = vectorizer.transform(texts)
+    emotions = np.array(emotions)
+    abusive = np.array(abusive, dtype=bool)
+
+    emotion_model = SGDClassifier(loss="log_loss", alpha=1e-6, max_iter=30, tol=None, random_state=seed)
+    emotion_model.fit(features[train], emotions[train])
+    abuse_model = SGDClassifier(loss="log_loss", alpha=1e-6, max_iter=30, tol=None, random_state=seed)
+    abuse_model.fit(features[train], abusive[train])
+
+    cascade = CascadeClassifier(vectorizer, emotion_model, abuse_model)
+    report = {"train_size": len(train), "holdout_size": len(test)}
+
+    if len(test):
+        scores = cascade.predict([texts[i] for i in test])
+        predicted = np.array(cascade.emotion_labels)[scores.emotion.argmax(axis=1)]
+
+        report["emotion"] = _gate_report(scores.emotion.max(axis=1), predicted == emotions[test])
+        # Abuse answers are always "not abusive", right when the transformer agrees
+        report["abuse"] = _gate_report(1 - scores.abusive, ~abusive[test])
+
+    cascade.metadata = {"report": report, "emotion_labels": cascade.emotion_labels}
+    return cascade, report
+
+def _gate_report(confidence: np.ndarray, correct: np.ndarray) -> Dict[str, Dict]:
+    """Share of texts each gate answers, and how often those answers match the transformer"""
+    report = {}
+    for gate in REPORT_GATES:
+        answered = confidence >= gate
+        report[str(gate)] = {
+            "coverage": round(float(answered.mean()), 4),
+            "agreement": round(float(correct[answered].mean()), 4) if answered.any() else None,
+        }
+    return report
+
+def load_training_data(corpus: str, labels: str, text_field: str, id_field: str) -> Tuple[List[str], List[str], List[bool]]:
+    """Join a corpus with bulk-scoring output (``python -m src.batch``) on record id"""
+    from src.batch import read_records
+
+    scores = {}
+    with open(labels, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                if not row.get("error"):
+                    scores[str(row["id"])] = row
+
+    input_format = "csv" if corpus.lower().endswith(".csv") else "jsonl"
+    texts, emotions, abusive = [], [], []
+    position = 0
+    for chunk in read_records(corpus, input_format, chunk_size=1000):
+        for record in chunk:
+            position += 1
+            # Same id fallback as the bulk scorer: 1-based position in the input
+            record_id = record.get(id_field)
+            if record_id is None or record_id == "":
+                record_id = position
+
+            row = scores.get(str(record_id))
+            text = record.get(text_field)
+            if row is None or not isinstance(text, str) or not text.strip():
+                continue
+
+            texts.append(text)
+            emotions.append(row["emotion"])
+            abusive.append(bool(row["abuse_detected"]))
+
+    return texts, emotions, abusive
+
+def main(argv: Optional[List[str]] = None):
+    """Entry point"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(prog="python -m src.cascade", description="Train the cascade classifier.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train = subparsers.add_parser("train", help="Fit on a corpus labelled by python -m src.batch")
+    train.add_argument("corpus", help="JSONL or CSV corpus that was scored")
+    train.add_argument("labels", help="JSONL output of python -m src.batch for the corpus")
+    train.add_argument("--output", required=True, help="Where to write the model (use as CASCADE_MODEL_PATH)")
+    train.add_argument("--text-field", default="text")
+    train.add_argument("--id-field", default="id")
+    train.add_argument("--holdout", type=float, default=0.1, help="Fraction held out for the gate report")
+    args = parser.parse_args(argv)
+
+    texts, emotions, abusive = load_training_data(args.corpus, args.labels, args.text_field, args.id_field)
+    if not texts:
+        raise SystemExit("No labelled texts found; do the corpus and label ids match?")
+    logger.info(f"Training cascade on {len(texts)} labelled texts")
+
+    cascade, report = train_cascade(texts, emotions, abusive, holdout=args.holdout)
+    cascade.save(args.output)
+
+    for head in ("emotion", "abuse"):
+        for gate, stats in report.get(head, {}).items():
+            logger.info(f"{head} gate {gate}: answers {stats['coverage']:.1%}, agreement {stats['agreement']}")
+    logger.info(f"Cascade written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+import torch
+import numpy as np
+import copy
+import functools
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from src.metrics import BATCH_SIZE, FORWARD, TOKENIZE
+from src.profiling import measure_peak_memory, profile_forward
+
+logger = logging.getLogger(__name__)
+
+# Models loaded per server process (emotion + abuse)
+MODELS_PER_PROCESS = 2
+
+INFERENCE_BACKENDS = ("torch", "torch-int8", "torch-bf16", "torch-fp16", "onnx")
+
+# Backends that keep weights and activations in half precision
+HALF_PRECISION_BACKENDS = {"torch-bf16": torch.bfloat16, "torch-fp16": torch.float16}
+
+def create_model_executor(model_key: str) -> ThreadPoolExecutor:
+    """Create the dedicated thread pool that runs one model's forward passes.
+
+    Settings are read from ``<MODEL_KEY>_EXECUTOR_WORKERS`` and
+    ``<MODEL_KEY>_TORCH_THREADS`` (falling back to ``MODEL_EXECUTOR_WORKERS``
+    and ``TORCH_THREADS_PER_MODEL``). Each pool thread pins its own torch
+    intra-op thread count, so both models and every server process get a
+    share of the cores rather than all assuming they own the machine.
+    """
+    workers, torch_threads = model_thread_settings(model_key)
+
+    logger.info(f"{model_key.lower()} executor: {workers} thread(s) x {torch_threads} torch thread(s)")
+
+    return ThreadPoolExecutor(
+        max_workers=workers,
+        thread_name_prefix=f"{model_key.lower()}-model",
+        initializer=torch.set_num_threads,
+        initargs=(torch_threads,)
+    )
+
+def model_thread_settings(model_key: str) -> Tuple[int, int]:
+    """Executor threads and intra-op threads per executor thread for one model"""
+    workers = max(1, int(os.getenv(f"{model_key}_EXECUTOR_WORKERS", os.getenv("MODEL_EXECUTOR_WORKERS", 1))))
+    torch_threads = int(os.getenv(f"{model_key}_TORCH_THREADS", os.getenv("TORCH_THREADS_PER_MODEL", 0)))
+    if torch_threads <= 0:
+        torch_threads = default_torch_threads(workers)
+
+    return workers, torch_threads
+
+def default_torch_threads(executor_workers: int) -> int:
+    """Split the available cores across server processes, models and executor threads"""
+    if hasattr(os, "sched_getaffinity"):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = os.cpu_count() or 1
+
+    processes = max(1, int(os.getenv("NUM_WORKERS", 1)))
+    return max(1, cores // (processes * MODELS_PER_PROCESS * executor_workers))
+
+def plan_batches(lengths: List[int], max_tokens: int, max_items: int, sort: bool = True) -> List[List[int]]:
+    """Group item indices into batches whose padded size fits a token budget.
+
+    With ``sort`` the items are ordered by length first, so each batch holds
+    similarly sized inputs. A batch's padded size is its longest item times
+    its item count; an item longer than ``max_tokens`` on its own still gets
+    a batch of one.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__) if sort else range(len(lengths))
+
+    batches = []
+    current = []
+    longest = 0
+    for i in order:
+        candidate_longest = max(longest, lengths[i])
+        if current and (len(current) >= max_items or candidate_longest * (len(current) + 1) > max_tokens):
+            batches.append(current)
+            current = []
+            candidate_longest = lengths[i]
+
+        current.append(i)
+        longest = candidate_longest
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+class EncodedTexts(NamedTuple):
+    """Texts tokenized and padded into forward batches of (row indices, model inputs)"""
+    count: int
+    batches: List[Tuple[List[int], Dict[str, np.ndarray]]]
+
+class SequenceClassifier:
+    """Batched text classification over a Hugging Face sequence classification model.
+
+    Replaces ``transformers.pipeline`` for our analyzers: texts are tokenized
+    and run as padded tensor batches, and the label probabilities come back
+    as one NumPy array so post-processing can be vectorized.
+
+    Inputs are sorted by token length and grouped so that each forward
+    pass pads to at most ``max_batch_tokens`` (``MAX_BATCH_TOKENS``) tokens
+    and ``batch_size`` (``MAX_BATCH_ITEMS``) texts; one long message no
+    longer inflates the padding of every short one batched with it.
+
+    ``backend`` (default ``INFERENCE_BACKEND``) picks how the forward pass
+    runs: ``torch`` (fp32), ``torch-int8`` (dynamically quantized Linear
+    layers), ``torch-bf16`` / ``torch-fp16`` (half-precision weights and
+    activations; falls back to fp32 if this torch build can't run the model
+    in that precision, as with fp16 on most CPUs) or ``onnx`` (exported
+    once, then run with ONNX Runtime). ``torch-int8`` and ``onnx`` are CPU
+    only. All of them produce the same probabilities up to numerical
+    tolerance.
+
+    ``predict`` is ``encode`` (tokenize and pad) followed by
+    ``forward_encoded``; ``src.pipeline`` runs the two on different threads.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        device: int = -1,
+        batch_size: int = None,
+        max_batch_tokens: int = None,
+        max_length: int = None,
+        backend: str = None,
+        num_threads: int = None,
+        name: str = "model"
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = torch.device(f"cuda:{device}" if device >= 0 else "cpu")
+        self.batch_size = max(1, batch_size or int(os.getenv("MAX_BATCH_ITEMS", 64)))
+        self.max_batch_tokens = max(1, max_batch_tokens or int(os.getenv("MAX_BATCH_TOKENS", 4096)))
+        self.length_bucketing = os.getenv("LENGTH_BUCKETING", "True").lower() == "true"
+        self.max_length = max_length or min(getattr(tokenizer, "model_max_length", 512), 512)
+        self.backend = (backend or os.getenv("INFERENCE_BACKEND", "torch")).lower()
+        self.session = None
+        self.name = name
+
+        if self.backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown INFERENCE_BACKEND '{self.backend}' (expected one of {', '.join(INFERENCE_BACKENDS)})")
+        if self.backend != "torch" and self.device.type != "cpu":
+            raise ValueError(f"INFERENCE_BACKEND={self.backend} only supports CPU inference")
+
+        config = model.config
+        self.labels = [config.id2label[i] for i in range(config.num_labels)]
+
+        # Same activation choice the text-classification pipeline makes
+        if config.problem_type == "multi_label_classification" or config.num_labels == 1:
+            self.activation = "sigmoid"
+        else:
+            self.activation = "softmax"
+
+        self.model.to(self.device)
+        self.model.eval()
+
+        if self.backend == "torch-int8":
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif self.backend in HALF_PRECISION_BACKENDS:
+            self._to_half_precision(HALF_PRECISION_BACKENDS[self.backend])
+        elif self.backend == "onnx":
+            self.session = self._load_onnx_session(num_threads)
+
+        # Bound once so recording a sample is just an observe()
+        self._tokenize_time = TOKENIZE.labels(name)
+        self._forward_time = FORWARD.labels(name, self.backend)
+        self._forward_batch_size = BATCH_SIZE.labels(name, "forward")
+        # Measured by warmup()
+        self.peak_activation_bytes = None
+
+    def predict(self, texts: List[str]) -> np.ndarray:
+        """Return an (n_texts, n_labels) array of label probabilities, in input order"""
+        return self.forward_encoded(self.encode(texts))
+
+    def encode(self, texts: List[str]) -> EncodedTexts:
+        """Tokenize texts and pad them into planned forward batches (everything before the model)"""
+        if not texts:
+            return EncodedTexts(0, [])
+
+        started = time.perf_counter()
+        encoded = self._tokenize(texts)
+        self._tokenize_time.observe(time.perf_counter() - started)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+
+        batches = [
+            (indices, self._pad(encoded, indices))
+            for indices in plan_batches(lengths, self.max_batch_tokens, self.batch_size, sort=self.length_bucketing)
+        ]
+        return EncodedTexts(len(texts), batches)
+
+    def forward_encoded(self, encoded: EncodedTexts) -> np.ndarray:
+        """Run ``encode``'s batches through the model, returning probabilities in input order"""
+        return profile_forward(self.name, self._forward_batches, encoded)
+
+    def _forward_batches(self, encoded: EncodedTexts) -> np.ndarray:
+        probs = np.empty((encoded.count, len(self.labels)), dtype=np.float32)
+        for indices, batch in encoded.batches:
+            started = time.perf_counter()
+            logits = self._forward(batch)
+            self._forward_time.observe(time.perf_counter() - started)
+            self._forward_batch_size.observe(len(indices))
+            probs[indices] = self._activate(logits)
+
+        return probs
+
+    def warmup(self, lengths: List[int] = None):
+        """Run dummy batches at representative token lengths.
+
+        The first forward pass at a new shape pays for lazy allocation,
+        kernel selection and (for ONNX Runtime) graph optimization; doing it
+        here keeps that cost out of the first real requests. Lengths default
+        to ``WARMUP_LENGTHS``.
+        """
+        if lengths is None:
+            lengths = [int(n) for n in os.getenv("WARMUP_LENGTHS", "16,64,256,512").split(",") if n.strip()]
+
+        for length in lengths:
+            length = min(length, self.max_length)
+            text = self._filler_text(length)
+            # A single item and a full token budget's worth of items
+            self.predict([text])
+            self.predict([text] * max(1, min(self.batch_size, self.max_batch_tokens // length)))
+
+        if self.session is None:
+            self.measure_activation_memory()
+
+    def measure_activation_memory(self) -> int:
+        """Peak bytes allocated by one forward batch filling the token budget, the most any batch can take.
+
+        ``MAX_BATCH_TOKENS`` (and ``MAX_BATCH_ITEMS``) therefore cap the
+        activation memory; lower them to trade throughput for a smaller
+        memory floor.
+        """
+        length = min(self.max_length, self.max_batch_tokens)
+        rows = max(1, min(self.batch_size, self.max_batch_tokens // length))
+        encoded = self.encode([self._filler_text(length)] * rows)
+        _, self.peak_activation_bytes = measure_peak_memory(self._forward_batches, encoded)
+        return self.peak_activation_bytes
+
+    def memory_stats(self) -> Dict[str, Optional[int]]:
+        """Bytes held by the weights and the most one forward batch allocates (None until warmed up)"""
+        return {
+            "backend": self.backend,
+            "parameter_bytes": tensor_bytes(self.model),
+            "peak_activation_bytes": self.peak_activation_bytes,
+            "max_batch_tokens": self.max_batch_tokens,
+        }
+
+    def _filler_text(self, length: int) -> str:
+        """Text of roughly ``length`` tokens: any ordinary token repeated"""
+        word = next(
+            (token for token in self.tokenizer.get_vocab() if token.isascii() and token.isalpha() and len(token) > 2),
+            "hello"
+        )
+        return " ".join([word] * max(1, length - 2))
+
+    def _to_half_precision(self, dtype: torch.dtype):
+        """Serve the model in ``dtype``, or stay in fp32 if it can't run in it here.
+
+        The model passed in is never modified: it may be the preloaded instance
+        shared with other workers, and casting half-precision weights back to
+        fp32 would not restore them. fp32 weights are cast on a copy, so the
+        original serves unchanged if the copy fails its check.
+        """
+        if not half_precision_supported(dtype):
+            logger.warning(f"{self.name}: {self.backend} is not supported by this torch build; serving in fp32")
+            self.backend = "torch"
+            return
+
+        loaded_in_half = next(self.model.parameters()).dtype == dtype
+        half_model = self.model if loaded_in_half else copy.deepcopy(self.model).to(dtype)
+        try:
+            sample = self.tokenizer(["half precision check"], return_tensors="pt").to(self.device)
+            with torch.inference_mode():
+                half_model(**sample)
+        except RuntimeError as e:
+            if loaded_in_half:
+                # The fp32 weights are gone; weight_dtype() only picks dtypes that passed the operator probe
+                raise RuntimeError(f"{self.name} can't run in {self.backend} here ({e}); set INFERENCE_BACKEND=torch") from e
+            logger.warning(f"{self.name}: {self.backend} is not supported for this model ({e}); serving in fp32")
+            self.backend = "torch"
+            return
+        self.model = half_model
+
+    def _tokenize(self, texts: List[str]) -> Dict[str, List[List[int]]]:
+        """Truncate and tokenize texts without padding"""
+        return self.tokenizer(texts, truncation=True, max_length=self.max_length)
+
+    def _pad(self, encoded, indices: List[int]) -> Dict[str, np.ndarray]:
+        """Pad the selected tokenized texts into one batch of model inputs"""
+        longest = max(len(encoded["input_ids"][i]) for i in indices)
+        pad_left = getattr(self.tokenizer, "padding_side", "right") == "left"
+        pad_values = {"input_ids": self.tokenizer.pad_token_id or 0}
+
+        batch = {}
+        for name in encoded.keys():
+            array = np.full((len(indices), longest), pad_values.get(name, 0), dtype=np.int64)
+            for row, i in enumerate(indices):
+                values = encoded[name][i]
+                if pad_left:
+                    array[row, longest - len(values):] = values
+                else:
+                    array[row, :len(values)] = values
+            batch[name] = array
+
+        return batch
+
+    def _forward(self, batch: Dict[str, np.ndarray]) -> np.ndarray:
+        """Run one padded batch through the model and return raw logits"""
+        if self.session:
+            feeds = {name: batch[name] for name in self.input_names}
+            return self.session.run(None, feeds)[0].astype(np.float32)
+
+        inputs = {name: torch.from_numpy(array).to(self.device) for name, array in batch.items()}
+        with torch.inference_mode():
+            logits = self.model(**inputs).logits
+
+        return logits.float().cpu().numpy()
+
+    def _activate(self, logits: np.ndarray) -> np.ndarray:
+        """Turn raw logits into probabilities"""
+        if self.activation == "sigmoid":
+            return 1.0 / (1.0 + np.exp(-logits))
+
+        shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return shifted / shifted.sum(axis=1, keepdims=True)
+
+    def _load_onnx_session(self, num_threads: int = None):
+        """Export the model to ONNX (once) and open an ONNX Runtime session on it"""
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("INFERENCE_BACKEND=onnx requires the onnxruntime package")
+
+        path = self._export_onnx()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in session.get_inputs()]
+
+        logger.info(f"Loaded ONNX model from {path}")
+        return session
+
+    def _export_onnx(self) -> str:
+        """Export the model to the ONNX cache directory unless already there"""
+        config = self.model.config
+        export_dir = os.getenv("ONNX_EXPORT_DIR") or os.path.join(os.getenv("MODEL_CACHE_DIR", "./models/cache"), "onnx")
+        model_id = re.sub(r"[^A-Za-z0-9_.-]+", "_", config.name_or_path or config.model_type).strip("_")
+        version = (getattr(config, "_commit_hash", None) or "local")[:12]
+        path = os.path.join(export_dir, f"{model_id}-{version}.onnx")
+
+        if os.path.exists(path):
+            return path
+
+        os.makedirs(export_dir, exist_ok=True)
+        logger.info(f"Exporting {config.name_or_path} to ONNX: {path}")
+
+        input_names = [name for name in self.tokenizer.model_input_names if name in ("input_ids", "attention_mask", "token_type_ids")]
+        sample = self.tokenizer(["export sample text"], return_tensors="pt")
+        args = tuple(sample[name] for name in input_names)
+
+        # Write to a temporary file first so a crash never leaves a half-written model
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.onnx.export(
+            _LogitsOnly(self.model, input_names),
+            args,
+            tmp_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in input_names}, "logits": {0: "batch"}},
+            opset_version=14
+        )
+        os.replace(tmp_path, path)
+
+        return path
+
+def weight_dtype(backend: str = None) -> Optional[torch.dtype]:
+    """The dtype to load weights in for ``backend`` (default ``INFERENCE_BACKEND``); None for fp32.
+
+    Half-precision dtypes this torch build can't run load in fp32 instead.
+    """
+    dtype = HALF_PRECISION_BACKENDS.get((backend or os.getenv("INFERENCE_BACKEND", "torch")).lower())
+    return dtype if dtype is not None and half_precision_supported(dtype) else None
+
+@functools.lru_cache(maxsize=None)
+def half_precision_supported(dtype: torch.dtype) -> bool:
+    """Whether the CPU operators of a transformer encoder run in ``dtype`` (fp16 LayerNorm often doesn't)"""
+    embedding = torch.nn.Embedding(4, 8).to(dtype)
+    layer = torch.nn.Sequential(torch.nn.Linear(8, 8), torch.nn.LayerNorm(8), torch.nn.GELU(), torch.nn.Tanh()).to(dtype)
+    try:
+        with torch.inference_mode():
+            hidden = layer(embedding(torch.tensor([[0, 1, 2]])))
+            torch.softmax(hidden @ hidden.transpose(-1, -2), dim=-1)
+    except RuntimeError:
+        return False
+    return True
+
+def tensor_bytes(model) -> int:
+    """Bytes held by a model's parameters and buffers, including packed quantized weights"""
+    seen = set()
+    total = 0
+    # Non-persistent buffers (e.g. position ids) are resident but not in the state dict
+    for value in list(model.state_dict().values()) + list(model.buffers()):
+        for tensor in value if isinstance(value, tuple) else (value,):
+            if not isinstance(tensor, torch.Tensor) or tensor.data_ptr() in seen:
+                continue
+            seen.add(tensor.data_ptr())
+            total += tensor.nelement() * tensor.element_size()
+    return total
+
+class _LogitsOnly(torch.nn.Module):
+    """Positional-argument wrapper that returns only logits, for ONNX export"""
+
+    def __init__(self, model, input_names: List[str]):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs))).logits
@@ -0,0 +1,315 @@
+"""Asynchronous re-analysis jobs backed by a durable SQLite queue.
+
+``POST /jobs`` stores a set of ``{id, text}`` items and answers with a job
+id straight away. A background runner scores the items in chunks of
+``JOB_CHUNK_SIZE`` through the batched path at bulk priority, and
+``GET /jobs/{id}`` and ``GET /jobs/{id}/results`` report progress and page
+through the results. Jobs, items and results live in ``JOBS_DB_PATH``, so
+they survive restarts.
+
+Every server process runs a runner against the same file. A runner leases
+a job for ``JOB_LEASE_SECONDS`` while it scores one chunk and commits the
+results together with the job's position, so a chunk is never scored by
+two processes and a process that dies mid-chunk only loses that chunk's
+work. Active jobs take turns chunk by chunk, so a small job doesn't wait
+for a large one to finish.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.admission import BULK, DeadlineExceeded, QueueFull, request_class
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, updated_at);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    item_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    result TEXT,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+class JobStore:
+    """Jobs and their items in SQLite; not thread-safe, used from one thread"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # Other server processes write to the same file
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(SCHEMA)
+
+    def create(self, job_id: str, items: List[Tuple[Any, str]], now: float) -> Dict:
+        """Store a new queued job; items are (id, text) pairs"""
+        with self._transaction():
+            self._db.execute(
+                "INSERT INTO jobs (id, status, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, len(items), now, now)
+            )
+            self._db.executemany(
+                "INSERT INTO job_items (job_id, position, item_id, text) VALUES (?, ?, ?, ?)",
+                ((job_id, position, json.dumps(item_id), text) for position, (item_id, text) in enumerate(items))
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """A job's status and progress"""
+        row = self._db.execute(
+            "SELECT id, status, total, processed, failed, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        keys = ("job_id", "status", "total", "processed", "failed", "created_at", "started_at", "finished_at")
+        return dict(zip(keys, row))
+
+    def results(self, job_id: str, offset: int, limit: int) -> List[Dict]:
+        """Scored items from position ``offset`` on, in submission order"""
+        rows = self._db.execute(
+            "SELECT position, item_id, result FROM job_items "
+            "WHERE job_id = ? AND position >= ? AND result IS NOT NULL ORDER BY position LIMIT ?",
+            (job_id, offset, limit)
+        ).fetchall()
+        return [
+            {"position": position, "id": json.loads(item_id), **json.loads(result)}
+            for position, item_id, result in rows
+        ]
+
+    def cancel(self, job_id: str, now: float) -> Optional[Dict]:
+        """Stop a queued or running job; results scored so far are kept"""
+        self._db.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+            (CANCELLED, now, now, job_id, QUEUED, RUNNING)
+        )
+        return self.get(job_id)
+
+    def claim_chunk(self, owner: str, now: float, lease_seconds: float, size: int) -> Optional[Tuple[str, List[Tuple[int, str]]]]:
+        """Lease the least recently worked-on active job and return its next unscored items.
+
+        Jobs with nothing left are marked completed on the way.
+        """
+        with self._transaction():
+            while True:
+                row = self._db.execute(
+                    "SELECT id, processed FROM jobs WHERE status IN (?, ?) AND (owner IS NULL OR lease_until < ?) "
+                    "ORDER BY updated_at LIMIT 1",
+                    (QUEUED, RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    return None
+
+                job_id, processed = row
+                items = self._db.execute(
+                    "SELECT position, text FROM job_items WHERE job_id = ? AND position >= ? ORDER BY position LIMIT ?",
+                    (job_id, processed, size)
+                ).fetchall()
+                if not items:
+                    self._db.execute(
+                        "UPDATE jobs SET status = ?, finished_at = ?, updated_at = ?, owner = NULL WHERE id = ?",
+                        (COMPLETED, now, now, job_id)
+                    )
+                    continue
+
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, started_at = COALESCE(started_at, ?), owner = ?, lease_until = ? "
+                    "WHERE id = ?",
+                    (RUNNING, now, owner, now + lease_seconds, job_id)
+                )
+                return job_id, items
+
+    def save_chunk(self, job_id: str, owner: str, results: List[Tuple[int, Dict]], now: float) -> bool:
+        """Store a chunk's results and release the lease; False if the lease was lost or the job cancelled"""
+        with self._transaction():
+            row = self._db.execute(
+                "SELECT processed FROM jobs WHERE id = ? AND owner = ? AND status = ?", (job_id, owner, RUNNING)
+            ).fetchone()
+            if row is None:
+                return False
+
+            self._db.executemany(
+                "UPDATE job_items SET result = ? WHERE job_id = ? AND position = ?",
+                ((json.dumps(result), job_id, position) for position, result in results)
+            )
+            failed = sum(1 for _, result in results if "error" in result)
+            self._db.execute(
+                "UPDATE jobs SET processed = ?, failed = failed + ?, updated_at = ?, owner = NULL, lease_until = NULL "
+                "WHERE id = ?",
+                (results[-1][0] + 1, failed, now, job_id)
+            )
+            return True
+
+    def release(self, job_id: str, owner: str):
+        """Give up a lease without saving anything"""
+        self._db.execute("UPDATE jobs SET owner = NULL, lease_until = NULL WHERE id = ? AND owner = ?", (job_id, owner))
+
+    def purge(self, finished_before: float) -> int:
+        """Delete finished jobs (and their results) that finished before the cutoff"""
+        with self._transaction():
+            expired = [
+                job_id for (job_id,) in self._db.execute(
+                    "SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (COMPLETED, CANCELLED, finished_before)
+                )
+            ]
+            for job_id in expired:
+                self._db.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+                self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return len(expired)
+
+    def close(self):
+        self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT, rolled back on error"""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+class JobRunner:
+    """Accepts jobs and scores them in the background of one server process"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("JOBS_DB_PATH", "./data/jobs.db")
+        self.chunk_size = max(1, int(os.getenv("JOB_CHUNK_SIZE", 256)))
+        self.max_items = max(1, int(os.getenv("JOB_MAX_ITEMS", 100000)))
+        self.lease_seconds = float(os.getenv("JOB_LEASE_SECONDS", 300))
+        self.poll_seconds = float(os.getenv("JOB_POLL_SECONDS", 2))
+        self.retention = float(os.getenv("JOB_RETENTION_HOURS", 24)) * 3600
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        # Every database call runs on this thread, off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs-db")
+        self.store = self._executor.submit(JobStore, self.path).result()
+        self._wakeup = None
+        self._task = None
+
+    def start(self, emotion_analyzer, abuse_detector):
+        """Start scoring jobs with the given analyzers"""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run(emotion_analyzer, abuse_detector))
+        logger.info(f"Job runner {self.owner} processing jobs from {self.path}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, items: List[Tuple[Any, str]]) -> Dict:
+        """Queue a job of (id, text) items"""
+        job = await self._db(self.store.create, uuid.uuid4().hex, items, time.time())
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await self._db(self.store.get, job_id)
+
+    async def results(self, job_id: str, offset: int, limit: int) -> List[Dict]:
+        return await self._db(self.store.results, job_id, offset, limit)
+
+    async def cancel(self, job_id: str) -> Optional[Dict]:
+        return await self._db(self.store.cancel, job_id, time.time())
+
+    async def _db(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _run(self, emotion_analyzer, abuse_detector):
+        """Score chunks until cancelled, sleeping while there is nothing to do"""
+        from src.analyzer import analyze_texts
+
+        last_purge = 0.0
+        while True:
+            try:
+                claimed = await self._db(self.store.claim_chunk, self.owner, time.time(), self.lease_seconds, self.chunk_size)
+                if claimed is None:
+                    if time.time() - last_purge > 3600:
+                        last_purge = time.time()
+                        purged = await self._db(self.store.purge, last_purge - self.retention)
+                        if purged:
+                            logger.info(f"Purged {purged} finished jobs")
+                    await self._idle()
+                    continue
+
+                job_id, items = claimed
+                try:
+                    results = await self._score(analyze_texts, emotion_analyzer, abuse_detector, [text for _, text in items])
+                except Exception:
+                    await self._db(self.store.release, job_id, self.owner)
+                    raise
+
+                saved = await self._db(
+                    self.store.save_chunk, job_id, self.owner,
+                    [(position, result) for (position, _), result in zip(items, results)], time.time()
+                )
+                if not saved:
+                    logger.info(f"Job {job_id} was cancelled or taken over; dropped a chunk of {len(items)} results")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing jobs: {e}")
+                await asyncio.sleep(self.poll_seconds)
+
+    async def _score(self, analyze_texts, emotion_analyzer, abuse_detector, texts: List[str]) -> List[Dict]:
+        """Score one chunk at bulk priority; a full queue or missed deadline just delays it"""
+        with request_class(BULK):
+            while True:
+                try:
+                    return await analyze_texts(emotion_analyzer, abuse_detector, texts)
+                except QueueFull as e:
+                    await asyncio.sleep(e.retry_after)
+                except DeadlineExceeded:
+                    await asyncio.sleep(self.poll_seconds)
+
+    async def _idle(self):
+        """Wait for a new job here, or poll for ones submitted to other processes"""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import os
+import re
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicons")
+
+class KeywordMatcher:
+    """Finds lexicon terms from every category in a single pass over a text.
+
+    All terms are compiled into one regular expression shaped like a prefix
+    trie, so matching cost grows with the length of the text rather than
+    the number of terms. Terms only match on word boundaries, and whitespace
+    inside multi-word terms matches any run of whitespace.
+    """
+
+    def __init__(self, lexicons: Dict[str, Iterable[str]]):
+        self.categories = list(lexicons)
+        self._term_categories: Dict[str, List[str]] = {}
+
+        for category, terms in lexicons.items():
+            for term in terms:
+                term = _normalize(term)
+                if term:
+                    self._term_categories.setdefault(term, [])
+                    if category not in self._term_categories[term]:
+                        self._term_categories[term].append(category)
+
+        self.term_count = len(self._term_categories)
+
+        # Identifies this exact vocabulary, e.g. for cache keys
+        vocabulary = "\n".join(f"{t}\t{','.join(c)}" for t, c in sorted(self._term_categories.items()))
+        self.digest = hashlib.sha256(vocabulary.encode("utf-8")).hexdigest()[:12]
+
+        # A lookahead finds the longest term starting at every position,
+        # including terms that overlap an earlier match
+        trie = _trie_pattern(self._term_categories)
+        self._pattern = re.compile(rf"(?<!\w)(?=({trie})(?!\w))") if trie else None
+
+    @classmethod
+    def from_directory(cls, path: Optional[str] = None, categories: Optional[List[str]] = None) -> "KeywordMatcher":
+        """Load ``<category>.txt`` lexicons (one term per line, ``#`` comments)"""
+        path = path or os.getenv("LEXICON_DIR") or DEFAULT_LEXICON_DIR
+        if categories is None:
+            categories = sorted(name[:-4] for name in os.listdir(path) if name.endswith(".txt"))
+
+        lexicons = {}
+        for category in categories:
+            file_path = os.path.join(path, f"{category}.txt")
+            if not os.path.exists(file_path):
+                logger.warning(f"No lexicon for '{category}' at {file_path}")
+                lexicons[category] = []
+                continue
+
+            with open(file_path, encoding="utf-8") as f:
+                lexicons[category] = [line.split("#", 1)[0] for line in f]
+
+        matcher = cls(lexicons)
+        logger.info(f"Loaded {matcher.term_count} lexicon terms from {path}")
+        return matcher
+
+    def count_matches(self, text: str) -> Dict[str, int]:
+        """Number of distinct terms from each category found in the text"""
+        counts = {category: 0 for category in self.categories}
+        if self._pattern is None:
+            return counts
+
+        found = set()
+        for match in self._pattern.finditer(text.lower()):
+            matched = match.group(1)
+
+            # The longest term won at this position; shorter terms it starts with count too
+            for end in _word_ends(matched):
+                term = _normalize(matched[:end])
+                if term in self._term_categories:
+                    found.add(term)
+
+        for term in found:
+            for category in self._term_categories[term]:
+                counts[category] += 1
+
+        return counts
+
+def _normalize(term: str) -> str:
+    """Lower-case a term and collapse its whitespace"""
+    return " ".join(term.lower().split())
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """Build a regex alternation of ``terms`` that shares common prefixes"""
+    trie: Dict = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        is_term = "" in node
+        branches = [
+            (r"\s+" if char == " " else re.escape(char)) + build(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ""
+
+        pattern = branches[0] if len(branches) == 1 and not is_term else f"(?:{'|'.join(branches)})"
+        # Optional continuation: prefer the longer term, fall back to this one
+        return f"{pattern}?" if is_term else pattern
+
+    return build(trie)
+
+def _word_ends(matched: str) -> List[int]:
+    """Offsets where a shorter term inside ``matched`` could end"""
+    ends = [
+        i for i in range(1, len(matched))
+        if matched[i - 1].isalnum() != matched[i].isalnum() and not matched[i - 1].isspace()
+    ]
+    ends.append(len(matched))
+    return ends
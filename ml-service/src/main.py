@@ -1,16 +1,30 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Header, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import ClientDisconnect
 import uvicorn
 import logging
 import os
+import json
+import asyncio
+import hmac
 from dotenv import load_dotenv
 from datetime import datetime
 import time
+from typing import AsyncIterator, List, Optional
 
+from src.admission import BULK, INTERACTIVE, DeadlineExceeded, QueueFull, set_request_class
+from src.near_duplicates import set_force_full_analysis
 from src.models import TextAnalysisRequest, TextAnalysisResponse, BatchAnalysisRequest, BatchAnalysisResponse
-from src.analyzer import EmotionAnalyzer, AbuseDetector
-from src.utils import setup_logging
+from src.models import JobRequest, ModelSwapRequest, ProfileRequest, ShadowRequest
+from src.analyzer import EmotionAnalyzer, AbuseDetector, analyze_message, analyze_texts, failed_result
+from src.jobs import CANCELLED, COMPLETED, JobRunner
+from src.profiling import FOLDED, FORMATS, ProfileCapture, ProfilingInProgress
+from src.rollout import ModelRollout, RolloutSync, SwapInProgress
+from src.serialization import JSON, encode, negotiate
+from src.streaming import DuplexStreamingResponse, parse_item, read_ndjson
+from src.metrics import MetricsMiddleware, SERIALIZE, monitor_event_loop_lag, render_metrics
+from src.utils import TraceMiddleware, process_memory, request_logger, setup_logging
 
 # Load environment variables
 load_dotenv()
@@ -36,42 +50,100 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request counts and latency per endpoint (exposed on /metrics)
+app.add_middleware(MetricsMiddleware)
+
+# Trace id per request for its log lines (echoed as X-Request-ID)
+app.add_middleware(TraceMiddleware)
+
 # Global analyzers
 emotion_analyzer = None
 abuse_detector = None
+event_loop_monitor = None
+model_loader = None
+job_runner = None
+models_ready = False
+model_load_error = None
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize ML models on startup"""
-    global emotion_analyzer, abuse_detector
+    """Start loading ML models in the background"""
+    global event_loop_monitor, model_loader, job_runner
+    
+    event_loop_monitor = asyncio.create_task(monitor_event_loop_lag())
+    
+    # Jobs can be submitted while the models load; they run once the models are ready
+    if os.getenv("JOBS_ENABLED", "True").lower() == "true":
+        try:
+            job_runner = JobRunner()
+        except Exception as e:
+            logger.error(f"Failed to open job store: {e}")
+    
+    # Serve /live while the models load; /ready turns 200 once they are warm
+    model_loader = asyncio.create_task(load_models())
+
+async def load_models():
+    """Load both models in parallel, warm them up, then start taking traffic"""
+    global emotion_analyzer, abuse_detector, models_ready, model_load_error
     
     logger.info("Initializing ML models...")
+    start_time = time.perf_counter()
     
     try:
-        # Initialize emotion analyzer
-        emotion_analyzer = EmotionAnalyzer()
-        await emotion_analyzer.load_model()
+        emotion = EmotionAnalyzer()
+        abuse = AbuseDetector()
         
-        # Initialize abuse detector
-        abuse_detector = AbuseDetector()
-        await abuse_detector.load_model()
+        # Each model loads on its own executor
+        await asyncio.gather(emotion.load_model(), abuse.load_model())
         
-        logger.info("ML models initialized successfully")
+        if os.getenv("WARMUP_ENABLED", "True").lower() == "true":
+            await asyncio.gather(emotion.warmup(), abuse.warmup())
+        
+        # Requests are only routed to the analyzers once they are warm
+        emotion_analyzer, abuse_detector = emotion, abuse
+        models_ready = True
+        
+        if job_runner is not None:
+            job_runner.start(emotion, abuse)
+        
+        # Workers follow swaps and shadow changes made through any of them
+        if os.getenv("ROLLOUT_STATE_PATH"):
+            RolloutSync(os.getenv("ROLLOUT_STATE_PATH")).start({"emotion": emotion.rollout, "abuse": abuse.rollout})
+        
+        logger.info(f"ML models initialized successfully in {time.perf_counter() - start_time:.1f}s")
         
     except Exception as e:
+        model_load_error = str(e)
         logger.error(f"Failed to initialize ML models: {e}")
-        raise e
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
+        "ready": models_ready,
         "timestamp": datetime.utcnow().isoformat(),
         "service": "SafeChat AI ML Service",
         "version": "1.0.0"
     }
 
+@app.get("/live")
+async def liveness_check():
+    """Liveness: the process is serving requests and model loading hasn't failed"""
+    if model_load_error:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": model_load_error})
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: both models are loaded and warmed up"""
+    if not models_ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "failed" if model_load_error else "loading", "error": model_load_error}
+        )
+    return {"status": "ready"}
+
 @app.get("/models/info")
 async def get_model_info():
     """Get information about loaded models"""
@@ -79,67 +151,111 @@ async def get_model_info():
         return {
             "emotion_model": {
                 "name": emotion_analyzer.model_name if emotion_analyzer else "not_loaded",
-                "status": "loaded" if emotion_analyzer and emotion_analyzer.model else "not_loaded"
+                "version": emotion_analyzer.model_version if emotion_analyzer else None,
+                "status": "loaded" if emotion_analyzer and emotion_analyzer.model else "not_loaded",
+                "cache": emotion_analyzer.cache.stats() if emotion_analyzer else {},
+                "queue": emotion_analyzer.batcher.stats() if emotion_analyzer else {},
+                "near_duplicates": emotion_analyzer.near_duplicates.stats() if emotion_analyzer else {},
+                "rollout": emotion_analyzer.rollout.stats() if emotion_analyzer else {},
+                "memory": _model_memory(emotion_analyzer)
             },
             "abuse_model": {
                 "name": abuse_detector.model_name if abuse_detector else "not_loaded", 
-                "status": "loaded" if abuse_detector and abuse_detector.model else "not_loaded"
+                "version": abuse_detector.model_version if abuse_detector else None,
+                "status": "loaded" if abuse_detector and abuse_detector.model else "not_loaded",
+                "cache": abuse_detector.cache.stats() if abuse_detector else {},
+                "queue": abuse_detector.batcher.stats() if abuse_detector else {},
+                "rollout": abuse_detector.rollout.stats() if abuse_detector else {},
+                "memory": _model_memory(abuse_detector)
             },
             "labels": {
                 "emotions": emotion_analyzer.emotion_labels if emotion_analyzer else [],
                 "abuse_types": abuse_detector.abuse_types if abuse_detector else []
-            }
+            },
+            # Process-wide: both models, tokenizers, thread stacks and the Python heap
+            "process_memory": process_memory()
         }
     except Exception as e:
         logger.error(f"Error getting model info: {e}")
         raise HTTPException(status_code=500, detail="Error retrieving model information")
 
+def _model_memory(analyzer) -> dict:
+    """Weight and activation bytes of an analyzer's serving classifier"""
+    memory_stats = getattr(analyzer.classifier, "memory_stats", None) if analyzer else None
+    return memory_stats() if memory_stats else {}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, request/error/fallback/cache counters"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.post("/analyze", response_model=TextAnalysisResponse)
-async def analyze_text(request: TextAnalysisRequest):
-    """Analyze a single text for abuse and emotions"""
+async def analyze_text(
+    request: TextAnalysisRequest,
+    x_deadline_ms: Optional[float] = Header(default=None),
+    accept: Optional[str] = Header(default=None)
+):
+    """Analyze a single text for abuse and emotions.
+    
+    Interactive priority; an ``X-Deadline-Ms`` header drops the work if it
+    can't reach the model in time.
+    """
     try:
-        start_time = time.time()
+        start_time = time.perf_counter()
+        set_request_class(INTERACTIVE, x_deadline_ms)
+        set_force_full_analysis(request.force_full_analysis)
         
         if not emotion_analyzer or not abuse_detector:
             raise HTTPException(status_code=503, detail="Models not loaded")
             
-        # Validate text length
-        if len(request.text) > int(os.getenv("MAX_TEXT_LENGTH", 2000)):
+        # Validate text length; longer than the models' input is fine, it is
+        # scored in overlapping windows
+        if len(request.text) > int(os.getenv("MAX_TEXT_LENGTH", 20000)):
             raise HTTPException(status_code=400, detail="Text too long")
             
-        # Analyze emotions
-        emotion_result = await emotion_analyzer.analyze(request.text)
-        
-        # Detect abuse
-        abuse_result = await abuse_detector.analyze(request.text)
-        
-        # Combine results
-        response = TextAnalysisResponse(
-            abuse_detected=abuse_result["abuse_detected"],
-            abuse_type=abuse_result["abuse_type"],
-            confidence_score=abuse_result["confidence_score"],
-            emotion=emotion_result["emotion"],
-            emotion_intensity=emotion_result["intensity"],
-            secondary_emotions=emotion_result["secondary_emotions"],
-            processing_time_ms=round((time.time() - start_time) * 1000, 2),
-            timestamp=datetime.utcnow()
-        )
+        # Analyze emotions and detect abuse concurrently on each model's own executor
+        result = await analyze_message(emotion_analyzer, abuse_detector, request.text)
         
-        logger.info(f"Analyzed text - Abuse: {response.abuse_detected}, Emotion: {response.emotion}")
+        # Shaped like TextAnalysisResponse; our own output isn't re-validated
+        response = {
+            "abuse_detected": result["abuse_detected"],
+            "abuse_type": result["abuse_type"],
+            "confidence_score": result["confidence_score"],
+            "emotion": result["emotion"],
+            "emotion_intensity": result["emotion_intensity"],
+            "secondary_emotions": result["secondary_emotions"],
+            "window": result.get("window"),
+            "processing_time_ms": round((time.perf_counter() - start_time) * 1000, 2),
+            "timestamp": datetime.utcnow()
+        }
+        
+        request_logger.info("Analyzed text - Abuse: %s, Emotion: %s", response['abuse_detected'], response['emotion'])
         
-        return response
+        return _encoded_response(response, "/analyze", accept)
         
-    except HTTPException:
+    except (HTTPException, QueueFull, DeadlineExceeded):
         raise
     except Exception as e:
         logger.error(f"Error analyzing text: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.post("/batch-analyze", response_model=BatchAnalysisResponse)
-async def batch_analyze_texts(request: BatchAnalysisRequest):
-    """Analyze multiple texts in batch"""
+async def batch_analyze_texts(
+    request: BatchAnalysisRequest,
+    x_deadline_ms: Optional[float] = Header(default=None),
+    accept: Optional[str] = Header(default=None)
+):
+    """Analyze multiple texts in batch (bulk priority).
+    
+    JSON by default; ``Accept: application/msgpack`` or a columnar type
+    (``application/vnd.safechat.columnar+json`` / ``+msgpack``) picks a
+    more compact encoding.
+    """
     try:
-        start_time = time.time()
+        start_time = time.perf_counter()
+        set_request_class(BULK, x_deadline_ms)
+        set_force_full_analysis(request.force_full_analysis)
         
         if not emotion_analyzer or not abuse_detector:
             raise HTTPException(status_code=503, detail="Models not loaded")
@@ -147,68 +263,363 @@ async def batch_analyze_texts(request: BatchAnalysisRequest):
         if len(request.texts) > 100:  # Limit batch size
             raise HTTPException(status_code=400, detail="Batch size too large (max 100)")
             
-        results = []
-        
-        for text in request.texts:
-            # Validate individual text length
-            if len(text) > int(os.getenv("MAX_TEXT_LENGTH", 2000)):
-                results.append({
-                    "error": "Text too long",
-                    "abuse_detected": False,
-                    "abuse_type": "none",
-                    "confidence_score": 0,
-                    "emotion": "neutral",
-                    "emotion_intensity": 0,
-                    "secondary_emotions": []
-                })
-                continue
-                
-            try:
-                # Analyze emotions
-                emotion_result = await emotion_analyzer.analyze(text)
-                
-                # Detect abuse
-                abuse_result = await abuse_detector.analyze(text)
-                
-                # Add result
-                results.append({
-                    "abuse_detected": abuse_result["abuse_detected"],
-                    "abuse_type": abuse_result["abuse_type"],
-                    "confidence_score": abuse_result["confidence_score"],
-                    "emotion": emotion_result["emotion"],
-                    "emotion_intensity": emotion_result["intensity"],
-                    "secondary_emotions": emotion_result["secondary_emotions"]
-                })
-                
-            except Exception as e:
-                logger.error(f"Error analyzing individual text: {e}")
-                results.append({
-                    "error": str(e),
-                    "abuse_detected": False,
-                    "abuse_type": "none",
-                    "confidence_score": 0,
-                    "emotion": "neutral",
-                    "emotion_intensity": 0,
-                    "secondary_emotions": []
-                })
-        
-        response = BatchAnalysisResponse(
-            results=results,
-            total_processed=len(request.texts),
-            processing_time_ms=round((time.time() - start_time) * 1000, 2),
-            timestamp=datetime.utcnow()
-        )
+        results = await analyze_texts(emotion_analyzer, abuse_detector, request.texts)
+        
+        # Shaped like BatchAnalysisResponse; our own output isn't re-validated
+        response = {
+            "results": results,
+            "total_processed": len(request.texts),
+            "processing_time_ms": round((time.perf_counter() - start_time) * 1000, 2),
+            "timestamp": datetime.utcnow()
+        }
         
-        logger.info(f"Batch analyzed {len(request.texts)} texts")
+        request_logger.info("Batch analyzed %d texts", len(request.texts))
         
-        return response
+        return _encoded_response(response, "/batch-analyze", accept)
         
-    except HTTPException:
+    except (HTTPException, QueueFull, DeadlineExceeded):
         raise
     except Exception as e:
         logger.error(f"Error in batch analysis: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post("/batch-analyze/stream")
+async def batch_analyze_stream(request: Request):
+    """Analyze an NDJSON stream of {"id", "text"} objects, streaming NDJSON results back"""
+    if not emotion_analyzer or not abuse_detector:
+        raise HTTPException(status_code=503, detail="Models not loaded")
+        
+    return DuplexStreamingResponse(_stream_analysis(request), media_type="application/x-ndjson")
+
+async def _stream_analysis(request: Request) -> AsyncIterator[bytes]:
+    """Read, analyze and emit the stream one chunk at a time.
+    
+    Only one chunk is held in memory. The next chunk is not read until the
+    previous results have been handed to the client connection, so a slow
+    reader slows down how fast the request body is consumed.
+    """
+    chunk_size = max(1, int(os.getenv("STREAM_CHUNK_SIZE", 64)))
+    set_request_class(BULK)
+    chunk = []
+    total = 0
+    
+    try:
+        async for item in read_ndjson(request):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield await _analyze_stream_chunk(chunk)
+                total += len(chunk)
+                chunk = []
+                
+        if chunk:
+            yield await _analyze_stream_chunk(chunk)
+            total += len(chunk)
+            
+        request_logger.info("Stream analyzed %d texts", total)
+        
+    except ClientDisconnect:
+        request_logger.info("Client disconnected from analysis stream after %d texts", total)
+    except Exception as e:
+        logger.error(f"Error in stream analysis: {e}")
+        yield (json.dumps({"error": "Internal server error"}) + "\n").encode()
+
+async def _analyze_stream_chunk(items: List[dict]) -> bytes:
+    """Analyze one chunk of stream items and render it as NDJSON lines"""
+    valid_items = [item for item in items if "error" not in item]
+    texts = [item["text"] for item in valid_items]
+    
+    # A full queue slows the stream down instead of failing it
+    while True:
+        try:
+            results = iter(await analyze_texts(emotion_analyzer, abuse_detector, texts))
+            break
+        except QueueFull as e:
+            await asyncio.sleep(e.retry_after)
+    
+    started = time.perf_counter()
+    lines = []
+    for item in items:
+        result = failed_result(item["error"]) if "error" in item else next(results)
+        # Items without an id are identified by their line number
+        item_id = item.get("id") if item.get("id") is not None else item["line"]
+        lines.append(json.dumps({"id": item_id, **result}))
+        
+    body = ("\n".join(lines) + "\n").encode()
+    SERIALIZE.labels("/batch-analyze/stream").observe(time.perf_counter() - started)
+    return body
+
+@app.websocket("/ws/analyze")
+async def analyze_websocket(websocket: WebSocket):
+    """Analyze a stream of {"id", "text"} frames over one long-lived connection.
+    
+    Each frame is answered with one result frame carrying its id, sent as
+    soon as it completes, so results may arrive out of order. Frames are fed
+    through the models' micro-batchers and share forward passes with other
+    requests. At most ``WS_MAX_IN_FLIGHT`` frames per connection are in
+    progress; beyond that no further frames are read, so a client sending
+    faster than it is served is held back by TCP backpressure.
+    """
+    await websocket.accept()
+    
+    if not emotion_analyzer or not abuse_detector:
+        # 1013: try again later
+        await websocket.close(code=1013, reason="Models not loaded")
+        return
+    
+    in_flight = asyncio.Semaphore(max(1, int(os.getenv("WS_MAX_IN_FLIGHT", 32))))
+    send_lock = asyncio.Lock()
+    pending = set()
+    received = 0
+    
+    async def answer(item: dict):
+        # Frames without an id are identified by their 1-based position
+        item_id = item.get("id") if item.get("id") is not None else item["line"]
+        deadline_ms = item.get("deadline_ms")
+        set_request_class(INTERACTIVE, deadline_ms if isinstance(deadline_ms, (int, float)) else None)
+        set_force_full_analysis(item.get("force_full_analysis") is True)
+        try:
+            try:
+                if "error" in item:
+                    result = failed_result(item["error"])
+                else:
+                    result = await analyze_message(emotion_analyzer, abuse_detector, item["text"])
+            except QueueFull as e:
+                result = {**failed_result("Server overloaded"), "retry_after": e.retry_after_header}
+            except DeadlineExceeded:
+                result = failed_result("Deadline exceeded")
+            except Exception as e:
+                logger.error(f"Error analyzing WebSocket frame {item_id}: {e}")
+                result = failed_result("Internal server error")
+            
+            started = time.perf_counter()
+            frame = json.dumps({"id": item_id, **result})
+            SERIALIZE.labels("/ws/analyze").observe(time.perf_counter() - started)
+            
+            async with send_lock:
+                await websocket.send_text(frame)
+        except Exception as e:
+            logger.error(f"Could not send WebSocket result for frame {item_id}: {e}")
+        finally:
+            in_flight.release()
+    
+    try:
+        while True:
+            # Only read the next frame once a slot is free
+            await in_flight.acquire()
+            try:
+                message = await websocket.receive()
+            except BaseException:
+                in_flight.release()
+                raise
+            
+            if message["type"] == "websocket.disconnect":
+                break
+            
+            received += 1
+            raw = message.get("text") if message.get("text") is not None else message.get("bytes") or b""
+            item = parse_item(raw.encode() if isinstance(raw, str) else raw, received)
+            if item is None:
+                in_flight.release()
+                continue
+            
+            task = asyncio.create_task(answer(item))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Nobody is left to read the results
+        for task in pending:
+            task.cancel()
+        request_logger.info("WebSocket analysis connection closed after %d frames", received)
+
+def _job_runner() -> JobRunner:
+    if job_runner is None:
+        raise HTTPException(status_code=503, detail="Jobs disabled")
+    return job_runner
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """Queue items for background re-analysis at bulk priority and return the job id at once.
+    
+    Items without an id are identified by their position in ``items``.
+    """
+    runner = _job_runner()
+    if len(request.items) > runner.max_items:
+        raise HTTPException(status_code=400, detail=f"Job too large (max {runner.max_items} items)")
+    
+    job = await runner.submit([
+        (item.id if item.id is not None else position, item.text)
+        for position, item in enumerate(request.items)
+    ])
+    request_logger.info("Queued job %s with %d items", job['job_id'], job['total'])
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and progress of a job"""
+    job = await _job_runner().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(
+    job_id: str,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=1000),
+    accept: Optional[str] = Header(default=None)
+):
+    """A page of a job's results in submission order, available while the job still runs.
+    
+    Pass ``next_offset`` back as ``offset`` for the next page; it is null
+    once every item has been returned.
+    """
+    runner = _job_runner()
+    job = await runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    results = await runner.results(job_id, offset, limit)
+    next_offset = results[-1]["position"] + 1 if results else offset
+    finished = job["status"] in (COMPLETED, CANCELLED) and len(results) < limit
+    document = {
+        "job_id": job_id,
+        "status": job["status"],
+        "results": results,
+        "next_offset": None if finished or next_offset >= job["total"] else next_offset
+    }
+    return _encoded_response(document, "/jobs/{job_id}/results", accept)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Stop a job; results scored so far stay available"""
+    job = await _job_runner().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+async def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """Admin endpoints are off unless ADMIN_TOKEN is set, and then need it in X-Admin-Token"""
+    token = os.getenv("ADMIN_TOKEN", "")
+    if not token:
+        raise HTTPException(status_code=403, detail="Admin API disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def _rollout(model: str) -> ModelRollout:
+    """The rollout controller of the 'emotion' or 'abuse' analyzer"""
+    analyzers = {"emotion": emotion_analyzer, "abuse": abuse_detector}
+    if model not in analyzers:
+        raise HTTPException(status_code=404, detail=f"Unknown model '{model}'")
+    if not models_ready or analyzers[model] is None:
+        raise HTTPException(status_code=503, detail="Models not loaded")
+    return analyzers[model].rollout
+
+@app.post("/admin/models/{model}/swap", dependencies=[Depends(require_admin)])
+async def swap_model(model: str, request: ModelSwapRequest):
+    """Load, warm up and swap in another version of a model without a restart.
+    
+    Requests keep being served by the current model until the new one is
+    ready; batches already running finish on it. The response describes the
+    worker that handled the call; with several workers (ROLLOUT_STATE_PATH
+    set) the others load the model within ROLLOUT_POLL_SECONDS.
+    """
+    rollout = _rollout(model)
+    try:
+        return await rollout.swap(request.model_name)
+    except SwapInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to swap {model} model to {request.model_name}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to load {request.model_name}; the current model is still serving")
+
+@app.put("/admin/models/{model}/shadow", dependencies=[Depends(require_admin)])
+async def start_shadow(model: str, request: ShadowRequest):
+    """Score a sample of traffic with a candidate model off the request path.
+    
+    With several workers, every worker loads the candidate and samples its
+    own traffic.
+    """
+    rollout = _rollout(model)
+    try:
+        return await rollout.start_shadow(request.model_name, request.sample_rate)
+    except SwapInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to load shadow {model} model {request.model_name}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to load {request.model_name}")
+
+@app.get("/admin/models/{model}/shadow", dependencies=[Depends(require_admin)])
+async def shadow_stats(model: str):
+    """Agreement between the primary model and the shadow candidate so far, on the worker that answers"""
+    return _rollout(model).stats()
+
+@app.delete("/admin/models/{model}/shadow", dependencies=[Depends(require_admin)])
+async def stop_shadow(model: str):
+    """Stop shadow scoring on every worker and return this worker's final agreement statistics"""
+    stats = _rollout(model).stop_shadow()
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No shadow model running")
+    return stats
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def capture_profile(request: ProfileRequest):
+    """Profile this worker process and return the capture as a downloadable artifact.
+    
+    Runs for ``duration_seconds`` or until ``max_requests`` analysis requests
+    have completed, sampling Python stacks of every thread and timing torch
+    operators in forward passes.
+    """
+    if request.format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{request.format}' (expected one of {', '.join(FORMATS)})")
+    max_seconds = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+    if request.duration_seconds > max_seconds:
+        raise HTTPException(status_code=400, detail=f"Capture too long (max {max_seconds:g}s)")
+    
+    capture = ProfileCapture(
+        request.duration_seconds,
+        max_requests=request.max_requests,
+        sample_interval_ms=request.sample_interval_ms,
+        torch_ops=request.torch_ops
+    )
+    try:
+        await capture.run()
+    except ProfilingInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    filename = f"profile-{os.getpid()}-{datetime.utcnow():%Y%m%dT%H%M%S}"
+    if request.format == FOLDED:
+        content, media_type, filename = capture.folded(), "text/plain", f"{filename}.folded"
+    else:
+        content, media_type, filename = encode(capture.chrome_trace(), JSON), JSON, f"{filename}.json"
+    return Response(
+        content=content, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _encoded_response(document: dict, endpoint: str, accept: Optional[str]) -> Response:
+    """Serialize a response ourselves, in the encoding the client accepts, so the time it takes is measured"""
+    started = time.perf_counter()
+    media_type = negotiate(accept)
+    body = encode(document, media_type)
+    SERIALIZE.labels(endpoint).observe(time.perf_counter() - started)
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
+
+@app.exception_handler(QueueFull)
+async def queue_full_handler(request, exc: QueueFull):
+    """Shed load with 429 and a hint of when the queue will have drained"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Server overloaded, retry later"},
+        headers={"Retry-After": exc.retry_after_header}
+    )
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request, exc: DeadlineExceeded):
+    """The caller's deadline passed before the work reached a model"""
+    return JSONResponse(status_code=504, content={"detail": "Deadline exceeded"})
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Global exception handler"""
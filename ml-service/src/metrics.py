@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Sub-millisecond resolution for per-stage timings
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+REQUEST_LATENCY = Histogram(
+    "ml_request_duration_seconds", "End-to-end HTTP request latency", ["endpoint"], buckets=STAGE_BUCKETS
+)
+REQUESTS = Counter("ml_requests", "HTTP requests by endpoint and status code", ["endpoint", "status"])
+REQUEST_ERRORS = Counter("ml_request_errors", "HTTP requests that failed with a 5xx or an unhandled exception", ["endpoint"])
+
+QUEUE_WAIT = Histogram(
+    "ml_queue_wait_seconds", "Time from a request being queued until a model thread starts on it", ["model"],
+    buckets=STAGE_BUCKETS
+)
+TOKENIZE = Histogram("ml_tokenize_seconds", "Tokenization time per model call", ["model"], buckets=STAGE_BUCKETS)
+FORWARD = Histogram(
+    "ml_forward_seconds", "Forward pass time per padded batch", ["model", "backend"], buckets=STAGE_BUCKETS
+)
+PIPELINE_STAGE = Histogram(
+    "ml_pipeline_stage_seconds", "Time per batch in each inference pipeline stage", ["model", "stage"],
+    buckets=STAGE_BUCKETS
+)
+KEYWORDS = Histogram("ml_keyword_seconds", "Lexicon matching time per model call", buckets=STAGE_BUCKETS)
+SERIALIZE = Histogram("ml_serialize_seconds", "Response serialization time", ["endpoint"], buckets=STAGE_BUCKETS)
+EVENT_LOOP_LAG = Histogram(
+    "ml_event_loop_lag_seconds", "How late the event loop runs a scheduled callback", buckets=STAGE_BUCKETS
+)
+
+BATCH_SIZE = Histogram(
+    "ml_batch_size", "Texts per model call (call) and per padded forward batch (forward)", ["model", "stage"],
+    buckets=BATCH_BUCKETS
+)
+QUEUE_DEPTH = Gauge(
+    "ml_queue_depth", "Items waiting in a model's inference queue", ["model", "priority"], multiprocess_mode="livesum"
+)
+SHED = Counter(
+    "ml_shed", "Items rejected because the queue was full or dropped after their deadline", ["model", "priority", "reason"]
+)
+FALLBACKS = Counter("ml_fallback_results", "Fallback results returned after a failed analysis", ["model"])
+CACHE_LOOKUPS = Counter("ml_cache_lookups", "Result cache lookups by outcome", ["cache", "result"])
+NEAR_DUP_LOOKUPS = Counter(
+    "ml_near_duplicate_lookups", "Near-duplicate index lookups: results reused (hit) or computed (miss)", ["model", "result"]
+)
+CASCADE_DECISIONS = Counter(
+    "ml_cascade_decisions", "Texts answered by the cascade (resolved) or sent to the transformer (escalated)",
+    ["model", "decision"]
+)
+CASCADE_AUDITS = Counter(
+    "ml_cascade_audits", "Sampled cascade answers re-checked against the transformer", ["model", "outcome"]
+)
+MODEL_SWAPS = Counter("ml_model_swaps", "Admin model hot swaps by outcome", ["model", "result"])
+SHADOW_COMPARISONS = Counter(
+    "ml_shadow_comparisons", "Sampled answers re-scored by a shadow candidate model", ["model", "outcome"]
+)
+
+def render_metrics():
+    """Exposition-format body and content type for /metrics.
+
+    With ``PROMETHEUS_MULTIPROC_DIR`` set (several server processes), the
+    samples of every process are aggregated.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Record how late a periodic wakeup runs; spikes mean the loop is blocked"""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - scheduled))
+
+class MetricsMiddleware:
+    """Counts and times every HTTP request.
+
+    Plain ASGI rather than ``BaseHTTPMiddleware`` so streaming endpoints
+    keep reading the request body while they respond. Unknown paths share
+    one ``other`` label to keep label cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._endpoints = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = self._endpoint(scope)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+            REQUESTS.labels(endpoint, str(status)).inc()
+            if status >= 500:
+                REQUEST_ERRORS.labels(endpoint).inc()
+
+    def _endpoint(self, scope) -> str:
+        """Label for the request path"""
+        if self._endpoints is None:
+            app = scope.get("app")
+            self._endpoints = {route.path for route in getattr(app, "routes", []) if hasattr(route, "path")}
+
+        path = scope["path"]
+        return path if path in self._endpoints else "other"
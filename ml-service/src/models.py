@@ -1,17 +1,25 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import List, Optional, Union
 from datetime import datetime
 
 class TextAnalysisRequest(BaseModel):
-    text: str = Field(..., min_length=1, max_length=2000, description="Text to analyze")
+    text: str = Field(..., min_length=1, description="Text to analyze (up to MAX_TEXT_LENGTH characters)")
+    force_full_analysis: bool = Field(default=False, description="Run the models even if a near-duplicate or the cascade could answer")
 
 class BatchAnalysisRequest(BaseModel):
     texts: List[str] = Field(..., min_items=1, max_items=100, description="List of texts to analyze")
+    force_full_analysis: bool = Field(default=False, description="Run the models even if a near-duplicate or the cascade could answer")
 
 class SecondaryEmotion(BaseModel):
     emotion: str = Field(..., description="Secondary emotion name")
     intensity: float = Field(..., ge=0, le=100, description="Emotion intensity (0-100)")
 
+class AnalysisWindow(BaseModel):
+    index: int = Field(..., description="Window with the highest toxicity")
+    start: int = Field(..., description="Character offset where the window starts")
+    end: int = Field(..., description="Character offset where the window ends")
+    count: int = Field(..., description="Number of windows the text was scored in")
+
 class TextAnalysisResponse(BaseModel):
     abuse_detected: bool = Field(..., description="Whether abuse was detected")
     abuse_type: str = Field(..., description="Type of abuse detected")
@@ -19,6 +27,7 @@ class TextAnalysisResponse(BaseModel):
     emotion: str = Field(..., description="Primary emotion detected")
     emotion_intensity: float = Field(..., ge=0, le=100, description="Primary emotion intensity")
     secondary_emotions: List[SecondaryEmotion] = Field(default=[], description="Secondary emotions")
+    window: Optional[AnalysisWindow] = Field(default=None, description="Set when a long text was scored in windows")
     processing_time_ms: float = Field(..., description="Processing time in milliseconds")
     timestamp: datetime = Field(..., description="Analysis timestamp")
 
@@ -31,8 +40,34 @@ class BatchAnalysisResponse(BaseModel):
 class ModelInfo(BaseModel):
     name: str = Field(..., description="Model name")
     status: str = Field(..., description="Model status")
+    cache: dict = Field(default={}, description="Result cache hit/miss counters")
 
 class ModelsInfoResponse(BaseModel):
     emotion_model: ModelInfo
     abuse_model: ModelInfo
-    labels: dict = Field(..., description="Available labels for emotions and abuse types")
\ No newline at end of file
+    labels: dict = Field(..., description="Available labels for emotions and abuse types")
+
+class ModelSwapRequest(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_name: str = Field(..., min_length=1, description="Hub name or bundled model to load and swap in")
+
+class ShadowRequest(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_name: str = Field(..., min_length=1, description="Candidate model scored alongside the primary one")
+    sample_rate: Optional[float] = Field(default=None, ge=0, le=1, description="Share of traffic re-scored (default SHADOW_SAMPLE_RATE)")
+
+class JobItem(BaseModel):
+    id: Optional[Union[str, int]] = Field(default=None, description="Caller's id for the item (default: its position)")
+    text: str = Field(..., min_length=1, description="Text to analyze")
+
+class JobRequest(BaseModel):
+    items: List[JobItem] = Field(..., min_items=1, description="Items to analyze (up to JOB_MAX_ITEMS)")
+
+class ProfileRequest(BaseModel):
+    duration_seconds: float = Field(default=10, gt=0, description="Longest the capture runs (up to PROFILE_MAX_SECONDS)")
+    max_requests: Optional[int] = Field(default=None, ge=1, description="Stop earlier once this many analysis requests have completed")
+    sample_interval_ms: float = Field(default=10, ge=1, le=1000, description="Python stack sampling interval")
+    torch_ops: bool = Field(default=True, description="Profile forward passes with torch.profiler")
+    format: str = Field(default="chrome", description="chrome (Chrome trace JSON) or folded (stacks for flamegraph.pl / speedscope)")
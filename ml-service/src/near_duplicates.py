@@ -0,0 +1,234 @@
+"""Near-duplicate reuse of recent results for spam and raid bursts.
+
+Texts are fingerprinted with a 64-value MinHash signature over character
+3-grams of their ``preprocess_text`` normalization (lower-cased). The
+share of equal signature values estimates the Jaccard similarity of two
+texts' 3-gram sets, so messages that differ in a few characters score
+close to 1. A new text whose estimated similarity to a recently scored one
+is at least ``NEAR_DUP_MIN_SIMILARITY`` reuses that result instead of
+running the model.
+
+Only the emotion analyzer reuses results this way. One changed word can
+turn a benign message into a threat ("see you" / "kill you") while
+keeping it well above the threshold, so abuse scores are always computed
+for the text itself.
+
+Lookups use LSH: the signature is cut into 16 bands of 4 values and only
+texts sharing a whole band are compared. A pair at similarity 0.8 shares
+a band with probability above 0.999.
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from src.metrics import NEAR_DUP_LOOKUPS
+from src.utils import preprocess_text
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_SIZE = 64
+BANDS = 16
+ROWS = SIGNATURE_SIZE // BANDS
+SHINGLE = 3
+
+# Universal hash family ((a * x + b) mod 2**64) >> 32, fixed per process
+_rng = np.random.default_rng(0x5eed)
+_A = _rng.integers(1, 2 ** 63, SIGNATURE_SIZE, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, SIGNATURE_SIZE, dtype=np.uint64)
+
+# Candidates compared per band bucket, newest first
+MAX_CANDIDATES = 32
+
+_force_full_analysis: ContextVar[bool] = ContextVar("force_full_analysis", default=False)
+
+def set_force_full_analysis(forced: bool):
+    """Make the current request skip near-duplicate reuse and the cascade"""
+    _force_full_analysis.set(bool(forced))
+
+@contextmanager
+def force_full_analysis(forced: bool = True):
+    """Run a block with near-duplicate reuse and the cascade skipped"""
+    token = _force_full_analysis.set(forced)
+    try:
+        yield
+    finally:
+        _force_full_analysis.reset(token)
+
+def full_analysis_forced() -> bool:
+    """Whether the current request asked for every text to run through the models"""
+    return _force_full_analysis.get()
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash signature of a text, or None if it has no 3-grams"""
+    normalized = preprocess_text(text).lower()
+    if len(normalized) < SHINGLE:
+        return None
+
+    shingles = {normalized[i:i + SHINGLE] for i in range(len(normalized) - SHINGLE + 1)}
+    hashes = np.fromiter((hash(shingle) for shingle in shingles), dtype=np.int64, count=len(shingles)).view(np.uint64)
+    permuted = (hashes[:, None] * _A + _B) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32)
+
+def similarity(signature: np.ndarray, other: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures"""
+    return float(np.count_nonzero(signature == other)) / SIGNATURE_SIZE
+
+def _bands(signature: np.ndarray) -> List[bytes]:
+    return [signature[band * ROWS:(band + 1) * ROWS].tobytes() for band in range(BANDS)]
+
+class NearDuplicateIndex:
+    """Recently scored signatures and their results, bounded by count and age"""
+
+    def __init__(
+        self,
+        name: str = "results",
+        max_entries: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        min_similarity: Optional[float] = None,
+        min_chars: Optional[int] = None
+    ):
+        self.name = name
+        self.enabled = os.getenv("NEAR_DUP_ENABLED", "True").lower() == "true"
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("NEAR_DUP_MAX_ENTRIES", 20000))
+        self.ttl = ttl_seconds if ttl_seconds is not None else float(os.getenv("NEAR_DUP_TTL_SECONDS", 600))
+        min_similarity = min_similarity if min_similarity is not None else float(os.getenv("NEAR_DUP_MIN_SIMILARITY", 0.8))
+        self.min_similarity = min(max(0.0, min_similarity), 1.0)
+        self.min_chars = min_chars if min_chars is not None else int(os.getenv("NEAR_DUP_MIN_CHARS", 20))
+        if self.max_entries <= 0:
+            self.enabled = False
+
+        self.namespace = None
+        # entry id -> (expires_at, signature, value), oldest first
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # per band: band bytes -> entry ids, oldest first
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(BANDS)]
+        self._next_id = 0
+
+        self.hits = 0
+        self.misses = 0
+        self._hit_counter = NEAR_DUP_LOOKUPS.labels(name, "hit")
+        self._miss_counter = NEAR_DUP_LOOKUPS.labels(name, "miss")
+
+    async def get_or_compute_many(
+        self,
+        namespace: str,
+        texts: List[str],
+        compute_batch: Callable[[List[str]], Awaitable[List[Dict]]]
+    ) -> List[Dict]:
+        """Reuse results of near-duplicates, computing (and indexing) the rest"""
+        if not self.enabled or full_analysis_forced():
+            results = await compute_batch(texts)
+            if self.enabled:
+                self._add_all(namespace, texts, results)
+            return results
+
+        if namespace != self.namespace:
+            # A different model version; its results don't apply
+            self.clear()
+            self.namespace = namespace
+
+        self._expire()
+        results: List[Optional[Dict]] = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            signature = minhash(text) if len(text) >= self.min_chars else None
+            value = self._lookup(signature) if signature is not None else None
+            if value is not None:
+                results[i] = value
+            else:
+                missing.append(i)
+
+        self.hits += len(texts) - len(missing)
+        self._hit_counter.inc(len(texts) - len(missing))
+        self.misses += len(missing)
+        self._miss_counter.inc(len(missing))
+
+        if missing:
+            computed = await compute_batch([texts[i] for i in missing])
+            for i, result in zip(missing, computed):
+                results[i] = result
+            self._add_all(namespace, [texts[i] for i in missing], computed)
+
+        return results
+
+    def clear(self):
+        """Forget every indexed result"""
+        self._entries.clear()
+        self._buckets = [{} for _ in range(BANDS)]
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "min_similarity": self.min_similarity
+        }
+
+    def _lookup(self, signature: np.ndarray) -> Optional[Dict]:
+        """Result of the most similar live entry at or above min_similarity"""
+        best, best_similarity = None, self.min_similarity
+        seen = set()
+        for band, bucket in zip(_bands(signature), self._buckets):
+            for entry_id in reversed(bucket.get(band, [])[-MAX_CANDIDATES:]):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                score = similarity(signature, self._entries[entry_id][1])
+                if score >= best_similarity:
+                    best, best_similarity = entry_id, score
+                    if score == 1.0:
+                        return self._entries[best][2]
+
+        return self._entries[best][2] if best is not None else None
+
+    def _add_all(self, namespace: str, texts: List[str], results: List[Dict]):
+        """Index freshly computed results (failed analyses are never reused)"""
+        if namespace != self.namespace:
+            self.clear()
+            self.namespace = namespace
+
+        expires_at = time.monotonic() + self.ttl
+        for text, result in zip(texts, results):
+            if "error" in result or len(text) < self.min_chars:
+                continue
+            signature = minhash(text)
+            if signature is None:
+                continue
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (expires_at, signature, result)
+            for band, bucket in zip(_bands(signature), self._buckets):
+                bucket.setdefault(band, []).append(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _expire(self):
+        """Drop entries past their TTL (the oldest are first)"""
+        now = time.monotonic()
+        while self._entries:
+            oldest = next(iter(self._entries))
+            if self._entries[oldest][0] > now:
+                break
+            self._remove(oldest)
+
+    def _remove(self, entry_id: int):
+        """Drop one entry and its band postings"""
+        _, signature, _ = self._entries.pop(entry_id)
+        for band, bucket in zip(_bands(signature), self._buckets):
+            postings = bucket.get(band)
+            if postings:
+                postings.remove(entry_id)
+                if not postings:
+                    del bucket[band]
@@ -0,0 +1,139 @@
+"""Staged inference: tokenization, forward pass and post-processing overlap.
+
+A batch runs through the stages in order, each stage on its own executor,
+so while batch N is in the forward pass batch N+1 is being tokenized and
+batch N-1 post-processed. Fast tokenizers and the forward pass release the
+GIL, so the stages really do run in parallel.
+
+A batch only moves on once the next stage has room: at most
+``PIPELINE_QUEUE_DEPTH`` batches wait in front of a stage besides the ones
+it is running. A slow stage therefore pushes back on the stages before it
+instead of letting tokenized batches pile up in memory.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, List, NamedTuple, Optional
+
+from src.metrics import PIPELINE_STAGE
+
+class PipelineStage(NamedTuple):
+    name: str
+    run: Callable[[Any], Any]
+    executor: Executor
+
+class StagedBatch(NamedTuple):
+    """A batch between stages; ``classifier`` is fixed when it is tokenized"""
+    classifier: Any
+    texts: List[str]
+    data: Any  # EncodedTexts after tokenizing, probabilities after the forward pass
+
+class InferencePipeline:
+    """Runs batches through ``stages`` on their executors, consecutive batches overlapping"""
+
+    def __init__(self, stages: List[PipelineStage], name: str = "model", queue_depth: Optional[int] = None):
+        self.stages = stages
+        self.name = name
+        if queue_depth is None:
+            queue_depth = int(os.getenv("PIPELINE_QUEUE_DEPTH", 1))
+        self.capacity = [getattr(stage.executor, "_max_workers", 1) + max(0, queue_depth) for stage in stages]
+        # Batches the pipeline can hold at once
+        self.max_in_flight = sum(self.capacity)
+        # The model stage is the bottleneck: batches still ahead of it should
+        # keep growing rather than wait in front of it
+        self.model_stage = next((index for index, stage in enumerate(stages) if stage.name == "forward"), len(stages) - 1)
+        self.model_capacity = self.capacity[self.model_stage]
+        self._stage_time = [PIPELINE_STAGE.labels(name, stage.name) for stage in stages]
+
+        self._loop = None
+        self._slots = None
+
+    async def run(
+        self,
+        items: Any,
+        on_start: Optional[Callable[[], None]] = None,
+        on_model_done: Optional[Callable[[], None]] = None
+    ) -> Any:
+        """Push one batch through every stage.
+
+        ``on_start`` runs on the first stage's thread; ``on_model_done`` on the
+        event loop once the batch has left the model stage.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = [asyncio.Semaphore(capacity) for capacity in self.capacity]
+        slots = self._slots
+
+        value = items
+        held = 0
+        await slots[0].acquire()
+        try:
+            for index, stage in enumerate(self.stages):
+                if index:
+                    # Hand over only once the next stage has room
+                    await slots[index].acquire()
+                    slots[held].release()
+                    held = index
+                value = await loop.run_in_executor(
+                    stage.executor, self._run_stage, index, value, on_start if index == 0 else None
+                )
+                if index == self.model_stage and on_model_done is not None:
+                    on_model_done()
+            return value
+        finally:
+            slots[held].release()
+
+    def _run_stage(self, index: int, value: Any, on_start: Optional[Callable[[], None]]) -> Any:
+        """Executor-side: run and time one stage"""
+        if on_start is not None:
+            on_start()
+        started = time.perf_counter()
+        try:
+            return self.stages[index].run(value)
+        finally:
+            self._stage_time[index].observe(time.perf_counter() - started)
+
+def create_pipeline(
+    name: str,
+    model_executor: Executor,
+    tokenize: Callable[[List[str]], StagedBatch],
+    forward: Callable[[StagedBatch], StagedBatch],
+    postprocess: Callable[[StagedBatch], List]
+) -> Optional[InferencePipeline]:
+    """The tokenize / forward / post-process pipeline for one model, or None if ``INFERENCE_PIPELINE`` is off.
+
+    The forward pass stays on the model's executor; tokenizing and
+    post-processing get one thread each.
+    """
+    if os.getenv("INFERENCE_PIPELINE", "True").lower() != "true":
+        return None
+
+    return InferencePipeline(
+        [
+            PipelineStage("tokenize", tokenize, ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-tokenize")),
+            PipelineStage("forward", forward, model_executor),
+            PipelineStage(
+                "postprocess", postprocess, ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-postprocess")
+            ),
+        ],
+        name=name
+    )
+
+def tokenize_stage(classifier, texts: List[str]) -> StagedBatch:
+    """Tokenize and pad a batch for ``classifier``.
+
+    Classifiers without a separate ``encode`` step do all their work in the
+    forward stage.
+    """
+    encode = getattr(classifier, "encode", None)
+    return StagedBatch(classifier, texts, encode(texts) if encode is not None else None)
+
+def forward_stage(batch: StagedBatch) -> StagedBatch:
+    """Run a tokenized batch through its classifier's model"""
+    if batch.data is None:
+        probs = batch.classifier.predict(batch.texts)
+    else:
+        probs = batch.classifier.forward_encoded(batch.data)
+    return batch._replace(data=probs)
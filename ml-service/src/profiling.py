@@ -0,0 +1,294 @@
+"""On-demand profiling of the inference hot path.
+
+``POST /admin/profile`` starts a capture that ends after a fixed duration or
+once a number of analysis requests have completed, whichever comes first.
+While it runs:
+
+- a sampler thread records the Python stack of every thread (event loop,
+  model executors, pipeline stages) every ``sample_interval_ms``;
+- forward passes are run under ``torch.profiler`` for operator-level
+  timings. The profiler only sees the thread that started it and only one
+  can run at a time, so each forward batch is profiled on its own thread
+  and batches that start while another one is being profiled run
+  unprofiled (they still show up in the Python samples).
+
+The capture comes back as a Chrome trace (chrome://tracing, Perfetto) or as
+folded stacks for flamegraph.pl / speedscope. When no capture is running
+the hot path only checks a module global.
+
+Captures cover the server process that received the request; with several
+gunicorn workers, profile each worker separately.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as Tally
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHROME = "chrome"
+FOLDED = "folded"
+FORMATS = (CHROME, FOLDED)
+
+# The running capture, if any; the hot path only reads this
+_active = None
+
+# torch.profiler allows one active profiler per process
+_torch_profiler = threading.Lock()
+
+class ProfilingInProgress(Exception):
+    """Raised when a capture is requested while another one is running"""
+
+class ProfileCapture:
+    """One profiling window: Python stack samples plus per-batch torch operator timings"""
+
+    def __init__(
+        self,
+        duration_seconds: float,
+        max_requests: Optional[int] = None,
+        sample_interval_ms: float = 10,
+        torch_ops: bool = True,
+        max_events: Optional[int] = None
+    ):
+        self.duration_seconds = duration_seconds
+        self.max_requests = max_requests
+        self.sample_interval = max(0.001, sample_interval_ms / 1000)
+        self.torch_ops = torch_ops
+        self.max_events = max_events or int(os.getenv("PROFILE_MAX_EVENTS", 200000))
+
+        self.requests = 0
+        self.samples: List[Tuple[float, int, Tuple[str, ...]]] = []
+        self.torch_events: List[Dict] = []
+        self.profiled_batches = 0
+        self.skipped_batches = 0
+        self.thread_names: Dict[int, str] = {}
+
+        self._events_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = None
+        self._done = None
+        self._loop = None
+        self.started_at = None
+        self.finished_at = None
+
+    async def run(self) -> "ProfileCapture":
+        """Capture until the duration elapses or ``max_requests`` requests complete"""
+        global _active
+        if _active is not None:
+            raise ProfilingInProgress("A profiling capture is already running")
+
+        self._loop = asyncio.get_running_loop()
+        self._done = asyncio.Event()
+        self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self.started_at = time.time()
+        _active = self
+        self._sampler.start()
+        logger.info(
+            f"Profiling for up to {self.duration_seconds}s"
+            + (f" or {self.max_requests} requests" if self.max_requests else "")
+        )
+
+        try:
+            await asyncio.wait_for(self._done.wait(), self.duration_seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            _active = None
+            self._stopped.set()
+            # Let the last sample and any batch being profiled finish
+            await self._loop.run_in_executor(None, self._sampler.join)
+            await self._loop.run_in_executor(None, _torch_profiler.acquire)
+            _torch_profiler.release()
+            self.finished_at = time.time()
+
+        logger.info(
+            f"Profile captured: {len(self.samples)} stack samples, {self.profiled_batches} profiled forward batches "
+            f"over {self.finished_at - self.started_at:.1f}s and {self.requests} requests"
+        )
+        return self
+
+    def request_done(self):
+        """Event-loop side: count a completed analysis request"""
+        self.requests += 1
+        if self.max_requests and self.requests >= self.max_requests:
+            self._done.set()
+
+    def profile_forward(self, name: str, forward: Callable[..., Any], *args) -> Any:
+        """Model-thread side: run one forward call, under torch.profiler if no other batch is being profiled"""
+        if not self.torch_ops or self._stopped.is_set() or not _torch_profiler.acquire(blocking=False):
+            self.skipped_batches += 1
+            return forward(*args)
+
+        try:
+            from torch.profiler import ProfilerActivity, profile, record_function
+
+            with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as prof:
+                with record_function(f"{name}.forward"):
+                    result = forward(*args)
+            self._add_torch_events(name, prof)
+            return result
+        finally:
+            _torch_profiler.release()
+
+    def _add_torch_events(self, model: str, prof):
+        """Keep the batch's operator events as Chrome trace events on this thread"""
+        trace_start = prof.profiler.kineto_results.trace_start_us()
+        thread = threading.current_thread()
+        tid = thread.native_id
+        events = [
+            {
+                "name": event.name, "cat": "torch", "ph": "X", "pid": os.getpid(), "tid": tid,
+                "ts": trace_start + event.time_range.start,
+                "dur": event.time_range.end - event.time_range.start,
+                "args": {"model": model, "input_shapes": str(event.input_shapes)} if event.input_shapes else {"model": model}
+            }
+            for event in prof.events()
+        ]
+
+        with self._events_lock:
+            self.thread_names[tid] = thread.name
+            if len(self.torch_events) + len(events) > self.max_events:
+                self.skipped_batches += 1
+                return
+            self.torch_events.extend(events)
+            self.profiled_batches += 1
+
+    def _sample(self):
+        """Sampler thread: record every other thread's Python stack until stopped"""
+        own = threading.get_ident()
+        while not self._stopped.wait(self.sample_interval):
+            now = time.time() * 1e6
+            threads = {thread.ident: thread for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or ident not in threads:
+                    continue
+                thread = threads[ident]
+                self.thread_names[thread.native_id] = thread.name
+                self.samples.append((now, thread.native_id, _stack(frame)))
+
+            if len(self.samples) > self.max_events:
+                logger.warning("Profiling sample limit reached; stopping the sampler early")
+                return
+
+    def chrome_trace(self) -> Dict:
+        """Torch operators and sampled Python stacks as a Chrome trace"""
+        pid = os.getpid()
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self.thread_names.items()
+        ]
+        events.extend(self.torch_events)
+        events.extend(_sample_spans(self.samples, self.sample_interval * 1e6, pid))
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": self.summary()}
+
+    def folded(self) -> str:
+        """Sampled Python stacks in folded format, one ``thread;frame;...;frame count`` line per stack"""
+        counts = Tally(
+            ";".join((self.thread_names.get(tid, str(tid)),) + stack)
+            for _, tid, stack in self.samples
+        )
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+    def summary(self) -> Dict:
+        """What was captured, plus the operators with the most self time"""
+        calls, total, nested = Tally(), Tally(), Tally()
+        for tid_events in _by_thread(self.torch_events).values():
+            # Self time: subtract the time spent in operators called directly inside
+            enclosing = []
+            for event in sorted(tid_events, key=lambda e: (e["ts"], -e["dur"])):
+                while enclosing and enclosing[-1]["ts"] + enclosing[-1]["dur"] <= event["ts"]:
+                    enclosing.pop()
+                if enclosing:
+                    nested[enclosing[-1]["name"]] += event["dur"]
+                enclosing.append(event)
+                calls[event["name"]] += 1
+                total[event["name"]] += event["dur"]
+
+        top = sorted(calls, key=lambda name: total[name] - nested[name], reverse=True)[:25]
+        return {
+            "started_at": self.started_at,
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else 0,
+            "requests": self.requests,
+            "stack_samples": len(self.samples),
+            "sample_interval_ms": self.sample_interval * 1000,
+            "profiled_batches": self.profiled_batches,
+            "unprofiled_batches": self.skipped_batches,
+            "top_torch_ops": [
+                {
+                    "name": name, "calls": calls[name],
+                    "total_ms": round(total[name] / 1000, 3),
+                    "self_ms": round((total[name] - nested[name]) / 1000, 3)
+                }
+                for name in top
+            ]
+        }
+
+def profile_forward(name: str, forward: Callable[..., Any], *args) -> Any:
+    """Run a forward call, profiled if a capture is running"""
+    capture = _active
+    if capture is None:
+        return forward(*args)
+    return capture.profile_forward(name, forward, *args)
+
+def profile_request_done():
+    """Count a completed analysis request towards a running capture's ``max_requests``"""
+    capture = _active
+    if capture is not None:
+        capture.request_done()
+
+def measure_peak_memory(function: Callable[..., Any], *args) -> Tuple[Any, int]:
+    """Run ``function`` with torch.profiler tracking allocations; returns its result and the most bytes it held at once.
+
+    Waits for any forward pass being profiled by a capture to finish first.
+    """
+    from torch.profiler import ProfilerActivity, profile
+
+    with _torch_profiler:
+        with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+            result = function(*args)
+
+    held = peak = 0
+    for event in sorted(prof.profiler.kineto_results.events(), key=lambda event: event.start_us()):
+        if event.name() == "[memory]":
+            held += event.nbytes()
+            peak = max(peak, held)
+    return result, peak
+
+def _stack(frame) -> Tuple[str, ...]:
+    """A frame's call stack, outermost first"""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return tuple(reversed(frames))
+
+def _sample_spans(samples: List[Tuple[float, int, Tuple[str, ...]]], interval_us: float, pid: int) -> List[Dict]:
+    """Merge consecutive samples sharing a stack prefix into one span per frame (a flame chart per thread)"""
+    spans = []
+    for tid, thread_samples in _by_thread(samples, key=lambda sample: sample[1]).items():
+        open_frames: List[Tuple[str, float]] = []
+        last = None
+        for ts, _, stack in thread_samples:
+            common = 0
+            while common < len(open_frames) and common < len(stack) and open_frames[common][0] == stack[common]:
+                common += 1
+            for name, start in open_frames[common:]:
+                spans.append({"name": name, "cat": "python", "ph": "X", "pid": pid, "tid": tid, "ts": start, "dur": ts - start})
+            open_frames = open_frames[:common] + [(name, ts) for name in stack[common:]]
+            last = ts
+        for name, start in open_frames:
+            spans.append({
+                "name": name, "cat": "python", "ph": "X", "pid": pid, "tid": tid, "ts": start, "dur": last + interval_us - start
+            })
+    return spans
+
+def _by_thread(events, key=lambda event: event["tid"]) -> Dict[int, List]:
+    grouped: Dict[int, List] = {}
+    for event in events:
+        grouped.setdefault(key(event), []).append(event)
+    return grouped
@@ -0,0 +1,347 @@
+"""Model rollout: hot-swapping an analyzer's model and shadow-scoring candidates.
+
+A swap loads the new model on the rollout's own thread, warms it up and
+installs it with one assignment, so requests keep being served by the old
+model until then. Batches already running finish on the old model (the
+swap waits up to ``SWAP_DRAIN_TIMEOUT_SECONDS`` for them) and the new
+model's results live under a new cache namespace.
+
+A shadow candidate is loaded the same way but never answers requests: a
+``SHADOW_SAMPLE_RATE`` share of the texts the primary model scores is
+re-scored by the candidate in the background and the two answers are
+compared. Samples are dropped rather than queued once
+``SHADOW_MAX_PENDING`` texts are waiting, so shadowing never slows the
+primary path. Promoting the shadow model with a swap reuses it as loaded.
+
+Each server process serves its own copy of the models. With several
+gunicorn workers, ``RolloutSync`` keeps them in step: a swap or shadow
+change made through the admin API is published to a state file
+(``ROLLOUT_STATE_PATH``, a fresh one per gunicorn run) that every worker
+polls every ``ROLLOUT_POLL_SECONDS`` and applies to itself, including
+workers that restart later. Until every worker has caught up, requests
+may be answered by either model version. Shadow statistics are per
+worker: each worker compares a sample of its own traffic, and the admin
+API reports the worker that answered.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import torch
+
+from src.bundle import release_preloaded
+from src.inference import model_thread_settings
+from src.metrics import MODEL_SWAPS, SHADOW_COMPARISONS
+
+logger = logging.getLogger(__name__)
+
+class LoadedModel(NamedTuple):
+    """Everything an analyzer needs to serve one model version"""
+    model_name: str
+    model: Any
+    tokenizer: Any
+    version: str
+    classifier: Any
+    window_tokenizer: Any = None
+
+class SwapInProgress(Exception):
+    """Another swap or shadow load is already running for this model"""
+
+class ShadowRun:
+    """Agreement statistics between the primary model and one shadow candidate"""
+
+    def __init__(self, name: str, loaded: LoadedModel, sample_rate: float):
+        self.loaded = loaded
+        self.sample_rate = sample_rate
+        self.started_at = time.time()
+        self.compared = 0
+        self.agreed = 0
+        self.errors = 0
+        self.dropped = 0
+        self.pending = 0
+        self.score_diff = 0.0
+        self.disagreements: Counter = Counter()
+        self._agree_counter = SHADOW_COMPARISONS.labels(name, "agree")
+        self._disagree_counter = SHADOW_COMPARISONS.labels(name, "disagree")
+
+    def record(self, primary: Dict, candidate: Dict, field: str, score_field: Optional[str]):
+        """Count one compared text"""
+        if "error" in candidate:
+            self.errors += 1
+            return
+
+        self.compared += 1
+        if primary[field] == candidate[field]:
+            self.agreed += 1
+            self._agree_counter.inc()
+        else:
+            self.disagreements[f"{primary[field]}->{candidate[field]}"] += 1
+            self._disagree_counter.inc()
+        if score_field:
+            self.score_diff += abs(primary[score_field] - candidate[score_field])
+
+    def stats(self) -> Dict:
+        return {
+            "model_name": self.loaded.model_name,
+            "version": self.loaded.version,
+            "sample_rate": self.sample_rate,
+            "running_seconds": round(time.time() - self.started_at, 1),
+            "compared": self.compared,
+            "agreement_rate": round(self.agreed / self.compared, 4) if self.compared else None,
+            "mean_score_diff": round(self.score_diff / self.compared, 4) if self.compared else None,
+            "disagreements": dict(self.disagreements.most_common(10)),
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "pending": self.pending
+        }
+
+class ModelRollout:
+    """Hot swaps and shadow scoring for one analyzer.
+
+    The analyzer provides ``build_model(model_name) -> LoadedModel``,
+    ``warm_model(classifier)``, ``install_model(loaded) -> LoadedModel``,
+    ``classify_with(classifier, texts)`` and its ``batcher``. ``field`` is
+    the result key compared for agreement, ``score_field`` an optional
+    numeric key whose mean absolute difference is reported.
+    """
+
+    def __init__(self, analyzer, model_key: str, field: str, score_field: Optional[str] = None):
+        self.analyzer = analyzer
+        self.model_key = model_key
+        self.name = model_key.lower()
+        self.field = field
+        self.score_field = score_field
+        self.default_sample_rate = float(os.getenv("SHADOW_SAMPLE_RATE", 0.05))
+        self.max_pending = max(1, int(os.getenv("SHADOW_MAX_PENDING", 256)))
+        self.drain_timeout = float(os.getenv("SWAP_DRAIN_TIMEOUT_SECONDS", 30))
+
+        # Loads, warmups and shadow forward passes share one thread with the
+        # same torch thread count as the serving executor
+        self.executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=f"{model_key.lower()}-rollout",
+            initializer=torch.set_num_threads,
+            initargs=(model_thread_settings(model_key)[1],)
+        )
+        self.shadow: Optional[ShadowRun] = None
+        self.swaps = 0
+        self.last_swap: Optional[Dict] = None
+        # Set when several workers share the rollout state
+        self.sync: Optional["RolloutSync"] = None
+        self._busy = False
+        self._failed_state = None
+        self._tasks = set()
+
+    async def swap(self, model_name: str, publish: bool = True) -> Dict:
+        """Load, warm up and install ``model_name``, then wait for in-flight batches to drain.
+
+        With ``publish``, the other workers are told to follow.
+        """
+        with self._exclusive():
+            started = time.perf_counter()
+            try:
+                if self.shadow is not None and self.shadow.loaded.model_name == model_name:
+                    # Promote the shadow candidate; it is already loaded and warm
+                    loaded, self.shadow = self.shadow.loaded, None
+                else:
+                    loaded = await asyncio.get_running_loop().run_in_executor(self.executor, self._load, model_name)
+            except Exception:
+                MODEL_SWAPS.labels(self.name, "failed").inc()
+                raise
+
+            previous = self.analyzer.install_model(loaded)
+            if self.sync is not None and publish:
+                self.sync.publish(self.name, model_name=model_name, shadow=self._shadow_state())
+            undrained = await self.analyzer.batcher.drain(self.drain_timeout)
+            # A preloaded model would otherwise stay referenced after it is swapped out
+            release_preloaded(self.name, previous.model_name)
+            MODEL_SWAPS.labels(self.name, "success").inc()
+
+            self.swaps += 1
+            self.last_swap = {
+                "previous": {"model_name": previous.model_name, "version": previous.version},
+                "current": {"model_name": loaded.model_name, "version": loaded.version},
+                "seconds": round(time.perf_counter() - started, 2),
+                "undrained_batches": undrained,
+                "swapped_at": time.time()
+            }
+            logger.info(
+                f"Swapped {self.name} model {previous.model_name}@{previous.version} -> "
+                f"{loaded.model_name}@{loaded.version} in {self.last_swap['seconds']}s"
+            )
+            return self.last_swap
+
+    async def start_shadow(self, model_name: str, sample_rate: Optional[float] = None, publish: bool = True) -> Dict:
+        """Load ``model_name`` as the shadow candidate, replacing any current one"""
+        sample_rate = self.default_sample_rate if sample_rate is None else sample_rate
+        with self._exclusive():
+            loaded = await asyncio.get_running_loop().run_in_executor(self.executor, self._load, model_name)
+            self.shadow = ShadowRun(self.name, loaded, min(max(0.0, sample_rate), 1.0))
+            if self.sync is not None and publish:
+                self.sync.publish(self.name, shadow=self._shadow_state())
+            logger.info(f"Shadow scoring {self.name} traffic with {model_name}@{loaded.version}")
+            return self.shadow.stats()
+
+    def stop_shadow(self, publish: bool = True) -> Optional[Dict]:
+        """Stop shadow scoring, returning the final statistics"""
+        shadow, self.shadow = self.shadow, None
+        if self.sync is not None and publish:
+            self.sync.publish(self.name, shadow=None)
+        return shadow.stats() if shadow is not None else None
+
+    async def reconcile(self, desired: Dict):
+        """Apply the published state (``model_name``, ``shadow``) to this worker.
+
+        A load that fails isn't retried until the published state changes.
+        """
+        state = json.dumps(desired, sort_keys=True)
+        if self._busy or state == self._failed_state:
+            return
+
+        try:
+            model_name = desired.get("model_name")
+            if model_name and model_name != self.analyzer.model_name:
+                await self.swap(model_name, publish=False)
+
+            if "shadow" in desired:
+                wanted, current = desired["shadow"], self.shadow
+                if wanted is None:
+                    if current is not None:
+                        self.stop_shadow(publish=False)
+                elif current is None or current.loaded.model_name != wanted["model_name"]:
+                    await self.start_shadow(wanted["model_name"], wanted["sample_rate"], publish=False)
+                else:
+                    current.sample_rate = wanted["sample_rate"]
+        except SwapInProgress:
+            pass
+        except Exception as e:
+            self._failed_state = state
+            logger.error(f"Could not apply the published {self.name} rollout state {state}: {e}")
+
+    def shadow_sample(self, texts: List[str], results: List[Dict]):
+        """Re-score a random sample of the primary model's answers with the shadow candidate"""
+        shadow = self.shadow
+        if shadow is None:
+            return
+
+        sample = [
+            (text, result) for text, result in zip(texts, results)
+            if "error" not in result and random.random() < shadow.sample_rate
+        ]
+        if not sample:
+            return
+        if shadow.pending + len(sample) > self.max_pending:
+            shadow.dropped += len(sample)
+            return
+
+        shadow.pending += len(sample)
+        task = asyncio.get_running_loop().create_task(self._compare(shadow, sample))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> Dict:
+        return {
+            "worker": os.getpid(),
+            "swaps": self.swaps,
+            "last_swap": self.last_swap,
+            "shadow": self.shadow.stats() if self.shadow is not None else None
+        }
+
+    def _shadow_state(self) -> Optional[Dict]:
+        shadow = self.shadow
+        return {"model_name": shadow.loaded.model_name, "sample_rate": shadow.sample_rate} if shadow else None
+
+    @contextmanager
+    def _exclusive(self):
+        """One load at a time; a second one fails fast instead of queueing"""
+        if self._busy:
+            raise SwapInProgress(f"A {self.name} model load is already in progress")
+        self._busy = True
+        try:
+            yield
+        finally:
+            self._busy = False
+
+    def _load(self, model_name: str) -> LoadedModel:
+        """Load a model and (if warmup is enabled) warm it up, on the rollout thread"""
+        loaded = self.analyzer.build_model(model_name)
+        if os.getenv("WARMUP_ENABLED", "True").lower() == "true":
+            self.analyzer.warm_model(loaded.classifier)
+        return loaded
+
+    async def _compare(self, shadow: ShadowRun, sample: List[Tuple[str, Dict]]):
+        """Score the sampled texts with the shadow candidate and record agreement"""
+        try:
+            candidate = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.analyzer.classify_with, shadow.loaded.classifier, [text for text, _ in sample]
+            )
+        except Exception as e:
+            shadow.errors += len(sample)
+            logger.error(f"Shadow scoring for {self.name} failed: {e}")
+            return
+        finally:
+            shadow.pending -= len(sample)
+
+        for (_, primary), result in zip(sample, candidate):
+            shadow.record(primary, result, self.field, self.score_field)
+
+class RolloutSync:
+    """Shares the admin-set rollout state between worker processes through a JSON file.
+
+    The file maps each analyzer's name to its desired ``model_name`` and
+    ``shadow`` (``{"model_name", "sample_rate"}`` or null). Writes replace
+    the file atomically under an exclusive lock; every worker polls it and
+    reconciles its own rollouts.
+    """
+
+    def __init__(self, path: str, poll_seconds: Optional[float] = None):
+        self.path = path
+        self.poll_seconds = poll_seconds if poll_seconds is not None else float(os.getenv("ROLLOUT_POLL_SECONDS", 2))
+        self._task = None
+
+    def publish(self, name: str, **changes):
+        """Update one analyzer's entry"""
+        with open(f"{self.path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state = self.read()
+            state.setdefault(name, {}).update(changes)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+
+    def read(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def start(self, rollouts: Dict[str, ModelRollout]):
+        """Attach to the rollouts and follow the published state from now on"""
+        for rollout in rollouts.values():
+            rollout.sync = self
+        self._task = asyncio.get_running_loop().create_task(self._run(rollouts))
+        logger.info(f"Following rollout state in {self.path}")
+
+    async def _run(self, rollouts: Dict[str, ModelRollout]):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                state = await loop.run_in_executor(None, self.read)
+                for name, rollout in rollouts.items():
+                    if name in state:
+                        await rollout.reconcile(state[name])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error following rollout state: {e}")
+            await asyncio.sleep(self.poll_seconds)
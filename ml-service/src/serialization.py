@@ -0,0 +1,112 @@
+"""Response encodings negotiated from the ``Accept`` header.
+
+``application/json`` stays the default and keeps the documented response
+shape; it is written with orjson when that is installed.
+``application/msgpack`` carries the same document as MessagePack. The
+columnar types (``application/vnd.safechat.columnar+json`` and
+``+msgpack``) replace a batch's list of result objects with one array per
+field, so keys are sent once per response instead of once per text.
+
+Documents are built by the service itself and encoded as they are; they
+are not validated against the pydantic response models again.
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+COLUMNAR_JSON = "application/vnd.safechat.columnar+json"
+COLUMNAR_MSGPACK = "application/vnd.safechat.columnar+msgpack"
+
+_ALIASES = {"application/x-msgpack": MSGPACK, "*/*": JSON, "application/*": JSON}
+
+# Result fields that hold lists of objects, and the fields of those objects
+NESTED_COLUMNS = {"secondary_emotions": ("emotion", "intensity")}
+
+def available_media_types() -> List[str]:
+    """Media types this process can produce (msgpack ones need the msgpack package)"""
+    media_types = [JSON, COLUMNAR_JSON]
+    if msgpack is not None:
+        media_types += [MSGPACK, COLUMNAR_MSGPACK]
+    return media_types
+
+def negotiate(accept: Optional[str]) -> str:
+    """The supported media type the client prefers most; JSON if it accepts none of them"""
+    if not accept:
+        return JSON
+
+    available = available_media_types()
+    best, best_quality = JSON, 0.0
+    for part in accept.split(","):
+        media_type, *params = [piece.strip() for piece in part.split(";")]
+        media_type = media_type.lower()
+        media_type = _ALIASES.get(media_type, media_type)
+
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        # Earlier entries win ties
+        if media_type in available and quality > best_quality:
+            best, best_quality = media_type, quality
+    return best
+
+def columnar(results: List[Dict]) -> Dict:
+    """One array per result field.
+
+    List-of-object fields (``secondary_emotions``) become one array of
+    lists per sub-field. Fields only some results have (``error``,
+    ``window``) are included when any result has them, with ``None`` for
+    the rest.
+    """
+    fields = list(dict.fromkeys(field for result in results for field in result))
+    columns = {}
+    for field in fields:
+        values = [result.get(field) for result in results]
+        if field in NESTED_COLUMNS:
+            columns[field] = {
+                sub: [[item[sub] for item in value] if value is not None else None for value in values]
+                for sub in NESTED_COLUMNS[field]
+            }
+        else:
+            columns[field] = values
+    return {"count": len(results), "columns": columns}
+
+def encode(document: Dict, media_type: str) -> bytes:
+    """Serialize a response document as ``media_type`` (one of ``available_media_types``)"""
+    if media_type in (COLUMNAR_JSON, COLUMNAR_MSGPACK) and isinstance(document.get("results"), list):
+        document = {**document, "results": columnar(document["results"])}
+
+    if media_type in (MSGPACK, COLUMNAR_MSGPACK):
+        return msgpack.packb(document, default=_default, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(document, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(document, default=_default, separators=(",", ":")).encode()
+
+def _default(value: Any) -> Any:
+    """Types the encoders don't handle natively"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
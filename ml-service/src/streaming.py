@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+from typing import AsyncIterator, Dict
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body generator may keep reading the request.
+
+    Starlette's StreamingResponse watches for client disconnects by calling
+    ``receive()`` itself, which swallows request body chunks that are still
+    arriving. Here the body generator is the only consumer of ``receive``
+    (``request.stream()`` raises ``ClientDisconnect`` on its own), so the
+    request and response can be streamed at the same time.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+
+        if self.background is not None:
+            await self.background()
+
+async def read_ndjson(request: Request) -> AsyncIterator[Dict]:
+    """Yield one item per line of an NDJSON request body as it arrives.
+
+    Each item is the parsed object plus ``line`` (1-based). Lines that are
+    not a JSON object with a string ``text`` are yielded with an ``error``
+    instead. Lines longer than ``MAX_STREAM_LINE_BYTES`` are rejected without
+    being parsed, so memory stays bounded however long the body is; their
+    ``id`` cannot be recovered, so those items only carry the line number.
+    """
+    max_line_bytes = int(os.getenv("MAX_STREAM_LINE_BYTES", 64 * 1024))
+    buffer = bytearray()
+    line_number = 0
+    skipping = False
+
+    async for chunk in request.stream():
+        start = 0
+        while True:
+            newline = chunk.find(b"\n", start)
+            if newline == -1:
+                if not skipping:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_bytes:
+                        # Drop the rest of this line as it streams past
+                        line_number += 1
+                        skipping = True
+                        buffer.clear()
+                        yield {"line": line_number, "error": "Line too long"}
+                break
+
+            if skipping:
+                skipping = False
+            elif len(buffer) + newline - start > max_line_bytes:
+                # Same limit whether or not the line arrived in one chunk
+                line_number += 1
+                buffer.clear()
+                yield {"line": line_number, "error": "Line too long"}
+            else:
+                buffer += chunk[start:newline]
+                line_number += 1
+                item = parse_item(bytes(buffer), line_number)
+                buffer.clear()
+                if item is not None:
+                    yield item
+            start = newline + 1
+
+    if buffer and not skipping:
+        item = parse_item(bytes(buffer), line_number + 1)
+        if item is not None:
+            yield item
+
+def parse_item(raw: bytes, line_number: int):
+    """Parse one NDJSON line (or WebSocket frame) into an item, or None if blank"""
+    if not raw.strip():
+        return None
+
+    try:
+        item = json.loads(raw)
+    except ValueError:
+        return {"line": line_number, "error": "Invalid JSON"}
+
+    if not isinstance(item, dict):
+        return {"line": line_number, "error": "Expected a JSON object"}
+
+    if not isinstance(item.get("text"), str) or not item["text"]:
+        return {"line": line_number, "id": item.get("id"), "error": "Missing text"}
+
+    item["line"] = line_number
+    return item
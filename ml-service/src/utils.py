@@ -1,30 +1,192 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+import random
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+# Set per request by TraceMiddleware; "-" outside a request
+trace_id: ContextVar[str] = ContextVar("trace_id", default="-")
+# Whether this request's sampled info logs are written
+log_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+# Per-request info logs go here, so LOG_SAMPLE_RATE can thin them out
+request_logger = logging.getLogger("ml_service.requests")
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "trace_id"}
+
+_handler = None
+_listener = None
 
 def setup_logging():
-    """Setup logging configuration"""
+    """Log through a queue so handlers write on a background thread, never on the event loop.
     
-    # Create logs directory if it doesn't exist
-    os.makedirs("logs", exist_ok=True)
+    Output is JSON lines (``LOG_FORMAT=json``, the default) or plain text,
+    to stderr and a size-rotated ``LOG_FILE``. Every record carries the
+    current request's trace id. Info logs on ``request_logger`` are kept
+    for a ``LOG_SAMPLE_RATE`` share of requests; warnings and errors are
+    always written.
+    """
+    global _handler, _listener
     
-    # Configure logging
     log_level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper())
+    _stop_listener()
+    _handler = _QueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000))))
+    _handler.addFilter(_add_trace_id)
     
-    logging.basicConfig(
-        level=log_level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(f"logs/ml_service_{datetime.now().strftime('%Y%m%d')}.log"),
-            logging.StreamHandler()
-        ]
-    )
+    root = logging.getLogger()
+    root.setLevel(log_level)
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    request_logger.filters = [_sample_request_logs]
+    
+    _listener = _start_listener(_handler)
     
     logger = logging.getLogger(__name__)
     logger.info("Logging setup complete")
     
     return logger
 
+def _output_handlers():
+    """The handlers the listener thread writes to"""
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s')
+    
+    handlers = [logging.StreamHandler()]
+    log_file = os.getenv("LOG_FILE", "logs/ml_service.log")
+    if log_file:
+        # Worker processes rotating one shared file would rename it under each other
+        if int(os.getenv("NUM_WORKERS", 1)) > 1:
+            stem, extension = os.path.splitext(log_file)
+            log_file = f"{stem}.{os.getpid()}{extension}"
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=int(os.getenv("LOG_MAX_BYTES", 50 * 1024 * 1024)),
+            backupCount=int(os.getenv("LOG_BACKUP_COUNT", 5))
+        ))
+    
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+def _start_listener(handler: "_QueueHandler") -> logging.handlers.QueueListener:
+    listener = logging.handlers.QueueListener(handler.queue, *_output_handlers(), respect_handler_level=True)
+    listener.start()
+    return listener
+
+def _stop_listener():
+    """Write out what is still queued"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+def _restart_listener():
+    """In a forked child: the listener thread didn't survive the fork, and the
+    parent's queue may have been locked mid-put, so start both afresh"""
+    global _listener
+    if _handler is None:
+        return
+    _handler.queue = queue.Queue(maxsize=_handler.queue.maxsize)
+    _listener = _start_listener(_handler)
+
+atexit.register(_stop_listener)
+# gunicorn preloads the app, and so sets up logging, in the master before forking workers
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Drops records instead of blocking the caller when the writer thread falls behind"""
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+    
+    def prepare(self, record):
+        """Merge the arguments into the message, but keep the exception for the writer's formatter.
+        
+        The stdlib version formats the record here and clears ``exc_info``,
+        which would fold tracebacks into the message instead of the JSON
+        ``exception`` field.
+        """
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def _add_trace_id(record: logging.LogRecord) -> bool:
+    """Runs in the caller's thread, where the request's context is still current"""
+    record.trace_id = trace_id.get()
+    return True
+
+def _sample_request_logs(record: logging.LogRecord) -> bool:
+    return record.levelno >= logging.WARNING or log_sampled.get()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, trace id and any ``extra`` fields"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "trace_id": getattr(record, "trace_id", "-"),
+            "process": record.process,
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TraceMiddleware:
+    """Gives every HTTP request and WebSocket connection a trace id for its logs.
+    
+    The id comes from the ``X-Request-ID`` header if the caller sent one
+    and is echoed back on HTTP responses. Whether the request's info logs
+    are sampled in is decided here, once, so a request's logs are kept or
+    dropped together.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self.sample_rate = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        
+        request_id = dict(scope.get("headers") or []).get(b"x-request-id", b"").decode("latin-1")[:64]
+        request_id = request_id or uuid.uuid4().hex[:16]
+        trace_token = trace_id.set(request_id)
+        sampled_token = log_sampled.set(self.sample_rate >= 1 or random.random() < self.sample_rate)
+        
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            trace_id.reset(trace_token)
+            log_sampled.reset(sampled_token)
+
 def validate_text_input(text: str, max_length: int = 2000) -> bool:
     """Validate text input"""
     if not text or not isinstance(text, str):
@@ -64,4 +226,21 @@ def calculate_confidence_threshold(emotion_intensity: float, text_length: int) -
     elif text_length > 500:
         base_threshold -= 0.05  # Lower threshold for long text
     
-    return max(0.5, min(0.9, base_threshold))  # Clamp between 0.5 and 0.9
\ No newline at end of file
+    return max(0.5, min(0.9, base_threshold))  # Clamp between 0.5 and 0.9
+
+def process_memory() -> dict:
+    """Resident memory of this process now, the part of it shared with other processes, and its peak, in bytes"""
+    import resource
+    
+    memory = {"rss_bytes": None, "shared_bytes": None}
+    try:
+        with open("/proc/self/statm") as f:
+            pages = f.read().split()
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        memory = {"rss_bytes": int(pages[1]) * page_size, "shared_bytes": int(pages[2]) * page_size}
+    except (OSError, ValueError, IndexError):
+        pass
+    
+    # ru_maxrss is in KiB on Linux, and only updated periodically by the kernel
+    memory["peak_rss_bytes"] = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, memory["rss_bytes"] or 0)
+    return memory
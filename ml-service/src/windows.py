@@ -0,0 +1,102 @@
+"""Sliding windows over texts longer than the models' input length.
+
+A long text is split into overlapping windows of at most
+``LONG_TEXT_WINDOW_TOKENS`` tokens that overlap by
+``LONG_TEXT_WINDOW_OVERLAP``. Windows are character spans of the original
+text, so they go through the usual caching, cascade and keyword paths like
+any other text. Texts that would need more than ``LONG_TEXT_MAX_WINDOWS``
+windows get that many, spread evenly over the text, so a single input
+never costs more than that many model inputs.
+"""
+import asyncio
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+_WORD = re.compile(r"\S+")
+
+# Tokenizing long texts is CPU work, kept off the event loop. One thread,
+# so the tokenizer handed to window_texts is never used concurrently.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="windows")
+
+class TextWindow(NamedTuple):
+    text: str
+    start: int  # character offsets into the original text
+    end: int
+
+class WindowSettings(NamedTuple):
+    window_tokens: int
+    overlap: int
+    max_windows: int
+
+    @classmethod
+    def from_env(cls) -> "WindowSettings":
+        window_tokens = max(8, int(os.getenv("LONG_TEXT_WINDOW_TOKENS", 448)))
+        overlap = min(window_tokens // 2, max(0, int(os.getenv("LONG_TEXT_WINDOW_OVERLAP", 64))))
+        return cls(window_tokens, overlap, max(1, int(os.getenv("LONG_TEXT_MAX_WINDOWS", 16))))
+
+def needs_windows(text: str, settings: WindowSettings) -> bool:
+    """Cheap pre-check before tokenizing: could ``text`` have more tokens than a window holds?
+
+    Characters are no bound: byte-level BPE tokenizers (RoBERTa's) can
+    spend up to four tokens on one emoji or CJK character. No tokenizer
+    emits more tokens than the text has UTF-8 bytes, so only texts with more
+    bytes than ``window_tokens`` are tokenized to find out.
+    """
+    return len(text) > settings.window_tokens or len(text.encode("utf-8")) > settings.window_tokens
+
+async def window_texts(texts: List[str], tokenizer, settings: WindowSettings) -> List[Optional[List[TextWindow]]]:
+    """Windows for every text that needs more than one, None for the rest.
+
+    ``tokenizer`` must not be shared with other threads: fast tokenizers
+    change internal state when called with different truncation settings.
+    """
+    windows: List[Optional[List[TextWindow]]] = [None] * len(texts)
+    long_texts = [i for i, text in enumerate(texts) if needs_windows(text, settings)]
+    if not long_texts:
+        return windows
+
+    loop = asyncio.get_running_loop()
+    split = await loop.run_in_executor(
+        _executor, lambda: [split_windows(texts[i], tokenizer, settings) for i in long_texts]
+    )
+    for i, text_windows in zip(long_texts, split):
+        if len(text_windows) > 1:
+            windows[i] = text_windows
+    return windows
+
+def split_windows(text: str, tokenizer=None, settings: Optional[WindowSettings] = None) -> List[TextWindow]:
+    """Overlapping windows covering ``text``; a single window if it already fits.
+
+    Token boundaries come from a fast tokenizer's offset mapping; without
+    one, whitespace-separated words stand in for tokens.
+    """
+    settings = settings or WindowSettings.from_env()
+    spans = _token_spans(text, tokenizer)
+    if len(spans) <= settings.window_tokens:
+        return [TextWindow(text, 0, len(text))]
+
+    last_start = len(spans) - settings.window_tokens
+    stride = settings.window_tokens - settings.overlap
+    count = math.ceil(last_start / stride) + 1
+    if count <= settings.max_windows:
+        starts = [min(i * stride, last_start) for i in range(count)]
+    else:
+        starts = np.linspace(0, last_start, settings.max_windows).round().astype(int).tolist()
+
+    windows = []
+    for start in starts:
+        first, last = spans[start], spans[start + settings.window_tokens - 1]
+        windows.append(TextWindow(text[first[0]:last[1]], first[0], last[1]))
+    return windows
+
+def _token_spans(text: str, tokenizer) -> List[Tuple[int, int]]:
+    """Character span of every token, skipping special tokens"""
+    if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+        encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, truncation=False, verbose=False)
+        return [tuple(span) for span in encoded["offset_mapping"] if span[1] > span[0]]
+    return [match.span() for match in _WORD.finditer(text)]
@@ -1,11 +1,23 @@
 import pytest
 import asyncio
+import json
+import numpy as np
 from fastapi.testclient import TestClient
+import src.main
 from src.main import app
 from src.analyzer import EmotionAnalyzer, AbuseDetector
 
 client = TestClient(app)
 
+class StubClassifier:
+    """Stands in for SequenceClassifier with fixed label probabilities"""
+    def __init__(self, scores):
+        self.labels = list(scores)
+        self.scores = np.array(list(scores.values()), dtype=np.float32)
+
+    def predict(self, texts):
+        return np.tile(self.scores, (len(texts), 1))
+
 class TestMLService:
     def test_health_endpoint(self):
         """Test health check endpoint"""
@@ -38,7 +50,7 @@ class TestMLService:
     def test_analyze_endpoint_long_text(self):
         """Test text analysis with text that's too long"""
         test_data = {
-            "text": "a" * 3000  # Exceeds max length
+            "text": "a" * 30000  # Exceeds max length
         }
         response = client.post("/analyze", json=test_data)
         assert response.status_code == 400
@@ -69,6 +81,306 @@ class TestMLService:
         assert "emotion_model" in data
         assert "abuse_model" in data
 
+@pytest.fixture
+def stub_models(monkeypatch):
+    """Serve requests from analyzers backed by stub classifiers"""
+    emotion = EmotionAnalyzer()
+    emotion.model = True
+    emotion.classifier = StubClassifier({'joy': 0.8, 'neutral': 0.2})
+    
+    abuse = AbuseDetector()
+    abuse.model = True
+    abuse.classifier = StubClassifier({'toxic': 0.1})
+    
+    monkeypatch.setattr(src.main, "emotion_analyzer", emotion)
+    monkeypatch.setattr(src.main, "abuse_detector", abuse)
+    return emotion, abuse
+
+class TestStreaming:
+    def test_stream_returns_one_line_per_input(self, stub_models, monkeypatch):
+        """Every NDJSON input line gets a result line carrying its id"""
+        monkeypatch.setenv("STREAM_CHUNK_SIZE", "2")
+        lines = [
+            json.dumps({"id": "a", "text": "I love this!"}),
+            "not json",
+            json.dumps({"text": "no id here"}),
+            "",
+            json.dumps({"id": 7, "text": "x" * 30000}),
+        ]
+        
+        def body():
+            for line in lines:
+                yield (line + "\n").encode()
+        
+        response = client.post("/batch-analyze/stream", content=body())
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["id"] for r in results] == ["a", 2, 3, 7]
+        assert results[0]["emotion"] == "joy"
+        assert results[1]["error"] == "Invalid JSON"
+        assert "error" not in results[2]
+        assert results[3]["error"] == "Text too long"
+
+    @pytest.mark.parametrize("split", [False, True])
+    def test_long_lines_rejected_however_chunked(self, stub_models, monkeypatch, split):
+        """The line limit applies whether a long line arrives in one chunk or several"""
+        monkeypatch.setenv("MAX_STREAM_LINE_BYTES", "40")
+        long_line = json.dumps({"id": "long", "text": "x" * 100}).encode()
+        short_line = json.dumps({"id": "ok", "text": "hi"}).encode()
+        chunks = [long_line[:50], long_line[50:] + b"\n" + short_line + b"\n"] if split else [long_line + b"\n" + short_line + b"\n"]
+        
+        response = client.post("/batch-analyze/stream", content=iter(chunks))
+        
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["id"] for r in results] == [1, "ok"]
+        assert results[0]["error"] == "Line too long"
+        assert "error" not in results[1]
+
+class TestWebSocket:
+    def test_answers_every_frame_with_its_id(self, stub_models):
+        """Each frame gets one result frame; invalid frames get an error result"""
+        with client.websocket_connect("/ws/analyze") as websocket:
+            websocket.send_text(json.dumps({"id": "a", "text": "I love this!"}))
+            websocket.send_text("not json")
+            websocket.send_text(json.dumps({"text": "no id here"}))
+            results = {}
+            for _ in range(3):
+                result = websocket.receive_json()
+                results[result["id"]] = result
+        
+        assert set(results) == {"a", 2, 3}
+        assert results["a"]["emotion"] == "joy"
+        assert results[2]["error"] == "Invalid JSON"
+        assert "error" not in results[3]
+    
+    def test_in_flight_frames_are_bounded(self, stub_models, monkeypatch):
+        """No more than WS_MAX_IN_FLIGHT frames per connection are analyzed at once"""
+        monkeypatch.setenv("WS_MAX_IN_FLIGHT", "2")
+        active = []
+        peak = []
+        
+        async def slow_analyze_message(emotion, abuse, text):
+            active.append(text)
+            peak.append(len(active))
+            await asyncio.sleep(0.05)
+            active.remove(text)
+            return {"emotion": "joy"}
+        
+        monkeypatch.setattr(src.main, "analyze_message", slow_analyze_message)
+        
+        with client.websocket_connect("/ws/analyze") as websocket:
+            for i in range(6):
+                websocket.send_text(json.dumps({"id": i, "text": f"message {i}"}))
+            ids = sorted(websocket.receive_json()["id"] for _ in range(6))
+        
+        assert ids == list(range(6))
+        assert max(peak) == 2
+    
+    def test_failed_analysis_still_answers_frame(self, stub_models, monkeypatch):
+        """A frame whose analysis raises gets an error result carrying its id"""
+        async def failing_analyze_message(emotion, abuse, text):
+            raise RuntimeError("boom")
+        
+        monkeypatch.setattr(src.main, "analyze_message", failing_analyze_message)
+        
+        with client.websocket_connect("/ws/analyze") as websocket:
+            websocket.send_text(json.dumps({"id": "x", "text": "hello"}))
+            result = websocket.receive_json()
+        
+        assert result["id"] == "x"
+        assert result["error"] == "Internal server error"
+    
+    def test_closes_when_models_not_loaded(self, monkeypatch):
+        """Connections are refused with 1013 until the models are loaded"""
+        from starlette.websockets import WebSocketDisconnect
+        monkeypatch.setattr(src.main, "emotion_analyzer", None)
+        
+        with client.websocket_connect("/ws/analyze") as websocket:
+            with pytest.raises(WebSocketDisconnect) as exc_info:
+                websocket.receive_text()
+        assert exc_info.value.code == 1013
+
+class TestAdmission:
+    def test_full_queue_answers_429_with_retry_after(self, stub_models, monkeypatch):
+        """Overload sheds the request with 429 and Retry-After instead of queueing it"""
+        from src.admission import QueueFull
+        emotion, _ = stub_models
+        
+        async def full(*args):
+            raise QueueFull(2.5)
+        
+        monkeypatch.setattr(emotion, "analyze", full)
+        monkeypatch.setattr(emotion, "analyze_batch", full)
+        
+        response = client.post("/analyze", json={"text": "hello"})
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "3"
+        
+        response = client.post("/batch-analyze", json={"texts": ["hello"]})
+        assert response.status_code == 429
+    
+    def test_expired_deadline_answers_504(self, stub_models):
+        """A request whose deadline has already passed never reaches the model"""
+        response = client.post("/analyze", json={"text": "a brand new text"}, headers={"X-Deadline-Ms": "0.000001"})
+        assert response.status_code == 504
+    
+    def test_queue_stats_in_model_info(self, stub_models):
+        """Queue depth and shed counts are reported per model"""
+        data = client.get("/models/info").json()
+        assert data["emotion_model"]["queue"]["depth"] == {"interactive": 0, "bulk": 0}
+        assert "bulk_queue_full" in data["abuse_model"]["queue"]["shed"]
+
+class TestResponseEncoding:
+    def test_json_stays_the_default(self, stub_models):
+        """Without an Accept preference the documented JSON shape comes back"""
+        response = client.post("/batch-analyze", json={"texts": ["first text", "second text"]})
+        assert response.headers["content-type"] == "application/json"
+        assert response.headers["vary"] == "Accept"
+        assert [result["emotion"] for result in response.json()["results"]] == ["joy", "joy"]
+    
+    def test_columnar_batch(self, stub_models):
+        """The columnar type returns one array per field"""
+        response = client.post(
+            "/batch-analyze", json={"texts": ["first text", "second text"]},
+            headers={"Accept": "application/vnd.safechat.columnar+json"}
+        )
+        assert response.headers["content-type"] == "application/vnd.safechat.columnar+json"
+        results = response.json()["results"]
+        assert results["count"] == 2
+        assert results["columns"]["abuse_detected"] == [False, False]
+
+class TestAdmin:
+    def test_admin_api_needs_token(self, stub_models, monkeypatch):
+        """Admin endpoints are off without ADMIN_TOKEN and reject a wrong token"""
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        assert client.get("/admin/models/emotion/shadow").status_code == 403
+        
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        assert client.get("/admin/models/emotion/shadow", headers={"X-Admin-Token": "wrong"}).status_code == 401
+        assert client.get("/admin/models/other/shadow", headers={"X-Admin-Token": "secret"}).status_code == 404
+    
+    def test_swap_model_over_api(self, stub_models, monkeypatch):
+        """A swap reports the old and new versions and later requests use the new model"""
+        from src.rollout import LoadedModel
+        emotion, _ = stub_models
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        monkeypatch.setenv("WARMUP_ENABLED", "False")
+        monkeypatch.setattr(src.main, "models_ready", True)
+        monkeypatch.setattr(
+            emotion, "build_model",
+            lambda name: LoadedModel(name, True, None, "v2", StubClassifier({'sadness': 0.7, 'joy': 0.3}))
+        )
+        
+        response = client.post(
+            "/admin/models/emotion/swap", json={"model_name": "new-emotion"}, headers={"X-Admin-Token": "secret"}
+        )
+        assert response.status_code == 200
+        assert response.json()["current"] == {"model_name": "new-emotion", "version": "v2"}
+        
+        assert client.post("/analyze", json={"text": "what a day"}).json()["emotion"] == "sadness"
+        info = client.get("/models/info").json()["emotion_model"]
+        assert info["name"] == "new-emotion" and info["rollout"]["swaps"] == 1
+
+class TestReadiness:
+    def test_ready_only_once_models_are_warm(self, monkeypatch):
+        """/ready is 503 while models load and 200 afterwards; /live answers throughout"""
+        monkeypatch.setattr(src.main, "models_ready", False)
+        monkeypatch.setattr(src.main, "model_load_error", None)
+        
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "loading"
+        assert client.get("/live").status_code == 200
+        
+        monkeypatch.setattr(src.main, "models_ready", True)
+        assert client.get("/ready").status_code == 200
+        assert client.get("/health").json()["ready"] is True
+    
+    def test_failed_load_fails_liveness(self, monkeypatch):
+        """A failed model load makes both probes fail so the orchestrator restarts the process"""
+        monkeypatch.setattr(src.main, "models_ready", False)
+        monkeypatch.setattr(src.main, "model_load_error", "weights not found")
+        
+        assert client.get("/live").status_code == 503
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json() == {"status": "failed", "error": "weights not found"}
+    
+    @pytest.mark.asyncio
+    async def test_load_failure_is_recorded(self, monkeypatch):
+        """load_models records the error instead of crashing the server"""
+        async def failing_load(self):
+            raise RuntimeError("no weights")
+        
+        monkeypatch.setattr(src.main, "models_ready", False)
+        monkeypatch.setattr(src.main, "model_load_error", None)
+        monkeypatch.setattr(src.main, "emotion_analyzer", None)
+        monkeypatch.setattr(EmotionAnalyzer, "load_model", failing_load)
+        monkeypatch.setattr(AbuseDetector, "load_model", failing_load)
+        
+        await src.main.load_models()
+        
+        assert src.main.model_load_error == "no weights"
+        assert src.main.models_ready is False
+        assert src.main.emotion_analyzer is None
+
+class TestMetrics:
+    def test_models_info_reports_memory(self, stub_models):
+        """/models/info reports process memory next to each model's stats"""
+        info = client.get("/models/info").json()
+        
+        assert info["process_memory"]["rss_bytes"] > 0
+        assert info["process_memory"]["peak_rss_bytes"] >= info["process_memory"]["rss_bytes"]
+        assert "memory" in info["emotion_model"] and "memory" in info["abuse_model"]
+    
+    def test_metrics_expose_stage_timings_and_counters(self, stub_models):
+        """/metrics reports request, stage, cache and fallback metrics in Prometheus format"""
+        from prometheus_client import REGISTRY
+        
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+        
+        requests_before = sample("ml_requests_total", endpoint="/analyze", status="200")
+        serialize_before = sample("ml_serialize_seconds_count", endpoint="/analyze")
+        queue_before = sample("ml_queue_wait_seconds_count", model="emotion")
+        keywords_before = sample("ml_keyword_seconds_count")
+        misses_before = sample("ml_cache_lookups_total", cache="emotion", result="miss")
+        hits_before = sample("ml_cache_lookups_total", cache="emotion", result="hit")
+        
+        text = "metrics test message"
+        assert client.post("/analyze", json={"text": text}).status_code == 200
+        assert client.post("/analyze", json={"text": text}).status_code == 200
+        
+        assert sample("ml_requests_total", endpoint="/analyze", status="200") == requests_before + 2
+        assert sample("ml_serialize_seconds_count", endpoint="/analyze") == serialize_before + 2
+        assert sample("ml_queue_wait_seconds_count", model="emotion") == queue_before + 1
+        assert sample("ml_keyword_seconds_count") == keywords_before + 1
+        assert sample("ml_cache_lookups_total", cache="emotion", result="miss") == misses_before + 1
+        assert sample("ml_cache_lookups_total", cache="emotion", result="hit") == hits_before + 1
+        
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "ml_request_duration_seconds_bucket" in response.text
+        assert 'ml_cache_lookups_total{cache="emotion",result="hit"}' in response.text
+    
+    def test_fallbacks_and_unknown_paths_are_counted(self, stub_models):
+        """Fallback results are counted per model and unknown paths share one label"""
+        from prometheus_client import REGISTRY
+        
+        emotion, _ = stub_models
+        emotion.classifier = None  # analyze() falls back to the neutral result
+        fallbacks_before = REGISTRY.get_sample_value("ml_fallback_results_total", {"model": "emotion"}) or 0
+        other_before = REGISTRY.get_sample_value("ml_requests_total", {"endpoint": "other", "status": "404"}) or 0
+        
+        assert client.post("/analyze", json={"text": "fallback please"}).status_code == 200
+        assert client.get("/no-such-endpoint/123").status_code == 404
+        
+        assert REGISTRY.get_sample_value("ml_fallback_results_total", {"model": "emotion"}) == fallbacks_before + 1
+        assert REGISTRY.get_sample_value("ml_requests_total", {"endpoint": "other", "status": "404"}) == other_before + 1
+
 class TestAnalyzers:
     @pytest.mark.asyncio
     async def test_emotion_analyzer(self):
@@ -77,13 +389,7 @@ class TestAnalyzers:
         
         # Mock the model loading for testing
         analyzer.model = True
-        analyzer.classifier = lambda x: [[{
-            'label': 'joy',
-            'score': 0.8
-        }, {
-            'label': 'neutral',
-            'score': 0.2
-        }]]
+        analyzer.classifier = StubClassifier({'joy': 0.8, 'neutral': 0.2})
         
         result = await analyzer.analyze("I am happy!")
         
@@ -98,10 +404,7 @@ class TestAnalyzers:
         
         # Mock the model loading for testing
         detector.model = True
-        detector.classifier = lambda x: [[{
-            'label': 'TOXIC',
-            'score': 0.9
-        }]]
+        detector.classifier = StubClassifier({'TOXIC': 0.9})
         
         result = await detector.analyze("This is a test message")
         
@@ -109,5 +412,34 @@ class TestAnalyzers:
         assert "abuse_type" in result
         assert "confidence_score" in result
 
+    @pytest.mark.asyncio
+    async def test_emotion_analyzer_batch(self):
+        """Test batched emotion analysis returns one result per text"""
+        analyzer = EmotionAnalyzer()
+        analyzer.model = True
+        analyzer.classifier = StubClassifier({'anger': 0.15, 'joy': 0.7, 'sadness': 0.05, 'fear': 0.08})
+        
+        results = await analyzer.analyze_batch(["a", "b", "c"])
+        
+        assert len(results) == 3
+        assert results[0]["emotion"] == "joy"
+        assert results[0]["intensity"] == 70.0
+        assert results[0]["secondary_emotions"] == [{"emotion": "anger", "intensity": 15.0}]
+
+    @pytest.mark.asyncio
+    async def test_abuse_detector_batch(self):
+        """Test batched abuse detection applies per-type thresholds"""
+        detector = AbuseDetector()
+        detector.model = True
+        detector.classifier = StubClassifier({'toxic': 0.72, 'insult': 0.1})
+        
+        results = await detector.analyze_batch(["you are an idiot", "I hate you"])
+        
+        assert results[0]["abuse_detected"] is True
+        assert results[0]["abuse_type"] == "harassment"
+        assert results[1]["abuse_detected"] is False  # hate_speech threshold is 0.8
+        assert results[1]["abuse_type"] == "none"
+        assert results[1]["confidence_score"] == 72.0
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
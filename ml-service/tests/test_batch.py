@@ -0,0 +1,111 @@
+import pytest
+import json
+import os
+import src.batch as batch
+from src.batch import parse_args, read_records, run
+
+def write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def fake_score_records(records, text_field, id_field, first_index):
+    """Stand-in for the model-backed scorer: echoes the text length"""
+    return [
+        {"id": record.get(id_field) or first_index + i + 1, "emotion_intensity": len(record[text_field]), "error": None}
+        for i, record in enumerate(records)
+    ]
+
+class TestBulkScoring:
+    def test_scores_jsonl_with_worker_processes(self, tmp_path, monkeypatch):
+        """Worker processes load the models and write one result per record in input order"""
+        from benchmarks.stub_models import save_stub_models
+
+        emotion_path, abuse_path = save_stub_models(str(tmp_path))
+        monkeypatch.setenv("EMOTION_MODEL_NAME", emotion_path)
+        monkeypatch.setenv("ABUSE_MODEL_NAME", abuse_path)
+
+        input_path = tmp_path / "messages.jsonl"
+        write_jsonl(input_path, [{"id": f"m{i}", "text": f"you are great {i}"} for i in range(5)] + [{"id": "m5"}])
+        output_path = tmp_path / "scores.jsonl"
+
+        assert run(parse_args([str(input_path), str(output_path), "--workers", "1", "--chunk-size", "2"])) == 6
+
+        rows = read_jsonl(output_path)
+        assert [row["id"] for row in rows] == ["m0", "m1", "m2", "m3", "m4", "m5"]
+        assert all(row["error"] is None and "emotion" in row and "abuse_detected" in row for row in rows[:5])
+        assert rows[5]["error"] == "Missing text"
+        assert not os.path.exists(str(output_path) + ".checkpoint")
+
+    def test_resumes_after_crash(self, tmp_path, monkeypatch):
+        """A killed run picks up after the last checkpointed chunk without duplicating rows"""
+        monkeypatch.setattr(batch, "_init_worker", lambda num_processes: None)
+
+        input_path = tmp_path / "messages.jsonl"
+        write_jsonl(input_path, [{"text": "x" * (i + 1)} for i in range(10)])
+        output_path = tmp_path / "scores.jsonl"
+        args = parse_args([str(input_path), str(output_path), "--workers", "0", "--chunk-size", "3"])
+
+        calls = []
+        def crashing_score_records(records, *rest):
+            calls.append(len(records))
+            if len(calls) == 3:
+                raise RuntimeError("killed")
+            return fake_score_records(records, *rest)
+
+        monkeypatch.setattr(batch, "score_records", crashing_score_records)
+        with pytest.raises(RuntimeError):
+            run(args)
+
+        with open(str(output_path) + ".checkpoint") as f:
+            assert json.load(f)["records_done"] == 6
+
+        monkeypatch.setattr(batch, "score_records", fake_score_records)
+        assert run(args) == 10
+
+        rows = read_jsonl(output_path)
+        assert [row["id"] for row in rows] == list(range(1, 11))
+        assert [row["emotion_intensity"] for row in rows] == list(range(1, 11))
+
+    def test_checkpoint_from_other_job_is_rejected(self, tmp_path, monkeypatch):
+        """A checkpoint is only resumed by the same input and settings"""
+        monkeypatch.setattr(batch, "_init_worker", lambda num_processes: None)
+        monkeypatch.setattr(batch, "score_records", fake_score_records)
+
+        input_path = tmp_path / "messages.jsonl"
+        write_jsonl(input_path, [{"body": "hello"}])
+        output_path = tmp_path / "scores.jsonl"
+        with open(str(output_path) + ".checkpoint", "w") as f:
+            json.dump({"run": {"input": "other.jsonl"}, "records_done": 1, "output_bytes": 0}, f)
+
+        args = parse_args([str(input_path), str(output_path), "--workers", "0", "--text-field", "body"])
+        with pytest.raises(ValueError):
+            run(args)
+
+        args.restart = True
+        assert run(args) == 1
+
+    def test_reads_csv_in_chunks_after_skip(self, tmp_path):
+        """CSV input streams in chunks with every column as a string"""
+        input_path = tmp_path / "messages.csv"
+        input_path.write_text("id,text\n007,hello\n008,there\n009,\n010,again\n")
+
+        chunks = list(read_records(str(input_path), "csv", chunk_size=2, skip=1))
+
+        assert [[record["id"] for record in chunk] for chunk in chunks] == [["008", "009"], ["010"]]
+        assert chunks[0][1]["text"] == ""
+
+    def test_reports_invalid_jsonl_lines(self, tmp_path):
+        """Malformed lines become error records instead of stopping the run"""
+        input_path = tmp_path / "messages.jsonl"
+        input_path.write_text('{"text": "ok"}\nnot json\n\n[1, 2]\n')
+
+        records = [record for chunk in read_records(str(input_path), "jsonl", chunk_size=10) for record in chunk]
+
+        assert records[0] == {"text": "ok"}
+        assert records[1] == {"__error__": "Invalid JSON on line 2"}
+        assert records[2] == {"__error__": "Expected a JSON object on line 4"}
@@ -0,0 +1,129 @@
+import pytest
+import asyncio
+import time
+from src.batcher import MicroBatcher
+
+class TestMicroBatcher:
+    @pytest.mark.asyncio
+    async def test_concurrent_submits_share_one_batch(self):
+        """Concurrent callers are coalesced and each gets its own result"""
+        calls = []
+
+        def process(items):
+            calls.append(list(items))
+            return [item.upper() for item in items]
+
+        batcher = MicroBatcher(process, max_batch_size=8, max_wait_ms=50)
+        results = await asyncio.gather(*(batcher.submit(t) for t in ["a", "b", "c"]))
+
+        assert results == ["A", "B", "C"]
+        assert calls == [["a", "b", "c"]]
+
+    @pytest.mark.asyncio
+    async def test_max_batch_size_is_respected(self):
+        """Batches never exceed the configured size"""
+        sizes = []
+
+        def process(items):
+            sizes.append(len(items))
+            return items
+
+        batcher = MicroBatcher(process, max_batch_size=2, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+        assert results == [0, 1, 2, 3, 4]
+        assert max(sizes) <= 2
+        assert sum(sizes) == 5
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_caller(self):
+        """A failing batch fails all of its callers"""
+        def process(items):
+            raise ValueError("model exploded")
+
+        batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=20)
+        results = await asyncio.gather(
+            batcher.submit("x"), batcher.submit("y"), return_exceptions=True
+        )
+
+        assert all(isinstance(r, ValueError) for r in results)
+
+class TestAdmissionControl:
+    @pytest.mark.asyncio
+    async def test_interactive_batched_before_bulk(self):
+        """Queued interactive items are processed before bulk items queued earlier"""
+        from src.admission import BULK, request_class
+        calls = []
+
+        def process(items):
+            calls.append(list(items))
+            return items
+
+        batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=0, bulk_batch_size=4)
+        # Occupy the only slot so both lanes fill up behind it
+        blocker = asyncio.ensure_future(batcher.submit("first"))
+        await asyncio.sleep(0.05)
+        with request_class(BULK):
+            bulk = asyncio.ensure_future(batcher.submit_many(["b1", "b2"]))
+        interactive = asyncio.ensure_future(batcher.submit("i1"))
+
+        await asyncio.gather(blocker, bulk, interactive)
+
+        assert calls[0] == ["first"]
+        assert calls[1] == ["i1"]
+        assert calls[2] == ["b1", "b2"]
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejects_with_retry_after(self):
+        """Past the lane's limit submissions fail fast with QueueFull"""
+        from src.admission import BULK, QueueFull, request_class
+        import threading
+        gate = threading.Event()
+
+        def process(items):
+            gate.wait(5)
+            return items
+
+        batcher = MicroBatcher(process, max_batch_size=1, max_wait_ms=0, max_queue=4)
+        running = asyncio.ensure_future(batcher.submit("running"))
+        await asyncio.sleep(0.05)
+        queued = [asyncio.ensure_future(batcher.submit(i)) for i in range(4)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(QueueFull) as exc_info:
+            await batcher.submit("one too many")
+        assert int(exc_info.value.retry_after_header) >= 1
+
+        # Bulk work gets only a share of the queue
+        with request_class(BULK):
+            bulk = asyncio.ensure_future(batcher.submit_many([1, 2]))
+            await asyncio.sleep(0)
+            with pytest.raises(QueueFull):
+                await batcher.submit_many([3])
+
+        gate.set()
+        await asyncio.gather(running, bulk, *queued)
+        assert batcher.stats()["shed"]["interactive_queue_full"] == 1
+        assert batcher.stats()["shed"]["bulk_queue_full"] == 1
+
+    @pytest.mark.asyncio
+    async def test_expired_work_never_reaches_model(self):
+        """Items whose deadline passes while queued are dropped with DeadlineExceeded"""
+        from src.admission import DeadlineExceeded, request_class
+        processed = []
+
+        def process(items):
+            processed.extend(items)
+            time.sleep(0.1)
+            return items
+
+        batcher = MicroBatcher(process, max_batch_size=1, max_wait_ms=0)
+        slow = asyncio.ensure_future(batcher.submit("slow"))
+        await asyncio.sleep(0.01)
+        with request_class("interactive", deadline_ms=20):
+            with pytest.raises(DeadlineExceeded):
+                await batcher.submit("late")
+
+        await slow
+        assert processed == ["slow"]
+        assert batcher.stats()["shed"]["interactive_deadline"] == 1
@@ -0,0 +1,76 @@
+import pytest
+import asyncio
+import json
+import os
+from benchmarks.stub_models import save_stub_models
+from src.analyzer import EmotionAnalyzer, AbuseDetector
+from src.bundle import build_bundle, bundle_entry, load_pretrained
+
+@pytest.fixture
+def stub_model_dirs(tmp_path, monkeypatch):
+    """Stub models saved locally and configured as the service's models"""
+    emotion_path, abuse_path = save_stub_models(str(tmp_path / "models"))
+    monkeypatch.setenv("EMOTION_MODEL_NAME", emotion_path)
+    monkeypatch.setenv("ABUSE_MODEL_NAME", abuse_path)
+    return emotion_path, abuse_path
+
+class TestModelBundle:
+    def test_loads_from_bundle(self, tmp_path, stub_model_dirs, monkeypatch):
+        """A bundled model loads from the bundle as safetensors"""
+        emotion_path, _ = stub_model_dirs
+        bundle_dir = str(tmp_path / "bundle")
+        build_bundle(bundle_dir, {"emotion": emotion_path})
+        monkeypatch.setenv("MODEL_BUNDLE_DIR", bundle_dir)
+
+        assert os.path.exists(os.path.join(bundle_dir, "emotion", "model.safetensors"))
+        with open(os.path.join(bundle_dir, "manifest.json")) as f:
+            assert json.load(f)["emotion"]["name"] == emotion_path
+
+        model, tokenizer, version = load_pretrained("emotion", emotion_path)
+        assert model.name_or_path == os.path.join(bundle_dir, "emotion")
+        assert version == "local"
+        assert tokenizer("hello")["input_ids"]
+
+    def test_other_models_bypass_bundle(self, tmp_path, stub_model_dirs, monkeypatch):
+        """Models the bundle doesn't contain load from their usual source"""
+        emotion_path, abuse_path = stub_model_dirs
+        bundle_dir = str(tmp_path / "bundle")
+        build_bundle(bundle_dir, {"emotion": emotion_path})
+        monkeypatch.setenv("MODEL_BUNDLE_DIR", bundle_dir)
+
+        assert bundle_entry("abuse", abuse_path) is None
+        assert bundle_entry("emotion", "some/other-model") is None
+
+        model, _, _ = load_pretrained("abuse", abuse_path)
+        assert model.name_or_path == abuse_path
+
+class TestModelStartup:
+    @pytest.mark.asyncio
+    async def test_models_load_in_parallel_and_warm_up(self, stub_model_dirs):
+        """Both analyzers load concurrently on their executors and serve after warmup"""
+        emotion_analyzer = EmotionAnalyzer()
+        abuse_detector = AbuseDetector()
+
+        await asyncio.gather(emotion_analyzer.load_model(), abuse_detector.load_model())
+        await asyncio.gather(emotion_analyzer.warmup(), abuse_detector.warmup())
+
+        emotion_result = await emotion_analyzer.analyze("you are great")
+        abuse_result = await abuse_detector.analyze("you are great")
+        assert "error" not in emotion_result and emotion_result["emotion"] in emotion_analyzer.emotion_labels
+        assert "error" not in abuse_result
+
+class TestPreloading:
+    @pytest.mark.asyncio
+    async def test_analyzers_reuse_preloaded_weights(self, stub_model_dirs, monkeypatch):
+        """Models preloaded in the master are reused, not reloaded, by each worker's analyzers"""
+        import src.bundle
+        monkeypatch.setattr(src.bundle, "_preloaded", {})
+
+        src.bundle.preload_models()
+        emotion_path, _ = stub_model_dirs
+        preloaded_model = src.bundle._preloaded[("emotion", emotion_path)][0]
+        assert not any(p.requires_grad for p in preloaded_model.parameters())
+
+        emotion_analyzer = EmotionAnalyzer()
+        await emotion_analyzer.load_model()
+        assert emotion_analyzer.model is preloaded_model
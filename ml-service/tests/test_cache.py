@@ -0,0 +1,98 @@
+import pytest
+import asyncio
+from src.cache import ResultCache
+
+class TestResultCache:
+    def test_key_uses_normalized_text_and_namespace(self):
+        """Whitespace variants share a key; different models do not"""
+        key = ResultCache.make_key("abuse:model@v1", "lol   ok\n")
+
+        assert key == ResultCache.make_key("abuse:model@v1", " lol ok")
+        assert key != ResultCache.make_key("abuse:model@v2", "lol ok")
+
+    def test_lru_eviction_by_entry_count(self):
+        """Least recently used entries are evicted first"""
+        cache = ResultCache(max_entries=2, max_bytes=10**6, ttl_seconds=60, disk_path="")
+        cache.set("a", {"v": 1})
+        cache.set("b", {"v": 2})
+        cache.get("a")
+        cache.set("c", {"v": 3})
+
+        assert cache.get("b") is None
+        assert cache.get("a") == {"v": 1}
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiry(self):
+        """Expired entries are treated as misses"""
+        cache = ResultCache(max_entries=10, max_bytes=10**6, ttl_seconds=0, disk_path="")
+        cache.set("a", {"v": 1})
+
+        assert cache.get("a") is None
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        """Results written to disk are found by a fresh cache"""
+        path = str(tmp_path / "cache.sqlite")
+        first = ResultCache(max_entries=10, max_bytes=10**6, ttl_seconds=60, disk_path=path)
+        first.set("a", {"emotion": "joy"})
+        first._disk_writer.shutdown(wait=True)
+
+        second = ResultCache(max_entries=10, max_bytes=10**6, ttl_seconds=60, disk_path=path)
+
+        assert second.get("a") == {"emotion": "joy"}
+        assert second.stats()["disk_hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_disk_tier_read_off_event_loop(self, tmp_path):
+        """Batched lookups read the disk tier on its reader thread and compute only the misses"""
+        import threading
+        path = str(tmp_path / "cache.sqlite")
+        first = ResultCache(max_entries=10, max_bytes=10**6, ttl_seconds=60, disk_path=path)
+        first.set("a", {"emotion": "joy"})
+        first._disk_writer.shutdown(wait=True)
+
+        second = ResultCache(max_entries=10, max_bytes=10**6, ttl_seconds=60, disk_path=path)
+        reader_threads = []
+        disk_get_many = second._disk_get_many
+        second._disk_get_many = lambda keys: reader_threads.append(threading.current_thread()) or disk_get_many(keys)
+        computed = []
+
+        async def compute(items):
+            computed.extend(items)
+            return [{"emotion": item} for item in items]
+
+        results = await second.get_or_compute_many(["a", "b"], ["x", "y"], compute)
+
+        assert results == [{"emotion": "joy"}, {"emotion": "y"}]
+        assert computed == ["y"]
+        assert reader_threads and reader_threads[0] is not threading.main_thread()
+        assert second.stats()["disk_hits"] == 1 and second.stats()["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_texts_share_one_computation(self):
+        """In-flight deduplication runs the computation once"""
+        cache = ResultCache(max_entries=10, max_bytes=10**6, ttl_seconds=60, disk_path="")
+        calls = []
+
+        async def compute(text):
+            calls.append(text)
+            await asyncio.sleep(0.01)
+            return {"emotion": "joy"}
+
+        key = cache.make_key("ns", "lol")
+        results = await asyncio.gather(*(cache.get_or_compute(key, "lol", compute) for _ in range(5)))
+
+        assert calls == ["lol"]
+        assert all(r == {"emotion": "joy"} for r in results)
+        assert cache.stats()["inflight_hits"] == 4
+
+    @pytest.mark.asyncio
+    async def test_errors_are_not_cached(self):
+        """Fallback results carrying an error are recomputed next time"""
+        cache = ResultCache(max_entries=10, max_bytes=10**6, ttl_seconds=60, disk_path="")
+
+        async def compute_batch(texts):
+            return [{"emotion": "neutral", "error": "boom"} for _ in texts]
+
+        await cache.get_or_compute_many(["k"], ["text"], compute_batch)
+
+        assert cache.get("k") is None
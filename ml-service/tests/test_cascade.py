@@ -0,0 +1,110 @@
+import pytest
+import json
+from src.analyzer import EmotionAnalyzer, AbuseDetector, analyze_texts
+from src.cascade import CascadeClassifier, main, train_cascade
+
+JOY = ["what a wonderful happy day", "i love this so much", "this is great and fun", "so happy and glad today"]
+ANGER = ["i hate this stupid thing", "you idiot shut up", "this is awful and i am furious", "stupid idiot go away"]
+
+def training_set(repeats=25):
+    texts = (JOY + ANGER) * repeats
+    emotions = (["joy"] * len(JOY) + ["anger"] * len(ANGER)) * repeats
+    abusive = ([False] * len(JOY) + [True] * len(ANGER)) * repeats
+    return texts, emotions, abusive
+
+@pytest.fixture
+def cascade():
+    cascade, _ = train_cascade(*training_set(), holdout=0)
+    cascade.audit_rate = 0.0
+    return cascade
+
+def transformer_stub(model):
+    """Stand-in for the transformer path that records which texts reach it"""
+    calls = []
+
+    async def run_batch(texts):
+        calls.append(list(texts))
+        if model == "emotion":
+            return [{"emotion": "neutral", "intensity": 0.5, "secondary_emotions": []} for _ in texts]
+        return [{"abuse_detected": True, "abuse_type": "toxic", "confidence_score": 0.9} for _ in texts]
+
+    return run_batch, calls
+
+class TestCascade:
+    def test_training_reports_gate_coverage(self):
+        """Training scores each gate on the holdout"""
+        cascade, report = train_cascade(*training_set(), holdout=0.2)
+
+        assert report["holdout_size"] == 40
+        assert sorted(cascade.emotion_labels) == ["anger", "joy"]
+        assert set(report["emotion"]) == {"0.8", "0.9", "0.95", "0.98", "0.99"}
+        assert report["emotion"]["0.8"]["coverage"] > 0.5
+
+    @pytest.mark.asyncio
+    async def test_confident_emotions_skip_transformer(self, cascade, monkeypatch):
+        """Texts above the gate are answered by the cascade; the rest are escalated"""
+        analyzer = EmotionAnalyzer()
+        analyzer.classifier = object()
+        analyzer.cascade = cascade
+        cascade.emotion_gate = 0.8
+        run_batch, calls = transformer_stub("emotion")
+        monkeypatch.setattr(analyzer, "_run_batch", run_batch)
+
+        results = await analyzer.analyze_batch(["what a wonderful happy day", "the meeting moved to thursday"])
+
+        assert results[0]["emotion"] == "joy"
+        assert results[1]["emotion"] == "neutral"
+        assert calls == [["the meeting moved to thursday"]]
+
+    @pytest.mark.asyncio
+    async def test_abuse_cascade_only_clears_benign_texts(self, cascade, monkeypatch):
+        """Likely abusive texts always get the transformer's verdict"""
+        detector = AbuseDetector()
+        detector.classifier = object()
+        detector.cascade = cascade
+        cascade.abuse_gate = 0.8
+        run_batch, calls = transformer_stub("abuse")
+        monkeypatch.setattr(detector, "_run_batch", run_batch)
+
+        results = await detector.analyze_batch(["i love this so much", "you idiot shut up"])
+
+        assert results[0]["abuse_detected"] is False
+        assert results[1]["abuse_detected"] is True
+        assert calls == [["you idiot shut up"]]
+
+    @pytest.mark.asyncio
+    async def test_both_models_share_one_featurization(self, cascade, monkeypatch):
+        """A request scores the cascade once for the emotion and abuse heads together"""
+        emotion, abuse = EmotionAnalyzer(), AbuseDetector()
+        for analyzer, model in ((emotion, "emotion"), (abuse, "abuse")):
+            analyzer.classifier = object()
+            analyzer.cascade = cascade
+            monkeypatch.setattr(analyzer, "_run_batch", transformer_stub(model)[0])
+        
+        calls = []
+        predict = cascade.predict
+        monkeypatch.setattr(cascade, "predict", lambda texts: calls.append(texts) or predict(texts))
+        
+        results = await analyze_texts(emotion, abuse, ["i love this so much", "you idiot shut up"])
+        
+        assert len(calls) == 1
+        assert results[0]["emotion"] == "joy"
+        assert results[1]["abuse_detected"] is True
+    
+    def test_train_cli(self, tmp_path):
+        """The CLI joins a corpus with bulk-scoring output and writes a loadable model"""
+        texts, emotions, abusive = training_set(5)
+        corpus = tmp_path / "corpus.jsonl"
+        labels = tmp_path / "labels.jsonl"
+        corpus.write_text("".join(json.dumps({"id": f"m{i}", "text": text}) + "\n" for i, text in enumerate(texts)))
+        labels.write_text("".join(
+            json.dumps({"id": f"m{i}", "emotion": emotion, "abuse_detected": flag, "error": None}) + "\n"
+            for i, (emotion, flag) in enumerate(zip(emotions, abusive))
+        ))
+        output = tmp_path / "cascade.joblib"
+
+        main(["train", str(corpus), str(labels), "--output", str(output)])
+
+        loaded = CascadeClassifier.load(str(output))
+        assert loaded.metadata["report"]["train_size"] == 36
+        assert loaded.predict(["so happy and glad today"]).emotion.shape == (1, 2)
@@ -0,0 +1,169 @@
+import pytest
+import os
+import torch
+import numpy as np
+from src.inference import SequenceClassifier, create_model_executor, default_torch_threads, plan_batches, weight_dtype
+
+class TestModelExecutors:
+    def test_executor_pins_torch_threads(self, monkeypatch):
+        """Executor threads run with the configured torch thread count"""
+        monkeypatch.setenv("EMOTION_EXECUTOR_WORKERS", "2")
+        monkeypatch.setenv("EMOTION_TORCH_THREADS", "1")
+
+        executor = create_model_executor("EMOTION")
+        try:
+            assert executor._max_workers == 2
+            assert executor.submit(torch.get_num_threads).result() == 1
+        finally:
+            executor.shutdown()
+
+    def test_default_threads_split_cores(self, monkeypatch):
+        """Default thread count splits cores across workers, models and executor threads"""
+        monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+        monkeypatch.setenv("NUM_WORKERS", "2")
+
+        assert default_torch_threads(executor_workers=1) == 2
+        assert default_torch_threads(executor_workers=4) == 1
+
+def build_tiny_classifier(problem_type=None):
+    """Tiny randomly initialized BERT classifier with a word-level tokenizer"""
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast, BertConfig, BertForSequenceClassification
+
+    words = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "i", "love", "hate", "you", "this", "is", "so", "terrible", "ok", "great", "day"]
+    tokenizer = Tokenizer(models.WordLevel({w: i for i, w in enumerate(words)}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 2), ("[SEP]", 3)]
+    )
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, pad_token="[PAD]", unk_token="[UNK]",
+        cls_token="[CLS]", sep_token="[SEP]", model_max_length=64
+    )
+
+    labels = ["joy", "anger", "neutral"]
+    config = BertConfig(
+        vocab_size=len(words), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=64, num_labels=len(labels), problem_type=problem_type,
+        id2label=dict(enumerate(labels)), label2id={label: i for i, label in enumerate(labels)}
+    )
+    torch.manual_seed(0)
+    model = BertForSequenceClassification(config)
+    # Spread the logits so labels are well separated
+    model.classifier.weight.data *= 20
+
+    return model, tokenizer
+
+PARITY_TEXTS = ["i love you", "i hate you so so so terrible", "ok", "this is a great day", "hate"]
+
+class TestInferenceBackends:
+    @pytest.mark.parametrize("backend", ["torch-int8", "torch-bf16", "onnx"])
+    @pytest.mark.parametrize("problem_type", [None, "multi_label_classification"])
+    def test_backend_matches_fp32(self, backend, problem_type, tmp_path, monkeypatch):
+        """Quantized, bf16 and ONNX backends agree with the fp32 torch path"""
+        if backend == "onnx":
+            pytest.importorskip("onnxruntime")
+        monkeypatch.setenv("ONNX_EXPORT_DIR", str(tmp_path))
+
+        model, tokenizer = build_tiny_classifier(problem_type)
+        reference = SequenceClassifier(model, tokenizer, batch_size=2, backend="torch").predict(PARITY_TEXTS)
+
+        model, tokenizer = build_tiny_classifier(problem_type)
+        candidate = SequenceClassifier(model, tokenizer, batch_size=2, backend=backend).predict(PARITY_TEXTS)
+
+        assert candidate.shape == reference.shape
+        assert (candidate.argmax(axis=1) == reference.argmax(axis=1)).all()
+        assert np.abs(candidate - reference).max() < 0.05
+
+    def test_fp16_falls_back_where_unsupported(self):
+        """fp16 serves in fp16 where torch can run the model in it, and in fp32 elsewhere"""
+        model, tokenizer = build_tiny_classifier()
+        classifier = SequenceClassifier(model, tokenizer, backend="torch-fp16")
+
+        expected_dtype = torch.float16 if classifier.backend == "torch-fp16" else torch.float32
+        assert classifier.backend in ("torch-fp16", "torch")
+        assert next(classifier.model.parameters()).dtype == expected_dtype
+        assert classifier.predict(PARITY_TEXTS).shape == (len(PARITY_TEXTS), 3)
+
+    @pytest.mark.parametrize("backend", ["torch-bf16", "torch-fp16"])
+    def test_half_precision_leaves_the_fp32_model_untouched(self, backend):
+        """The model passed in (possibly shared with other workers) keeps its exact fp32 weights"""
+        model, tokenizer = build_tiny_classifier()
+        weights = {name: tensor.clone() for name, tensor in model.state_dict().items()}
+        SequenceClassifier(model, tokenizer, backend=backend)
+
+        for name, tensor in model.state_dict().items():
+            assert tensor.dtype == weights[name].dtype
+            assert torch.equal(tensor, weights[name])
+
+    def test_unsupported_half_precision_loads_fp32(self, monkeypatch):
+        """Weights are only loaded in half precision where this torch build can run it"""
+        monkeypatch.setattr("src.inference.half_precision_supported", lambda dtype: dtype == torch.bfloat16)
+        assert weight_dtype("torch-bf16") == torch.bfloat16
+        assert weight_dtype("torch-fp16") is None
+        assert weight_dtype("torch") is None
+
+    def test_memory_accounting(self):
+        """bf16 halves the weight bytes, and warmup measures the activation peak of a full token budget"""
+        model, tokenizer = build_tiny_classifier()
+        fp32 = SequenceClassifier(model, tokenizer, max_batch_tokens=256, backend="torch")
+        fp32_bytes = fp32.memory_stats()["parameter_bytes"]
+        assert fp32_bytes == sum(p.numel() * 4 for p in model.parameters()) + sum(b.numel() * b.element_size() for b in model.buffers())
+
+        model, tokenizer = build_tiny_classifier()
+        bf16 = SequenceClassifier(model, tokenizer, max_batch_tokens=256, backend="torch-bf16")
+        assert bf16.memory_stats()["peak_activation_bytes"] is None
+        bf16.warmup(lengths=[8])
+
+        stats = bf16.memory_stats()
+        assert stats["parameter_bytes"] < 0.6 * fp32_bytes
+        assert stats["peak_activation_bytes"] > 0
+        assert stats["max_batch_tokens"] == 256
+
+    def test_unknown_backend_is_rejected(self):
+        """A typo in INFERENCE_BACKEND fails loudly at load time"""
+        model, tokenizer = build_tiny_classifier()
+
+        with pytest.raises(ValueError):
+            SequenceClassifier(model, tokenizer, backend="tensorrt")
+
+class TestTokenBudgetBatching:
+    def test_batches_fit_token_budget(self):
+        """Every batch pads to within the budget and every item appears once"""
+        lengths = [5, 120, 7, 6, 300, 8, 5, 9, 64, 7]
+        batches = plan_batches(lengths, max_tokens=64, max_items=4)
+
+        assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+        for batch in batches:
+            assert len(batch) <= 4
+            assert len(batch) == 1 or max(lengths[i] for i in batch) * len(batch) <= 64
+
+    def test_short_items_are_grouped_together(self):
+        """Sorting keeps a long item from padding the short ones"""
+        batches = plan_batches([4, 100, 4, 4], max_tokens=1000, max_items=3)
+
+        assert batches == [[0, 2, 3], [1]]
+
+    def test_results_come_back_in_input_order(self):
+        """Bucketed predictions match one-at-a-time predictions row for row"""
+        texts = ["ok", "i hate you so so so so so so terrible", "i love you", "great day", "hate"]
+        model, tokenizer = build_tiny_classifier()
+        bucketed = SequenceClassifier(model, tokenizer, max_batch_tokens=16).predict(texts)
+        single = np.vstack([SequenceClassifier(model, tokenizer, batch_size=1).predict([t]) for t in texts])
+
+        assert np.allclose(bucketed, single, atol=1e-5)
+
+    def test_records_stage_metrics(self):
+        """Tokenization is timed per call, forward passes per padded batch"""
+        from prometheus_client import REGISTRY
+
+        def sample(name, labels):
+            return REGISTRY.get_sample_value(name, labels) or 0
+
+        model, tokenizer = build_tiny_classifier()
+        classifier = SequenceClassifier(model, tokenizer, batch_size=2, name="metrics-test")
+        classifier.predict(["ok", "i love you", "great day", "hate", "i hate this"])
+
+        assert sample("ml_tokenize_seconds_count", {"model": "metrics-test"}) == 1
+        assert sample("ml_forward_seconds_count", {"model": "metrics-test", "backend": "torch"}) == 3
+        assert sample("ml_batch_size_sum", {"model": "metrics-test", "stage": "forward"}) == 5
@@ -0,0 +1,130 @@
+import pytest
+import asyncio
+import time
+import numpy as np
+from fastapi.testclient import TestClient
+import src.main
+from src.analyzer import EmotionAnalyzer, AbuseDetector
+from src.jobs import CANCELLED, COMPLETED, QUEUED, JobRunner, JobStore
+
+class StubClassifier:
+    def __init__(self, scores):
+        self.labels = list(scores)
+        self.scores = np.array(list(scores.values()), dtype=np.float32)
+        self.calls = 0
+
+    def predict(self, texts):
+        self.calls += 1
+        return np.tile(self.scores, (len(texts), 1))
+
+@pytest.fixture
+def analyzers(monkeypatch):
+    monkeypatch.setenv("RESULT_CACHE_ENABLED", "False")
+    monkeypatch.setenv("NEAR_DUP_ENABLED", "False")
+    emotion = EmotionAnalyzer()
+    emotion.cascade = None
+    emotion.classifier = StubClassifier({'joy': 0.8, 'neutral': 0.2})
+    abuse = AbuseDetector()
+    abuse.cascade = None
+    abuse.classifier = StubClassifier({'toxic': 0.1})
+    return emotion, abuse
+
+@pytest.fixture
+def job_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("JOBS_DB_PATH", str(tmp_path / "jobs.db"))
+    monkeypatch.setenv("JOB_CHUNK_SIZE", "4")
+    monkeypatch.setenv("JOB_POLL_SECONDS", "0.05")
+    return tmp_path / "jobs.db"
+
+async def wait_for_status(runner, job_id, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = await runner.get(job_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"Job {job_id} is {job['status']}, expected {status}")
+
+class TestJobRunner:
+    @pytest.mark.asyncio
+    async def test_job_runs_to_completion(self, analyzers, job_env):
+        """Items are scored in chunks and returned in submission order with their ids"""
+        runner = JobRunner()
+        job = await runner.submit([("a", "first message"), (7, "second message")] + [(None, f"message {i}") for i in range(8)])
+        assert job["status"] == QUEUED and job["total"] == 10
+
+        runner.start(*analyzers)
+        try:
+            job = await wait_for_status(runner, job["job_id"], COMPLETED)
+        finally:
+            await runner.stop()
+
+        assert job["processed"] == 10 and job["failed"] == 0
+        page = await runner.results(job["job_id"], 0, 3)
+        assert [result["id"] for result in page] == ["a", 7, None]
+        assert [result["position"] for result in page] == [0, 1, 2]
+        assert page[0]["emotion"] == "joy"
+        assert len(await runner.results(job["job_id"], 8, 100)) == 2
+
+    @pytest.mark.asyncio
+    async def test_jobs_survive_restart(self, analyzers, job_env):
+        """A job queued by one process is finished by the next one opening the same database"""
+        first = JobRunner()
+        job = await first.submit([(i, f"message {i}") for i in range(6)])
+
+        second = JobRunner()
+        second.start(*analyzers)
+        try:
+            await wait_for_status(second, job["job_id"], COMPLETED)
+        finally:
+            await second.stop()
+        assert len(await first.results(job["job_id"], 0, 100)) == 6
+
+    def test_dead_owner_lease_expires(self, job_env):
+        """A chunk leased by a process that died is handed out again once the lease runs out"""
+        store = JobStore(str(job_env))
+        store.create("job", [(i, f"message {i}") for i in range(3)], now=0)
+
+        job_id, items = store.claim_chunk("dead", now=1, lease_seconds=60, size=10)
+        assert job_id == "job" and len(items) == 3
+        assert store.claim_chunk("alive", now=30, lease_seconds=60, size=10) is None
+
+        job_id, items = store.claim_chunk("alive", now=100, lease_seconds=60, size=10)
+        assert [position for position, _ in items] == [0, 1, 2]
+        assert not store.save_chunk("job", "dead", [(0, {"emotion": "joy"})], now=101)
+        assert store.save_chunk("job", "alive", [(i, {"emotion": "joy"}) for i in range(3)], now=102)
+        assert store.get("job")["processed"] == 3
+
+    @pytest.mark.asyncio
+    async def test_cancel_keeps_scored_results(self, analyzers, job_env):
+        """A cancelled job stops being scored"""
+        runner = JobRunner()
+        job = await runner.submit([(i, f"message {i}") for i in range(8)])
+        job = await runner.cancel(job["job_id"])
+        assert job["status"] == CANCELLED
+
+        runner.start(*analyzers)
+        await asyncio.sleep(0.2)
+        await runner.stop()
+        assert analyzers[0].classifier.calls == 0
+        assert await runner.results(job["job_id"], 0, 100) == []
+
+class TestJobsAPI:
+    def test_submit_and_poll(self, job_env, monkeypatch):
+        """POST /jobs answers 202 with a job id that can be polled"""
+        monkeypatch.setenv("JOB_MAX_ITEMS", "5")
+        monkeypatch.setattr(src.main, "job_runner", JobRunner())
+        client = TestClient(src.main.app)
+
+        response = client.post("/jobs", json={"items": [{"id": "x", "text": "hello there"}, {"text": "second"}]})
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        status = client.get(f"/jobs/{job_id}").json()
+        assert status["status"] == QUEUED and status["total"] == 2
+        results = client.get(f"/jobs/{job_id}/results").json()
+        assert results["results"] == [] and results["next_offset"] == 0
+
+        assert client.post("/jobs", json={"items": [{"text": "t"}] * 6}).status_code == 400
+        assert client.get("/jobs/unknown").status_code == 404
+        assert client.delete(f"/jobs/{job_id}").json()["status"] == CANCELLED
@@ -0,0 +1,53 @@
+import pytest
+import time
+from src.lexicon import KeywordMatcher
+
+@pytest.fixture
+def matcher():
+    return KeywordMatcher({
+        "hate_speech": ["hate", "kill"],
+        "threats": ["kill you", "watch out"],
+        "spam": ["click here", "$$$"],
+    })
+
+class TestKeywordMatcher:
+    def test_counts_every_category_in_one_pass(self, matcher):
+        """Overlapping terms from different categories are all counted"""
+        counts = matcher.count_matches("I HATE this, I will kill you. Click here!")
+
+        assert counts == {"hate_speech": 2, "threats": 1, "spam": 1}
+
+    def test_word_boundaries(self, matcher):
+        """Terms don't match inside longer words"""
+        counts = matcher.count_matches("the skilled killer hated it")
+
+        assert counts == {"hate_speech": 0, "threats": 0, "spam": 0}
+
+    def test_phrases_match_across_whitespace_runs(self, matcher):
+        """Multi-word terms tolerate extra whitespace and line breaks"""
+        assert matcher.count_matches("watch \n  out")["threats"] == 1
+
+    def test_non_word_terms(self, matcher):
+        """Terms made of punctuation still match"""
+        assert matcher.count_matches("win $$$ now")["spam"] == 1
+
+    def test_default_lexicons_load(self):
+        """The bundled lexicon files cover every abuse category"""
+        categories = ["hate_speech", "threats", "sexual_content", "harassment", "bullying", "spam"]
+        matcher = KeywordMatcher.from_directory(categories=categories)
+
+        assert matcher.categories == categories
+        assert matcher.count_matches("nobody likes you, loser")["bullying"] == 1
+
+    def test_scales_to_large_lexicons(self):
+        """Thousands of terms still compile and match quickly"""
+        terms = [f"term{i} word{i % 97}" for i in range(5000)] + [f"slur{i}" for i in range(5000)]
+        matcher = KeywordMatcher({"hate_speech": terms})
+        text = "a perfectly ordinary chat message about nothing in particular " * 30 + "slur4999"
+
+        start = time.perf_counter()
+        counts = matcher.count_matches(text)
+        elapsed = time.perf_counter() - start
+
+        assert counts["hate_speech"] == 1
+        assert elapsed < 0.05
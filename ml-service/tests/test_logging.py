@@ -0,0 +1,82 @@
+import pytest
+import json
+import logging
+import os
+import queue
+from fastapi.testclient import TestClient
+import src.main
+import src.utils
+from src.utils import _QueueHandler, log_sampled, request_logger, setup_logging, trace_id
+
+@pytest.fixture
+def log_file(tmp_path):
+    """Route logging to a JSON file for the test, then back to the default setup"""
+    path = tmp_path / "service.log"
+    saved = {name: os.environ.get(name) for name in ("LOG_FILE", "LOG_FORMAT")}
+    os.environ.update(LOG_FILE=str(path), LOG_FORMAT="json")
+    setup_logging()
+    yield path
+    for name, value in saved.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    setup_logging()
+
+def read_entries(path):
+    """Stop the writer thread so everything queued is on disk"""
+    src.utils._stop_listener()
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+class TestLogging:
+    def test_json_lines_carry_trace_id_and_extra(self, log_file):
+        """Records are written as JSON with the current trace id and any extra fields"""
+        token = trace_id.set("abc123")
+        try:
+            logging.getLogger("test").warning("Slow batch of %d", 12, extra={"model": "emotion"})
+        finally:
+            trace_id.reset(token)
+
+        entry = [entry for entry in read_entries(log_file) if entry["logger"] == "test"][0]
+        assert entry["message"] == "Slow batch of 12"
+        assert entry["trace_id"] == "abc123"
+        assert entry["level"] == "WARNING" and entry["model"] == "emotion"
+
+    def test_unsampled_requests_keep_only_warnings(self, log_file):
+        """Request info logs of unsampled requests are dropped; their warnings are not"""
+        token = log_sampled.set(False)
+        try:
+            request_logger.info("dropped")
+            request_logger.warning("kept")
+        finally:
+            log_sampled.reset(token)
+        request_logger.info("sampled")
+
+        messages = [entry["message"] for entry in read_entries(log_file) if entry["logger"] == request_logger.name]
+        assert messages == ["kept", "sampled"]
+
+    def test_exception_traceback_is_kept(self, log_file):
+        """logger.exception records keep their traceback in its own field"""
+        try:
+            raise ValueError("bad input")
+        except ValueError:
+            logging.getLogger("test").exception("Failed to score %s", "batch")
+
+        entry = [entry for entry in read_entries(log_file) if entry["logger"] == "test"][0]
+        assert entry["message"] == "Failed to score batch"
+        assert entry["level"] == "ERROR"
+        assert "Traceback" in entry["exception"] and "ValueError: bad input" in entry["exception"]
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """A stalled writer costs log records, not request latency"""
+        handler = _QueueHandler(queue.Queue(maxsize=1))
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None)
+        handler.emit(record)
+        handler.emit(record)
+        assert handler.dropped == 1
+
+    def test_request_id_is_echoed(self):
+        """A caller's X-Request-ID is reused as the trace id; otherwise one is generated"""
+        client = TestClient(src.main.app)
+        assert client.get("/live", headers={"X-Request-ID": "req-42"}).headers["x-request-id"] == "req-42"
+        assert client.get("/live").headers["x-request-id"]
@@ -0,0 +1,104 @@
+import pytest
+import numpy as np
+from src.analyzer import AbuseDetector
+from src.near_duplicates import NearDuplicateIndex, force_full_analysis, minhash, similarity
+
+SPAM = "Click here to claim your FREE prize now!!! limited offer at spam.example"
+SPAM_VARIANT = "Click here to claim your FREE prize now!! limited offer at spam.example."
+
+def counting_compute(calls):
+    async def compute(texts):
+        calls.append(list(texts))
+        return [{"score": len(text)} for text in texts]
+    return compute
+
+class TestNearDuplicates:
+    def test_similar_texts_have_similar_signatures(self):
+        """A few changed characters keep most signature values; other text shares almost none"""
+        close = similarity(minhash(SPAM), minhash(SPAM_VARIANT))
+        unrelated = similarity(minhash(SPAM), minhash("I had a lovely walk in the park with my dog"))
+
+        assert close >= 0.8
+        assert unrelated < 0.3
+
+    @pytest.mark.asyncio
+    async def test_near_duplicate_reuses_result(self):
+        """A near-identical text reuses the indexed result instead of computing"""
+        index = NearDuplicateIndex(max_entries=10, ttl_seconds=60, min_similarity=0.8, min_chars=10)
+        calls = []
+
+        first = await index.get_or_compute_many("m", [SPAM], counting_compute(calls))
+        second = await index.get_or_compute_many("m", [SPAM_VARIANT, "a completely different message"], counting_compute(calls))
+
+        assert second[0] == first[0]
+        assert calls == [[SPAM], ["a completely different message"]]
+        assert index.stats()["hits"] == 1 and index.stats()["hit_rate"] == pytest.approx(1 / 3, abs=1e-3)
+
+    @pytest.mark.asyncio
+    async def test_forced_full_analysis_skips_reuse(self):
+        """The force flag always runs the computation"""
+        index = NearDuplicateIndex(max_entries=10, ttl_seconds=60, min_similarity=0.8, min_chars=10)
+        calls = []
+        await index.get_or_compute_many("m", [SPAM], counting_compute(calls))
+
+        with force_full_analysis():
+            await index.get_or_compute_many("m", [SPAM_VARIANT], counting_compute(calls))
+
+        assert calls == [[SPAM], [SPAM_VARIANT]]
+
+    @pytest.mark.asyncio
+    async def test_bounded_by_count_age_and_model(self):
+        """Entries are evicted beyond max_entries, after their TTL, and when the model changes"""
+        calls = []
+        index = NearDuplicateIndex(max_entries=2, ttl_seconds=60, min_similarity=0.8, min_chars=10)
+        texts = [f"message number {i} about something entirely unrelated {i * 7919}" for i in range(3)]
+        await index.get_or_compute_many("m", texts, counting_compute(calls))
+        assert index.stats()["entries"] == 2
+
+        await index.get_or_compute_many("other-model", [texts[2]], counting_compute(calls))
+        assert calls[-1] == [texts[2]]
+
+        expiring = NearDuplicateIndex(max_entries=10, ttl_seconds=0, min_similarity=0.8, min_chars=10)
+        await expiring.get_or_compute_many("m", [SPAM], counting_compute(calls))
+        await expiring.get_or_compute_many("m", [SPAM], counting_compute(calls))
+        assert calls[-2:] == [[SPAM], [SPAM]]
+
+    @pytest.mark.asyncio
+    async def test_short_texts_and_errors_not_reused(self):
+        """Short texts are too unstable to fingerprint, and failures are never indexed"""
+        index = NearDuplicateIndex(max_entries=10, ttl_seconds=60, min_similarity=0.8, min_chars=20)
+        calls = []
+
+        async def failing(texts):
+            calls.append(list(texts))
+            return [{"error": "boom"} for _ in texts]
+
+        await index.get_or_compute_many("m", ["hi there", SPAM], failing)
+        await index.get_or_compute_many("m", ["hi there", SPAM], failing)
+
+        assert calls == [["hi there", SPAM], ["hi there", SPAM]]
+
+class KeywordToxicity:
+    """Stub abuse classifier: toxic exactly when the text says 'kill'"""
+    labels = ["toxic"]
+
+    def predict(self, texts):
+        return np.array([[0.95 if "kill" in text else 0.01] for text in texts], dtype=np.float32)
+
+class TestAbuseNotReused:
+    @pytest.mark.asyncio
+    async def test_one_word_toxic_edit_is_scored_itself(self, monkeypatch):
+        """A near-duplicate of a benign message that turns it into a threat gets its own abuse verdict"""
+        monkeypatch.setenv("RESULT_CACHE_ENABLED", "False")
+        benign = "I will see you tomorrow at school, be ready for the game"
+        threat = "I will kill you tomorrow at school, be ready for the game"
+        assert similarity(minhash(benign), minhash(threat)) >= 0.8
+
+        detector = AbuseDetector()
+        detector.cascade = None
+        detector.classifier = KeywordToxicity()
+
+        assert (await detector.analyze_batch([benign]))[0]["abuse_detected"] is False
+        result = (await detector.analyze_batch([threat]))[0]
+        assert result["abuse_detected"] is True
+        assert result["toxicity_score"] > 0.9
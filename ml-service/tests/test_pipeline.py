@@ -0,0 +1,118 @@
+import pytest
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.stub_models import build_emotion_model, build_tokenizer, chat_messages
+from src.analyzer import EmotionAnalyzer
+from src.batcher import MicroBatcher
+from src.inference import SequenceClassifier
+from src.pipeline import InferencePipeline, PipelineStage
+
+def recording_stage(name, events, delay=0.03, gate=None):
+    """A stage that logs when each batch enters and leaves it"""
+    def run(batch):
+        events.append((name, batch, "start"))
+        if gate is not None:
+            gate.wait(5)
+        time.sleep(delay)
+        events.append((name, batch, "end"))
+        return batch
+    return run
+
+def stages(events, gate=None):
+    return [
+        PipelineStage("tokenize", recording_stage("tokenize", events), ThreadPoolExecutor(max_workers=1)),
+        PipelineStage("forward", recording_stage("forward", events), ThreadPoolExecutor(max_workers=1)),
+        PipelineStage("postprocess", recording_stage("postprocess", events, gate=gate), ThreadPoolExecutor(max_workers=1)),
+    ]
+
+class TestInferencePipeline:
+    @pytest.mark.asyncio
+    async def test_consecutive_batches_overlap(self):
+        """Batch 2 is tokenized while batch 1 is in the forward pass"""
+        events = []
+        pipeline = InferencePipeline(stages(events), name="test", queue_depth=1)
+
+        results = await asyncio.gather(*(pipeline.run(batch) for batch in range(4)))
+
+        assert results == [0, 1, 2, 3]
+        assert events.index(("tokenize", 1, "start")) < events.index(("forward", 0, "end"))
+        assert events.index(("forward", 1, "start")) < events.index(("postprocess", 0, "end"))
+
+    @pytest.mark.asyncio
+    async def test_slow_stage_applies_backpressure(self):
+        """With no queue between stages, a stuck last stage stops tokenizing after the pipeline fills"""
+        events = []
+        gate = threading.Event()
+        pipeline = InferencePipeline(stages(events, gate=gate), name="test", queue_depth=0)
+        assert pipeline.max_in_flight == 3
+
+        running = asyncio.gather(*(pipeline.run(batch) for batch in range(6)))
+        await asyncio.sleep(0.3)
+        tokenized = sum(1 for stage, _, phase in events if stage == "tokenize" and phase == "end")
+        gate.set()
+
+        assert tokenized == 3  # One batch in each stage
+        assert await running == list(range(6))
+
+    @pytest.mark.asyncio
+    async def test_batcher_keeps_accumulating_while_model_is_busy(self):
+        """Only what the forward stage can take is collected; later arrivals join one bigger batch"""
+        events = []
+        gate = threading.Event()
+        pipeline = InferencePipeline([
+            PipelineStage("tokenize", recording_stage("tokenize", events, delay=0), ThreadPoolExecutor(max_workers=1)),
+            PipelineStage("forward", recording_stage("forward", events, delay=0, gate=gate), ThreadPoolExecutor(max_workers=1)),
+            PipelineStage("postprocess", recording_stage("postprocess", events, delay=0), ThreadPoolExecutor(max_workers=1)),
+        ], name="test", queue_depth=1)
+        batcher = MicroBatcher(lambda items: items, max_batch_size=64, max_wait_ms=0, name="test", pipeline=pipeline)
+        assert batcher.max_concurrency == pipeline.model_capacity == 2
+
+        calls = []
+        for item in range(10):
+            calls.append(asyncio.ensure_future(batcher.submit(item)))
+            await asyncio.sleep(0.02)
+        gate.set()
+
+        assert await asyncio.gather(*calls) == list(range(10))
+        batches = [batch for stage, batch, phase in events if stage == "tokenize" and phase == "start"]
+        # One batch running, one queued in front of the model, the rest accumulated
+        assert batches == [[0], [1], list(range(2, 10))]
+
+    @pytest.mark.asyncio
+    async def test_stage_error_reaches_caller_and_frees_slots(self):
+        """A failing stage raises to its batch's caller without wedging the pipeline"""
+        def forward(batch):
+            if batch == "bad":
+                raise ValueError("boom")
+            return batch
+
+        pipeline = InferencePipeline(
+            [
+                PipelineStage("tokenize", lambda batch: batch, ThreadPoolExecutor(max_workers=1)),
+                PipelineStage("forward", forward, ThreadPoolExecutor(max_workers=1)),
+            ],
+            name="test", queue_depth=0
+        )
+
+        with pytest.raises(ValueError):
+            await pipeline.run("bad")
+        assert await asyncio.gather(*(pipeline.run(i) for i in range(5))) == list(range(5))
+
+    @pytest.mark.asyncio
+    async def test_analyzer_results_match_unpipelined(self, monkeypatch):
+        """Texts batched through the pipeline get the same results as a direct call"""
+        monkeypatch.setenv("RESULT_CACHE_ENABLED", "False")
+        monkeypatch.setenv("NEAR_DUP_ENABLED", "False")
+        analyzer = EmotionAnalyzer()
+        analyzer.cascade = None
+        analyzer.classifier = SequenceClassifier(build_emotion_model(), build_tokenizer(), name="pipeline-test")
+        texts = chat_messages(40)
+
+        pipelined = await analyzer.analyze_batch(texts)
+        direct = analyzer.classify_with(analyzer.classifier, texts)
+
+        assert analyzer.pipeline is not None
+        assert [result["emotion"] for result in pipelined] == [result["emotion"] for result in direct]
+        assert [result["intensity"] for result in pipelined] == pytest.approx([result["intensity"] for result in direct], abs=0.05)
@@ -0,0 +1,80 @@
+import pytest
+import asyncio
+import json
+import copy
+from fastapi.testclient import TestClient
+import src.main
+from benchmarks.stub_models import build_abuse_model, build_emotion_model, build_tokenizer, chat_messages
+from src.analyzer import AbuseDetector, EmotionAnalyzer, analyze_texts
+from src.inference import SequenceClassifier
+from src.profiling import ProfileCapture, ProfilingInProgress, profile_forward
+from src.rollout import LoadedModel
+
+@pytest.fixture
+def analyzers(monkeypatch):
+    """Both analyzers on small stub transformers"""
+    monkeypatch.setenv("RESULT_CACHE_ENABLED", "False")
+    monkeypatch.setenv("NEAR_DUP_ENABLED", "False")
+    emotion, abuse = EmotionAnalyzer(), AbuseDetector()
+    for analyzer, model, key in ((emotion, build_emotion_model(), "emotion"), (abuse, build_abuse_model(), "abuse")):
+        tokenizer = build_tokenizer()
+        classifier = SequenceClassifier(model, tokenizer, name=f"profile-{key}")
+        analyzer.install_model(LoadedModel("stub", model, tokenizer, "test", classifier, copy.deepcopy(tokenizer)))
+        analyzer.cascade = None
+    return emotion, abuse
+
+class TestProfileCapture:
+    @pytest.mark.asyncio
+    async def test_capture_ends_after_max_requests(self, analyzers):
+        """A capture stops once enough requests complete and holds both torch operators and Python stacks"""
+        capture = ProfileCapture(duration_seconds=30, max_requests=3, sample_interval_ms=1)
+        running = asyncio.ensure_future(capture.run())
+        await asyncio.sleep(0.05)
+
+        for i in range(3):
+            await analyze_texts(*analyzers, chat_messages(8, seed=i))
+        await asyncio.wait_for(running, 5)
+
+        summary = capture.summary()
+        assert summary["requests"] == 3 and summary["seconds"] < 30
+        assert capture.profiled_batches >= 1
+        assert any(op["name"].startswith("aten::") for op in summary["top_torch_ops"])
+        assert capture.samples
+
+        trace = json.loads(json.dumps(capture.chrome_trace()))
+        categories = {event.get("cat") for event in trace["traceEvents"]}
+        assert {"torch", "python"} <= categories
+
+        line = capture.folded().splitlines()[0]
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) >= 1 and ";" in stack
+
+    @pytest.mark.asyncio
+    async def test_one_capture_at_a_time(self):
+        """A second capture is refused while one runs; afterwards the hot path is unprofiled again"""
+        first = asyncio.ensure_future(ProfileCapture(duration_seconds=0.2).run())
+        await asyncio.sleep(0.01)
+        with pytest.raises(ProfilingInProgress):
+            await ProfileCapture(duration_seconds=0.2).run()
+        await first
+
+        assert profile_forward("model", lambda x: x * 2, 21) == 42
+
+class TestProfileAPI:
+    def test_profile_endpoint(self, monkeypatch):
+        """The admin endpoint returns a downloadable artifact and validates its options"""
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        client = TestClient(src.main.app)
+        headers = {"X-Admin-Token": "secret"}
+
+        response = client.post("/admin/profile", json={"duration_seconds": 0.1, "format": "folded"}, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert ".folded" in response.headers["content-disposition"]
+
+        response = client.post("/admin/profile", json={"duration_seconds": 0.1}, headers=headers)
+        assert "traceEvents" in response.json()
+
+        assert client.post("/admin/profile", json={"format": "pprof"}, headers=headers).status_code == 400
+        assert client.post("/admin/profile", json={"duration_seconds": 600}, headers=headers).status_code == 400
+        assert client.post("/admin/profile", json={}).status_code == 401
@@ -0,0 +1,180 @@
+import pytest
+import asyncio
+import threading
+import numpy as np
+from src import bundle
+from src.analyzer import EmotionAnalyzer, AbuseDetector
+from src.rollout import LoadedModel, RolloutSync, SwapInProgress
+
+class StubClassifier:
+    """Fixed label probabilities; optionally blocks until released"""
+    def __init__(self, scores, gate=None):
+        self.labels = list(scores)
+        self.scores = np.array(list(scores.values()), dtype=np.float32)
+        self.gate = gate
+
+    def predict(self, texts):
+        if self.gate is not None:
+            self.gate.wait(5)
+        return np.tile(self.scores, (len(texts), 1))
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    monkeypatch.setenv("WARMUP_ENABLED", "False")
+    monkeypatch.setenv("RESULT_CACHE_ENABLED", "False")
+    analyzer = EmotionAnalyzer()
+    analyzer.cascade = None
+    analyzer.model_version = "v1"
+    return analyzer
+
+def serve(analyzer, monkeypatch, candidates):
+    """Make build_model return stub models by name"""
+    built = []
+
+    def build_model(model_name):
+        built.append(model_name)
+        if model_name not in candidates:
+            raise OSError(f"{model_name} not found")
+        return LoadedModel(model_name, None, None, "v2", candidates[model_name])
+
+    monkeypatch.setattr(analyzer, "build_model", build_model)
+    return built
+
+class TestHotSwap:
+    @pytest.mark.asyncio
+    async def test_swap_drains_in_flight_batches(self, analyzer, monkeypatch):
+        """Running batches finish on the old model; later requests use the new one"""
+        gate = threading.Event()
+        analyzer.classifier = StubClassifier({"joy": 0.9, "anger": 0.1}, gate=gate)
+        serve(analyzer, monkeypatch, {"new-model": StubClassifier({"joy": 0.1, "anger": 0.9})})
+        old_namespace = analyzer.cache_namespace
+
+        in_flight = asyncio.ensure_future(analyzer.analyze("first message"))
+        await asyncio.sleep(0.05)
+        swap = asyncio.ensure_future(analyzer.rollout.swap("new-model"))
+        await asyncio.sleep(0.05)
+        assert not swap.done()  # Waiting for the running batch
+
+        gate.set()
+        report = await swap
+        assert (await in_flight)["emotion"] == "joy"
+        assert (await analyzer.analyze("second message"))["emotion"] == "anger"
+        assert report["current"] == {"model_name": "new-model", "version": "v2"}
+        assert report["undrained_batches"] == 0
+        assert analyzer.cache_namespace != old_namespace
+
+    @pytest.mark.asyncio
+    async def test_swap_releases_preloaded_model(self, analyzer, monkeypatch):
+        """The swapped-out model isn't kept alive by the preload registry"""
+        analyzer.classifier = StubClassifier({"joy": 0.9, "anger": 0.1})
+        serve(analyzer, monkeypatch, {"new-model": StubClassifier({"joy": 0.1, "anger": 0.9})})
+        monkeypatch.setattr(bundle, "_preloaded", {("emotion", analyzer.model_name): (object(), object(), "v1")})
+
+        await analyzer.rollout.swap("new-model")
+        assert bundle._preloaded == {}
+
+    @pytest.mark.asyncio
+    async def test_failed_or_concurrent_swap_keeps_serving(self, analyzer, monkeypatch):
+        """A model that fails to load leaves the current one in place; one load runs at a time"""
+        analyzer.classifier = StubClassifier({"joy": 0.9, "anger": 0.1})
+        serve(analyzer, monkeypatch, {})
+
+        with pytest.raises(OSError):
+            await analyzer.rollout.swap("missing-model")
+        assert (await analyzer.analyze("still here"))["emotion"] == "joy"
+
+        first = asyncio.ensure_future(analyzer.rollout.swap("missing-model"))
+        await asyncio.sleep(0)
+        with pytest.raises(SwapInProgress):
+            await analyzer.rollout.swap("missing-model")
+        with pytest.raises(OSError):
+            await first
+
+class TestShadow:
+    @pytest.mark.asyncio
+    async def test_shadow_records_agreement_off_the_request_path(self, monkeypatch):
+        """Sampled texts are re-scored by the candidate and compared; promotion reuses it"""
+        monkeypatch.setenv("WARMUP_ENABLED", "False")
+        monkeypatch.setenv("RESULT_CACHE_ENABLED", "False")
+        detector = AbuseDetector()
+        detector.cascade = None
+        detector.classifier = StubClassifier({"toxic": 0.9})
+        built = serve(detector, monkeypatch, {"candidate": StubClassifier({"toxic": 0.1})})
+
+        await detector.rollout.start_shadow("candidate", sample_rate=1.0)
+        results = await detector.analyze_batch(["you are awful and stupid", "have a lovely day"])
+        assert all(result["toxicity_score"] == pytest.approx(0.9) for result in results)
+
+        await asyncio.gather(*detector.rollout._tasks)
+        stats = detector.rollout.stats()["shadow"]
+        assert stats["compared"] == 2
+        assert stats["agreement_rate"] == 0.0
+        assert stats["mean_score_diff"] == pytest.approx(0.8)
+        assert stats["disagreements"] == {"True->False": 2}
+
+        await detector.rollout.swap("candidate")
+        assert built == ["candidate"]
+        assert detector.rollout.shadow is None
+        assert (await detector.analyze("you are awful and stupid"))["toxicity_score"] == pytest.approx(0.1)
+
+    @pytest.mark.asyncio
+    async def test_shadow_drops_samples_when_backlogged(self, analyzer, monkeypatch):
+        """Past SHADOW_MAX_PENDING samples are dropped instead of queued"""
+        gate = threading.Event()
+        analyzer.classifier = StubClassifier({"joy": 0.9, "anger": 0.1})
+        serve(analyzer, monkeypatch, {"candidate": StubClassifier({"joy": 0.9, "anger": 0.1}, gate=gate)})
+        analyzer.rollout.max_pending = 2
+
+        await analyzer.rollout.start_shadow("candidate", sample_rate=1.0)
+        await analyzer.analyze_batch(["one message", "two messages"])
+        await analyzer.analyze_batch(["three messages"])
+        gate.set()
+        await asyncio.gather(*analyzer.rollout._tasks)
+
+        stats = analyzer.rollout.stop_shadow()
+        assert stats["compared"] == 2 and stats["agreement_rate"] == 1.0
+        assert stats["dropped"] == 1
+
+class TestRolloutSync:
+    @pytest.mark.asyncio
+    async def test_workers_follow_swaps_and_shadow_runs(self, monkeypatch, tmp_path):
+        """A swap or shadow change made through one worker is applied by the others"""
+        monkeypatch.setenv("WARMUP_ENABLED", "False")
+        monkeypatch.setenv("RESULT_CACHE_ENABLED", "False")
+        workers = []
+        for _ in range(2):
+            worker = EmotionAnalyzer()
+            worker.cascade = None
+            worker.classifier = StubClassifier({"joy": 0.9, "anger": 0.1})
+            serve(worker, monkeypatch, {
+                "new-model": StubClassifier({"joy": 0.1, "anger": 0.9}),
+                "candidate": StubClassifier({"joy": 0.5, "anger": 0.5})
+            })
+            RolloutSync(str(tmp_path / "rollout.json"), poll_seconds=0.01).start({"emotion": worker.rollout})
+            workers.append(worker)
+        first, second = workers
+
+        await first.rollout.swap("new-model")
+        await asyncio.sleep(0.1)
+        assert (await second.analyze("after the swap"))["emotion"] == "anger"
+        assert second.rollout.swaps == 1
+
+        await first.rollout.start_shadow("candidate", sample_rate=0.5)
+        await asyncio.sleep(0.1)
+        assert second.rollout.shadow.loaded.model_name == "candidate"
+        assert second.rollout.shadow.sample_rate == 0.5
+
+        first.rollout.stop_shadow()
+        await asyncio.sleep(0.1)
+        assert second.rollout.shadow is None
+
+    @pytest.mark.asyncio
+    async def test_failed_load_is_not_retried_until_state_changes(self, analyzer, monkeypatch):
+        """A model this worker cannot load is attempted once per published state"""
+        analyzer.classifier = StubClassifier({"joy": 0.9, "anger": 0.1})
+        built = serve(analyzer, monkeypatch, {})
+
+        for _ in range(3):
+            await analyzer.rollout.reconcile({"model_name": "missing-model"})
+        assert built == ["missing-model"]
+        assert (await analyzer.analyze("still here"))["emotion"] == "joy"
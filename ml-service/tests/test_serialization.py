@@ -0,0 +1,56 @@
+import pytest
+import json
+from datetime import datetime
+from src.models import BatchAnalysisResponse
+from src.serialization import COLUMNAR_JSON, COLUMNAR_MSGPACK, JSON, MSGPACK, columnar, encode, negotiate
+
+RESULT = {
+    "abuse_detected": False,
+    "abuse_type": "none",
+    "confidence_score": 12.5,
+    "emotion": "joy",
+    "emotion_intensity": 80.0,
+    "secondary_emotions": [{"emotion": "neutral", "intensity": 20.0}]
+}
+
+class TestSerialization:
+    @pytest.mark.parametrize("accept,expected", [
+        (None, JSON),
+        ("*/*", JSON),
+        ("text/html", JSON),
+        ("application/vnd.safechat.columnar+json", COLUMNAR_JSON),
+        ("application/json;q=0.5, application/vnd.safechat.columnar+json", COLUMNAR_JSON),
+        ("application/vnd.safechat.columnar+json;q=0.2, */*;q=0.9", JSON),
+    ])
+    def test_negotiation(self, accept, expected):
+        """The highest-quality supported type wins; anything else gets the JSON default"""
+        assert negotiate(accept) == expected
+
+    def test_default_json_matches_response_model(self):
+        """The fast JSON path produces exactly what the pydantic model would"""
+        document = {
+            "results": [RESULT, {**RESULT, "error": "boom", "secondary_emotions": []}],
+            "total_processed": 2,
+            "processing_time_ms": 1.5,
+            "timestamp": datetime(2024, 5, 1, 12, 30, 15, 250000)
+        }
+        assert encode(document, JSON) == BatchAnalysisResponse(**document).model_dump_json().encode()
+
+    def test_columnar_layout(self):
+        """One array per field, nested objects split per sub-field, optional fields padded with None"""
+        layout = columnar([RESULT, {**RESULT, "emotion": "anger", "error": "boom", "secondary_emotions": []}])
+
+        assert layout["count"] == 2
+        assert layout["columns"]["emotion"] == ["joy", "anger"]
+        assert layout["columns"]["secondary_emotions"] == {"emotion": [["neutral"], []], "intensity": [[20.0], []]}
+        assert layout["columns"]["error"] == [None, "boom"]
+        assert json.loads(encode({"results": [RESULT]}, COLUMNAR_JSON))["results"]["columns"]["abuse_type"] == ["none"]
+
+    def test_msgpack_round_trip(self):
+        """MessagePack carries the same document, timestamps as ISO strings"""
+        msgpack = pytest.importorskip("msgpack")
+        document = {"results": [RESULT], "total_processed": 1, "timestamp": datetime(2024, 5, 1)}
+
+        assert negotiate("application/x-msgpack") == MSGPACK
+        assert msgpack.unpackb(encode(document, MSGPACK)) == {**document, "timestamp": "2024-05-01T00:00:00"}
+        assert msgpack.unpackb(encode(document, COLUMNAR_MSGPACK))["results"]["columns"]["emotion"] == ["joy"]
@@ -0,0 +1,106 @@
+import pytest
+import numpy as np
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import PreTrainedTokenizerFast
+from src.analyzer import EmotionAnalyzer, AbuseDetector, analyze_message, analyze_texts
+from src.windows import WindowSettings, split_windows
+
+class KeywordClassifier:
+    """Scores a text as toxic (and angry) when it contains 'idiot'"""
+    def __init__(self, labels):
+        self.labels = labels
+
+    def predict(self, texts):
+        toxic = np.array([[0.95] if "idiot" in text else [0.05] for text in texts], dtype=np.float32)
+        if self.labels == ["toxic"]:
+            return toxic
+        return np.hstack([toxic, 1 - toxic])
+
+@pytest.fixture
+def keyword_models(monkeypatch):
+    monkeypatch.setenv("RESULT_CACHE_ENABLED", "False")
+    emotion = EmotionAnalyzer()
+    emotion.classifier = KeywordClassifier(["anger", "joy"])
+    abuse = AbuseDetector()
+    abuse.classifier = KeywordClassifier(["toxic"])
+    return emotion, abuse
+
+def byte_level_tokenizer():
+    """One token per UTF-8 byte, like an unmerged byte-level BPE"""
+    vocab = {char: i for i, char in enumerate(pre_tokenizers.ByteLevel.alphabet())}
+    tokenizer = Tokenizer(models.BPE(vocab, []))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer)
+
+class TestSlidingWindows:
+    def test_short_text_is_one_window(self):
+        """Texts that fit are not split"""
+        windows = split_windows("hello there", settings=WindowSettings(8, 2, 4))
+        assert [tuple(w) for w in windows] == [("hello there", 0, 11)]
+
+    def test_windows_overlap_and_cover_text(self):
+        """Windows overlap by the configured tokens and end at the last token"""
+        text = " ".join(f"w{i}" for i in range(20))
+        windows = split_windows(text, settings=WindowSettings(8, 2, 10))
+
+        assert [w.text.split()[0] for w in windows] == ["w0", "w6", "w12"]
+        assert windows[-1].text.split()[-1] == "w19"
+        assert all(text[w.start:w.end] == w.text for w in windows)
+
+    def test_window_count_is_capped(self):
+        """Very long texts get at most max_windows windows, spread over the whole text"""
+        text = " ".join(f"w{i}" for i in range(1000))
+        windows = split_windows(text, settings=WindowSettings(8, 2, 4))
+
+        assert len(windows) == 4
+        assert windows[0].text.startswith("w0 ")
+        assert windows[-1].text.endswith("w999")
+
+    @pytest.mark.asyncio
+    async def test_long_text_scored_by_most_toxic_window(self, keyword_models, monkeypatch):
+        """A long text is flagged by the window containing the abuse, and says which one"""
+        monkeypatch.setenv("LONG_TEXT_WINDOW_TOKENS", "10")
+        monkeypatch.setenv("LONG_TEXT_WINDOW_OVERLAP", "2")
+        emotion, abuse = keyword_models
+        words = ["fine"] * 40
+        words[25] = "idiot"
+        long_text = " ".join(words)
+
+        short, long_result = await analyze_texts(emotion, abuse, ["all fine", long_text])
+
+        assert short["abuse_detected"] is False and "window" not in short
+        assert long_result["abuse_detected"] is True
+        window = long_result["window"]
+        assert window["count"] == 5
+        assert "idiot" in long_text[window["start"]:window["end"]]
+        # Mean emotion over windows: one angry window out of five
+        assert long_result["emotion"] == "joy"
+
+    @pytest.mark.asyncio
+    async def test_mean_toxicity_aggregation(self, keyword_models, monkeypatch):
+        """With mean aggregation one toxic window among many is not enough"""
+        monkeypatch.setenv("LONG_TEXT_WINDOW_TOKENS", "10")
+        monkeypatch.setenv("LONG_TEXT_WINDOW_OVERLAP", "2")
+        monkeypatch.setenv("ABUSE_WINDOW_AGGREGATION", "mean")
+        emotion, abuse = keyword_models
+        words = ["fine"] * 40
+        words[25] = "idiot"
+
+        result = (await analyze_texts(emotion, abuse, [" ".join(words)]))[0]
+
+        assert result["abuse_detected"] is False
+        # The toxic word falls in two of the five overlapping windows
+        assert result["confidence_score"] == pytest.approx(41.0)
+
+    @pytest.mark.asyncio
+    async def test_message_windowed_by_tokens_not_characters(self, keyword_models, monkeypatch):
+        """A message with fewer characters than the window but more tokens is still split"""
+        monkeypatch.setenv("LONG_TEXT_WINDOW_TOKENS", "10")
+        monkeypatch.setenv("LONG_TEXT_WINDOW_OVERLAP", "2")
+        emotion, abuse = keyword_models
+        abuse.window_tokenizer = byte_level_tokenizer()
+        text = "\U0001F600" * 8  # 8 characters, 32 byte-level tokens
+
+        result = await analyze_message(emotion, abuse, text)
+
+        assert result["window"]["count"] == 4